@@ -7,6 +7,7 @@ import logging
 import asyncio
 import aiohttp
 import re
+from urllib.parse import parse_qs, urlparse
 from datetime import datetime, timedelta
 from django.utils import timezone
 from typing import cast
@@ -25,11 +26,14 @@ if not os.environ.get("DJANGO_SETTINGS_MODULE"):
 # Импорты моделей Django и других зависимостей
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Sum
 from rest_framework.authtoken.models import Token
 from asgiref.sync import sync_to_async
 
 from core.models import User, Order, Report
-from reports.analytics import generate_sales_report
+from reports.analytics import report_period
+from reports.report_cache import get_sales_report, report_cache_stats
+from reports.columnar import sales_summary
 
 # Проверка путей
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -57,6 +61,19 @@ TELEGRAM_ADMIN_ID = settings.TELEGRAM_ADMIN_ID
 # URL API Django-сервера
 API_URL = settings.API_URL
 
+# Сколько заказов показывать админу за раз (остальные — по кнопке «Показать еще»)
+ADMIN_ORDERS_PAGE_SIZE = 10
+
+# Заказы, которые админ еще может двигать по статусам
+ACTIVE_ORDER_STATUSES = ("pending", "processing", "delivering")
+
+# Массовые действия: из какого статуса в какой переводятся все такие заказы
+BULK_STATUS_ACTIONS = {
+    "confirm": ("pending", "processing"),
+    "dispatch": ("processing", "delivering"),
+}
+BULK_STATUS_BATCH = 500  # Не больше заказов за один вызов /orders/bulk-status/
+
 # 🔹 Клавиатуры
 customer_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="📦 Мои заказы", callback_data="orders")],
@@ -68,6 +85,8 @@ staff_keyboard = InlineKeyboardMarkup(inline_keyboard=[
 
 admin_static_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="📦 Мои заказы", callback_data="admin_orders")],
+    [InlineKeyboardButton(text="✅ Подтвердить все новые", callback_data="admin_bulk:confirm")],
+    [InlineKeyboardButton(text="🚚 Все заказы в работе — в доставку", callback_data="admin_bulk:dispatch")],
     [InlineKeyboardButton(text="📊 Аналитика", callback_data="analytics")]
 ])
 
@@ -114,10 +133,23 @@ async def start(message: types.Message):
         dp.message.register(get_user_name, F.text)
 
 
+async def fetch_all_orders(session, url, headers):
+    """Собирает заказы со всех страниц API, переходя по ссылкам `next`; (статус ответа, заказы)"""
+    orders = []
+    while url:
+        async with session.get(url, headers=headers) as response:
+            if response.status != 200:
+                return response.status, orders
+            page = await response.json()
+        orders.extend(page["results"])
+        url = page["next"]
+    return 200, orders
+
+
 # 🔹 Обработчик выбора заказа для админа
-@dp.callback_query(lambda c: c.data == "admin_orders")
+@dp.callback_query(lambda c: c.data == "admin_orders" or c.data.startswith("admin_orders:"))
 async def show_admin_orders(callback_query: types.CallbackQuery):
-    """Выводит список заказов с кнопками управления"""
+    """Выводит страницу заказов с кнопками управления; курсор следующей страницы — в callback_data"""
     telegram_id = callback_query.from_user.id
     user = await sync_to_async(User.objects.filter(telegram_id=telegram_id).first)()
     if not user:
@@ -127,10 +159,18 @@ async def show_admin_orders(callback_query: types.CallbackQuery):
     token = cast(Token, await sync_to_async(Token.objects.filter(user=user).first)())
     headers = {"Authorization": f"Token {token.key}"}  # Используем токен пользователя
 
+    _, _, cursor = callback_query.data.partition(":")
+    # Фильтр по статусу выполняет API (индекс status + order_date), а не бот
+    params = ([("page_size", ADMIN_ORDERS_PAGE_SIZE), ("fields", "id,status")]
+              + [("status", status) for status in ACTIVE_ORDER_STATUSES])
+    if cursor:
+        params.append(("cursor", cursor))
+
     async with aiohttp.ClientSession() as session:
-        async with session.get(f"{API_URL}/orders/", headers=headers) as response:
+        async with session.get(f"{API_URL}/orders/", params=params, headers=headers) as response:
             if response.status == 200:
-                orders = await response.json()
+                page = await response.json()
+                orders = page["results"]
                 if not orders:
                     await callback_query.message.answer("📭 Нет активных заказов.")
                     return
@@ -141,10 +181,53 @@ async def show_admin_orders(callback_query: types.CallbackQuery):
                     keyboard = create_admin_keyboard(order["id"])
                     await callback_query.message.answer(text, reply_markup=keyboard)
 
+                if page["next"]:
+                    next_cursor = parse_qs(urlparse(page["next"]).query)["cursor"][0]
+                    more_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                        [InlineKeyboardButton(text="⬇️ Показать еще", callback_data=f"admin_orders:{next_cursor}")]
+                    ])
+                    await callback_query.message.answer("Есть более ранние заказы.", reply_markup=more_keyboard)
+
             else:
                 await callback_query.answer("❌ Ошибка получения заказов!", show_alert=True)
 
 
+# 🔹 Массовая смена статуса (все новые — в работу, все в работе — в доставку)
+@dp.callback_query(lambda c: c.data.startswith("admin_bulk:"))
+async def bulk_change_status(call: types.CallbackQuery):
+    """Переводит все заказы из одного статуса в другой вызовами /orders/bulk-status/"""
+    user = await sync_to_async(User.objects.filter(telegram_id=call.from_user.id).first)()
+    _, _, action = call.data.partition(":")
+    if not user or not user.is_staff or action not in BULK_STATUS_ACTIONS:
+        await call.answer("🚫 Действие недоступно.", show_alert=True)
+        return
+
+    token = cast(Token, await sync_to_async(Token.objects.filter(user=user).first)())
+    headers = {"Authorization": f"Token {token.key}"}
+    old_status, new_status = BULK_STATUS_ACTIONS[action]
+
+    updated = 0
+    async with aiohttp.ClientSession() as session:
+        status_code, orders = await fetch_all_orders(
+            session, f"{API_URL}/orders/?status={old_status}&fields=id&page_size=200", headers
+        )
+        if status_code != 200:
+            await call.answer("❌ Ошибка получения заказов!", show_alert=True)
+            return
+
+        ids = [order["id"] for order in orders]
+        for start in range(0, len(ids), BULK_STATUS_BATCH):
+            payload = {"ids": ids[start:start + BULK_STATUS_BATCH], "status": new_status}
+            async with session.post(f"{API_URL}/orders/bulk-status/", json=payload, headers=headers) as response:
+                logging.info(f"📡 bulk-status {old_status} → {new_status}: {response.status}")
+                if response.status != 200:
+                    await call.answer("❌ Ошибка обновления заказов.", show_alert=True)
+                    break
+                updated += (await response.json())["updated"]
+
+    await call.message.answer(f"✅ Переведено в статус {new_status}: {updated} из {len(ids)}")
+
+
 # 🔹 Обработчик inline-кнопок (админка)
 @dp.callback_query()
 async def handle_callback(call: types.CallbackQuery):
@@ -211,6 +294,8 @@ async def handle_callback(call: types.CallbackQuery):
                 new_text = f"✅ Заказ {order_id} теперь в статусе: {new_status}"
                 if call.message:
                     await call.message.edit_text(new_text, reply_markup=create_admin_keyboard(order_id))
+            elif response.status == 409:  # Переход недопустим (например, выполненный заказ обратно в работу)
+                await call.answer(f"⚠️ Заказ {order_id} нельзя перевести в статус {new_status}.", show_alert=True)
             else:
                 await call.answer("❌ Ошибка обновления заказа.", show_alert=True)
 
@@ -239,12 +324,14 @@ async def show_user_orders(call: types.CallbackQuery):
     headers = {"Authorization": f"Token {token.key}"}
     async with aiohttp.ClientSession() as session:
         logging.debug(f"🔍 Отправляемый токен: {headers}")
-        async with session.get(f"{API_URL}/orders/?telegram_id={telegram_id}", headers=headers) as response:
-            orders_data = await response.json()
+        fields = "id,delivery_address,total_price,order_date,status"
+        status_code, orders_data = await fetch_all_orders(
+            session, f"{API_URL}/orders/?telegram_id={telegram_id}&fields={fields}", headers
+        )
 
-            if response.status != 200 or not orders_data:
-                await call.answer("📭 У вас пока нет заказов.", show_alert=True)
-                return
+        if status_code != 200 or not orders_data:
+            await call.answer("📭 У вас пока нет заказов.", show_alert=True)
+            return
 
     orders_text = "📦 *Ваши заказы:*\n\n"
     for order in orders_data:
@@ -305,12 +392,16 @@ async def register_user(message: types.Message):
 async def notify_admin(order_id):
     """Отправляет администратору уведомление о новом заказе"""
     try:
-        order = await sync_to_async(Order.objects.get)(id=order_id)
+        # ✅ Пользователь и число букетов (сумма количеств позиций) — одним запросом
+        order = await sync_to_async(
+            Order.objects.select_related("user").annotate(bouquets=Sum("items__quantity")).get
+        )(id=order_id)
         message = (
             f"🛒 *Новый заказ!*\n"
             f"📌 *ID*: {order.id}\n"
             f"👤 *Пользователь*: {order.user.username}\n"
-            f"📦 *Товары*: {order.products.all().count()} шт.\n"
+            f"📦 *Букетов*: {order.bouquets or 0} шт.\n"
+            f"💰 *Сумма*: {order.total_price} руб.\n"
             f"📍 *Дата заказа*: {order.order_date.strftime('%d.%m.%Y %H:%M')}\n"
             f"📌 *Статус*: {order.get_status_display()}"
         )
@@ -325,26 +416,17 @@ async def send_analytics(call: types.CallbackQuery):
     """Отправляет администраторам детальную аналитику"""
     # Если нужно сделать отчет за "старую" дату, то смещаем текущую дату например на 20 дней в прошлое "timedelta(days=20)"
     today = datetime.now().date() - timedelta(days=1)
-    yesterday = today - timedelta(days=30)
+    yesterday, today = report_period(today)
 
     # Очистка старых отчётов (старше 180 дней)
     await sync_to_async(Report.objects.filter(date__lt=timezone.now() - timedelta(days=180)).delete)()
     logging.info("🧹 Удалены отчёты старше 180 дней.")
 
-    # Проверяем, есть ли отчёт за today (смещённую дату)
-    report = await sync_to_async(Report.objects.filter(date=today).first)()
-
-    # Если отчёта за today нет, генерируем новый
-    if not report:
-        logging.info("🔄 Генерация нового отчёта...")
-        print("Сегодня (смещённая дата):", today)
-        print("Вчера (смещённая дата):", yesterday)
-        report = await sync_to_async(generate_sales_report)(yesterday, today, report_date=today)
-
-        # Проверяем, что отчет был создан
-        if not report:
-            await call.answer("❌ Не удалось сформировать отчет. Попробуйте позже.", show_alert=True)
-            return
+    # Берем отчёт за today (смещённую дату) из кэша; если данные за период менялись — он пересчитается
+    print("Сегодня (смещённая дата):", today)
+    print("Вчера (смещённая дата):", yesterday)
+    report = await sync_to_async(get_sales_report)(yesterday, today, report_date=today)
+    logging.info(f"📊 Кэш отчётов: {report_cache_stats()}")
 
     # Проверяем, что report не None
     if not report:
@@ -388,6 +470,16 @@ async def send_analytics(call: types.CallbackQuery):
         f"```"
     )
 
+    # Сравнение с предыдущими 30 днями и лучшие покупатели (колоночная аналитика на NumPy)
+    summary = await sync_to_async(sales_summary)(yesterday, today, top_customers=3)
+    delta = summary["revenue_delta_percent"]
+    delta_text = f"{delta:+.1f}%" if delta is not None else "нет данных"
+    orders_delta = f"{summary['orders_delta']:+d}"
+    message += f"\n*К предыдущему периоду:* {escape_md(delta_text)} по выручке, {escape_md(orders_delta)} заказов\n"
+    for customer in summary["top_customers"]:
+        revenue = f"{customer['revenue']:.2f}"
+        message += f"👤 {escape_md(customer['username'])}: {escape_md(revenue)}\n"
+
     await call.message.answer(message, parse_mode="MarkdownV2")
 
 
@@ -427,25 +519,24 @@ async def get_orders(message: types.Message):
     headers = {"Authorization": f"Token {token.key}"}
     async with aiohttp.ClientSession() as session:
         logging.debug(f"🔍 Токен, переданный в API: {settings.TELEGRAM_API_TOKEN}")
-        async with session.get(f"{API_URL}/orders/?telegram_id={telegram_id}", headers=headers) as response:
-            response_text = await response.text()
-            logging.debug(f"📡 API ответил: {response_text}")
+        status_code, orders = await fetch_all_orders(
+            session, f"{API_URL}/orders/?telegram_id={telegram_id}&fields=id,status", headers
+        )
+        logging.debug(f"📡 API ответил: {status_code}, заказов: {len(orders)}")
 
-            if response.status == 200:
-                orders = await response.json()
-                if not orders:
-                    await message.answer("📭 У вас пока нет заказов.")
-                    return
+        if status_code == 200:
+            if not orders:
+                await message.answer("📭 У вас пока нет заказов.")
+                return
 
-                text = "📋 **Список ваших заказов:**\n\n"
-                for order in orders:
-                    text += f"🆔 {order['id']} | Статус: {order['status']}\n"
+            text = "📋 **Список ваших заказов:**\n\n"
+            for order in orders:
+                text += f"🆔 {order['id']} | Статус: {order['status']}\n"
 
-                for chunk in [text[i:i + 4000] for i in range(0, len(text), 4000)]:
-                    await message.answer(chunk, parse_mode="HTML")
-            else:
-                await message.answer(f"❌ Ошибка получения заказов. Код: {response.status}")
-                logging.error(response_text)
+            for chunk in [text[i:i + 4000] for i in range(0, len(text), 4000)]:
+                await message.answer(chunk, parse_mode="HTML")
+        else:
+            await message.answer(f"❌ Ошибка получения заказов. Код: {status_code}")
 
 
 # 🔹 Обработчик команды /order <id>
@@ -1,8 +1,11 @@
+from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.contrib import messages
 from django.urls import path
 from django.shortcuts import redirect
-from .models import Report, Product, Order, User
+from .models import Report, Product, Order, OrderItem, OrderStatusChange, User, DailySales
+from .order_status import StatusConflict, bulk_update_status, predecessors, transition_status
 from django.contrib.admin.sites import site
 
 admin.site.register(Product)
@@ -19,15 +22,110 @@ class CustomUserAdmin(UserAdmin):
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    fields = ("product", "quantity", "unit_price")  # ✅ Пустая цена — берется текущая цена товара
+
+
+class OrderStatusChangeInline(admin.TabularInline):
+    """История статусов только для чтения: строки добавляет order_status.py"""
+    model = OrderStatusChange
+    extra = 0
+    fields = ("changed_at", "old_status", "new_status", "changed_by")
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class OrderAdminForm(forms.ModelForm):
+    """Недопустимый переход статуса — ошибка формы, а не сообщение «изменено успешно»"""
+
+    def clean_status(self):
+        status = self.cleaned_data["status"]
+        old_status = self.initial.get("status")
+        if self.instance.pk and status != old_status and old_status not in predecessors(status):
+            raise forms.ValidationError(f"Переход из статуса «{old_status}» в «{status}» недопустим")
+        return status
+
+
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm  # ✅ Переход статуса проверяется и в форме заказа, и в списке (list_editable)
     list_display = ('id', 'get_username', 'get_telegram_id', 'status', 'order_date', 'total_price_display', 'delivery_address')
     list_filter = ('status', "order_date")
+    list_select_related = ("user",)  # ✅ Пользователь загружается тем же запросом, что и заказы
     search_fields = ('user__username', 'user__telegram_id', 'id')
     ordering = ("-order_date",)
     list_editable = ("status", "delivery_address")  # ✅ Разрешаем менять статус и адрес прямо в списке
     # ✅ Исключаем `order_date` из полей редактирования
     readonly_fields = ("order_date", "total_price_display")   # ✅ Эти поля редактировать нельзя
-    fields = ("user", "products", "status", "delivery_address", "total_price_display")  # ✅ Доступные поля при редактировании
+    fields = ("user", "status", "delivery_address", "total_price_display")  # ✅ Доступные поля при редактировании
+    inlines = (OrderItemInline, OrderStatusChangeInline)  # ✅ Состав заказа и история статусов
+    actions = ("confirm_orders", "dispatch_orders", "complete_orders")  # ✅ Массовая смена статуса
+
+    def change_status(self, request, queryset, new_status):
+        """Переводит выбранные заказы в `new_status` одной транзакцией (как /api/orders/bulk-status/)"""
+        changes = [(order_id, new_status) for order_id in queryset.values_list("id", flat=True)]
+        try:
+            results = bulk_update_status(request.user, changes)
+        except StatusConflict as error:
+            self.message_user(request, str(error), messages.ERROR)
+            return
+        updated = sum(result["result"] == "updated" for result in results)
+        skipped = [str(result["id"]) for result in results if result["result"] not in ("updated", "unchanged")]
+        self.message_user(request, f"Обновлено заказов: {updated}")
+        if skipped:
+            self.message_user(request, f"Переход недопустим для заказов: {', '.join(skipped)}", messages.WARNING)
+
+    @admin.action(description="Подтвердить выбранные заказы (в работу)")
+    def confirm_orders(self, request, queryset):
+        self.change_status(request, queryset, "processing")
+
+    @admin.action(description="Передать выбранные заказы в доставку")
+    def dispatch_orders(self, request, queryset):
+        self.change_status(request, queryset, "delivering")
+
+    @admin.action(description="Отметить выбранные заказы выполненными")
+    def complete_orders(self, request, queryset):
+        self.change_status(request, queryset, "completed")
+
+    def save_related(self, request, form, formsets, change):
+        """После сохранения позиций пересчитываем сохраненную сумму заказа"""
+        super().save_related(request, form, formsets, change)
+        order = form.instance
+        if order.items.exists():
+            order.recalculate_price()
+            order.save(update_fields=["price", "updated_at"])
+
+    def save_model(self, request, obj, form, change):
+        if obj.price is None:  # Новый заказ из админки: сумма посчитается по позициям в save_related
+            obj.price = 0
+        if not (change and "status" in form.changed_data):
+            super().save_model(request, obj, form, change)
+            return
+
+        # ✅ Статус меняется только переходом автомата (условный UPDATE + история), остальные поля — отдельно
+        try:
+            result = transition_status(request.user, obj.pk, obj.status)
+        except StatusConflict as error:
+            result = {"result": str(error), "status": Order.objects.values_list("status", flat=True).get(pk=obj.pk)}
+        if result["result"] != "updated":  # Статус успели изменить параллельно после проверки формы
+            self.message_user(request, f"Заказ {obj.pk}: статус «{obj.status}» не применен ({result['result']})",
+                              messages.ERROR)
+            obj._status_rejected = True
+        obj.status = result["status"]
+        obj._rollup_state = (obj.order_date, obj.status, obj.price)  # Сводку уже перенес transition_status
+        fields = [name for name in form.changed_data if name != "status"]
+        if fields:
+            obj.save(update_fields=fields + ["updated_at"])
+
+    def response_change(self, request, obj):
+        """Если статус не применен, возвращаемся к заказу без сообщения об успешном изменении"""
+        if getattr(obj, "_status_rejected", False):
+            return redirect(request.path)
+        return super().response_change(request, obj)
 
     # ✅ Отображение суммы заказа
     @admin.display(description="Общая стоимость")  # Название в админке
@@ -57,3 +155,12 @@ if site.is_registered(Report):
     admin.site.unregister(Report)
 admin.site.register(Report, ReportAdmin)
 
+
+
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ("date", "status", "orders", "revenue")
+    list_filter = ("status",)
+    ordering = ("-date", "status")
+    readonly_fields = ("date", "status", "orders", "revenue")  # ✅ Сводка ведется автоматически
+
+admin.site.register(DailySales, DailySalesAdmin)
@@ -4,72 +4,352 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status, serializers
 from django.views.decorators.csrf import csrf_exempt
+from . import fast_serializers
+from .conditional import conditional, products_state, table_state
+from .fast_serializers import ORDER_COLUMNS
 from .models import Order, Product, User
-from .serializers import OrderSerializer, ProductSerializer
+from .order_status import StatusConflict, bulk_update_status, parse_status_changes, transition_status
+from .pagination import OrderCursorPagination, ProductCursorPagination, decode_cursor, encode_cursor
+from .search import search_products
+from .serializers import OrderSerializer, OrderSideloadSerializer, ProductSerializer
+from .streaming import STREAM_FORMATS, stream_orders
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import AllowAny
+from datetime import date, timedelta
+from reports.analytics import parse_period, period_bounds, product_sales
+
+def order_queryset(user=None):
+    """
+    Заказы для сериализации OrderSerializer без N+1.
+
+    Товары и позиции подгружаются двумя запросами на весь список, пользователь — тем же
+    запросом, что и заказы; сумма заказа уже хранится в Order.price.
+    Если передан `user` без прав персонала — только его заказы.
+    """
+    orders = Order.objects.select_related("user").prefetch_related("products", "items")
+    if user is not None and not user.is_staff:
+        orders = orders.filter(user=user)
+    return orders
+
+
+def filter_orders(orders, params):
+    """
+    Фильтры списка заказов из параметров запроса.
+
+    `status` — можно несколько (?status=pending&status=processing), `start`/`end` — даты
+    заказа ГГГГ-ММ-ДД включительно, `user` — id покупателя, `telegram_id` — его Telegram ID.
+    Фильтры сужают уже доступные пользователю заказы. Бросает ValueError при неверных значениях.
+    Под каждый фильтр вместе с сортировкой по дате есть составной индекс (см. Order.Meta).
+    """
+    statuses = params.getlist("status")
+    unknown = set(statuses) - set(dict(Order.STATUS_CHOICES))
+    if unknown:
+        raise ValueError(f"Неверный статус: {', '.join(sorted(unknown))}")
+    if statuses:
+        orders = orders.filter(status__in=statuses)
+
+    start = date.fromisoformat(params["start"]) if params.get("start") else None
+    end = date.fromisoformat(params["end"]) if params.get("end") else None
+    if start and end and start > end:
+        raise ValueError("Начало периода позже его конца")
+    if start:
+        orders = orders.filter(order_date__gte=period_bounds(start, start)[0])
+    if end:
+        orders = orders.filter(order_date__lt=period_bounds(end, end)[1])
+
+    if params.get("user"):
+        orders = orders.filter(user_id=int(params["user"]))
+    if params.get("telegram_id"):
+        orders = orders.filter(user__telegram_id=int(params["telegram_id"]))
+    return orders
+
+
+SIDELOAD_INCLUDES = {"products"}
+
+def parse_list_param(params, name):
+    """Значения параметра, повторенного или перечисленного через запятую: ?fields=id,status&fields=user"""
+    return {part.strip() for value in params.getlist(name) for part in value.split(",") if part.strip()}
+
+
+def parse_include(params):
+    """Что передать отдельно от заказов: ?include=products. ValueError на неизвестное"""
+    include = parse_list_param(params, "include")
+    unknown = include - SIDELOAD_INCLUDES
+    if unknown:
+        raise ValueError(f"Неизвестное значение include: {', '.join(sorted(unknown))}")
+    return include
+
+
+def parse_fields(params, serializer_class):
+    """Поля ответа из ?fields=; None — все поля. ValueError на поле, которого нет в сериализаторе"""
+    fields = parse_list_param(params, "fields")
+    if not fields:
+        return None
+    unknown = fields - set(serializer_class().fields)
+    if unknown:
+        raise ValueError(f"Неизвестное поле: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def shape_orders(orders, fields=None, include=(), required=("id", "order_date")):
+    """
+    Подгоняет запрос заказов под ответ: только нужные столбцы (only) и подгрузки.
+
+    Товары подгружаются, только если запрошено поле products; с ?include=products их id
+    берутся из позиций. `required` — столбцы, нужные помимо полей (ключ пагинации).
+    """
+    if fields is None and "products" not in include:
+        return orders
+    wanted = set(OrderSerializer.Meta.fields) if fields is None else fields
+    prefetch = [name for name in ("products", "items") if name in wanted]
+    if "products" in include:
+        prefetch = ["items"]
+    orders = orders.select_related(None).prefetch_related(None).prefetch_related(*prefetch)
+    if fields is not None:
+        columns = {ORDER_COLUMNS[name] for name in fields if name in ORDER_COLUMNS}
+        orders = orders.only(*columns | set(required))
+    return orders
+
+
+def sideloaded_products(orders):
+    """Товары заказов один раз на весь список: {id: товар}"""
+    ids = {item.product_id for order in orders for item in order.items.all()}
+    products = ProductSerializer(Product.objects.filter(id__in=ids).order_by("id"), many=True).data
+    return {str(product["id"]): product for product in products}
+
+
+def paginated_orders(request, orders, endpoint=None):
+    """
+    Страница заказов по курсору (OrderCursorPagination) с фильтрами filter_orders в виде ответа API.
+
+    С ?include=products заказы ссылаются на товары по id, а товары приходят один раз
+    в поле "products" ответа, вместо копии товара в каждом заказе. ?fields= оставляет
+    в заказах только перечисленные поля и читает из БД только нужное для них.
+    Если для `endpoint` включена быстрая сериализация (FAST_SERIALIZER_ENDPOINTS) — она.
+    ?stream=json|ndjson — все заказы без страниц потоком (streaming.py), память не растет с их числом.
+    """
+    try:
+        orders = filter_orders(orders, request.query_params)
+        include = parse_include(request.query_params)
+        fields = parse_fields(request.query_params, OrderSerializer)
+    except ValueError as error:
+        return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    stream_format = request.query_params.get('stream')
+    if stream_format:
+        if stream_format not in STREAM_FORMATS:
+            return Response({'error': f"stream: {' или '.join(STREAM_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if include:
+            return Response({'error': 'include не поддерживается в потоковой выгрузке'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return stream_orders(orders, stream_format, fields)
+
+    paginator = OrderCursorPagination()
+    if fast_serializers.is_enabled(endpoint):
+        # Быстрый путь: строки values() вместо объектов и ModelSerializer, формат ответа тот же
+        rows = orders.select_related(None).prefetch_related(None).values(*fast_serializers.order_columns(fields))
+        page = paginator.paginate_queryset(rows, request)
+        data = fast_serializers.order_values(page, fields, product_ids="products" in include)
+        response = paginator.get_paginated_response(data)
+        if "products" in include:
+            response.data["products"] = fast_serializers.sideloaded_product_values([row["id"] for row in page])
+        return response
+
+    orders = shape_orders(orders, fields, include)
+    page = paginator.paginate_queryset(orders, request)
+    serializer_class = OrderSideloadSerializer if "products" in include else OrderSerializer
+    response = paginator.get_paginated_response(serializer_class(page, many=True, fields=fields).data)
+    if "products" in include:
+        response.data["products"] = sideloaded_products(page)
+    return response
+
+
+def products_etag_state(request):
+    """Состояние каталога для ETag списка товаров (страница и поиск — из запроса)"""
+    updated, rows = products_state()
+    return ("products", request.get_full_path(), updated, rows), None
+
+
+def orders_etag_state(request, user=None):
+    """
+    Состояние списка заказов для ETag: заказы, видимые пользователю с учетом фильтров, и каталог
+    (в заказы вложены товары). Страница списка зависит от курсора, поэтому в ETag входит весь запрос.
+    """
+    user = user or request.user
+    try:
+        orders = filter_orders(order_queryset(user), request.query_params)
+    except ValueError:
+        return None  # Ошибку фильтра вернет само представление
+    orders_updated, orders_rows = table_state(orders)
+    products_updated, products_rows = products_state()
+    parts = ("orders", request.user.pk, user.pk, request.get_full_path(), orders_updated, orders_rows,
+             products_updated, products_rows)
+    return parts, None
+
+
+def orders_owner(request):
+    """Чьи заказы запрошены: ?telegram_id= (для бота) или сам пользователь; None — пользователь не найден"""
+    if not hasattr(request, "_orders_owner"):  # ETag и представление ищут пользователя одним запросом
+        telegram_id = request.query_params.get('telegram_id')
+        request._orders_owner = (User.objects.filter(telegram_id=telegram_id).first() if telegram_id
+                                 else request.user)
+    return request._orders_owner
+
+
+def telegram_orders_etag_state(request):
+    """Состояние для get_orders: как у списка заказов, но для пользователя из ?telegram_id="""
+    user = orders_owner(request)
+    return None if user is None else orders_etag_state(request, user)
+
 
 @api_view(['GET'])
+@conditional(products_etag_state)
 def product_list(request):
-    """Список всех товаров"""
-    products = Product.objects.all()
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    """
+    Товары страницами по возрастанию id (`?page_size=`, `?cursor=`).
+
+    `?search=` — товары, в названии которых есть все слова запроса (поиск по началу слова),
+    `?fields=` — только перечисленные поля. Ответ: {"next": ..., "results": [...]}.
+    """
+    try:
+        fields = parse_fields(request.query_params, ProductSerializer)
+    except ValueError as error:
+        return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    products = search_products(Product.objects.all(), request.query_params.get("search"))
+    paginator = ProductCursorPagination()
+    if fast_serializers.is_enabled("product_list"):
+        rows = paginator.paginate_queryset(products.values(*fast_serializers.product_columns(fields)), request)
+        return paginator.get_paginated_response(fast_serializers.format_products(rows, fields))
+
+    page = paginator.paginate_queryset(products if fields is None else products.only(*fields | {"id"}), request)
+    serializer = ProductSerializer(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional(orders_etag_state)
 def order_list(request):
-    """Список заказов: админ видит все, пользователи — только свои"""
-    if request.user.is_staff:
-        orders = Order.objects.all()  # Администратор видит все заказы
-    else:
-        orders = Order.objects.filter(user=request.user)  # Обычный пользователь — только свои
+    """Список заказов: админ видит все, пользователи — только свои (постранично, от новых к старым)"""
+    orders = order_queryset(request.user)
+    return paginated_orders(request, orders, "order_list")
 
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+
+# Изменения моложе этого не выдаются: updated_at ставится до коммита, и транзакция,
+# начатая раньше, может закоммититься позже — водяной знак не должен её перепрыгнуть
+CHANGES_SETTLE_TIME = timedelta(seconds=2)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def order_changes(request):
+    """
+    Заказы, созданные или измененные после водяного знака `since` (для инкрементальной синхронизации).
+
+    Ответ: {"results": [...], "watermark": знак для следующего запроса, "has_more": есть ли еще изменения}.
+    Без `since` выгружаются все доступные заказы (первая синхронизация); `page_size` и `fields` — как у списка заказов.
+    Удаленные заказы в выгрузку не попадают.
+    """
+    try:
+        fields = parse_fields(request.query_params, OrderSerializer)
+    except ValueError as error:
+        return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    since = request.query_params.get('since')
+    orders = shape_orders(order_queryset(request.user), fields, required=("id", "updated_at"))
+    orders = orders.filter(updated_at__lt=timezone.now() - CHANGES_SETTLE_TIME)
+    if since:
+        try:
+            updated_at, order_id = decode_cursor(since)
+        except ValueError:
+            return Response({'error': 'Неверный водяной знак'}, status=status.HTTP_400_BAD_REQUEST)
+        orders = orders.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=order_id),
+                               updated_at__gte=updated_at)
+
+    page_size = OrderCursorPagination().get_page_size(request)
+    page = list(orders.order_by("updated_at", "id")[:page_size + 1])
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    watermark = encode_cursor(page[-1].updated_at, page[-1].id) if page else since
+
+    serializer = OrderSerializer(page, many=True, fields=fields)
+    return Response({'results': serializer.data, 'watermark': watermark, 'has_more': has_more})
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])  # Требуется аутентификация для обновления статуса
 def update_order_status(request, order_id):
-    """Обновление статуса заказа"""
+    """
+    Обновление статуса заказа переходом автомата (order_status.py).
+
+    Один условный UPDATE в транзакции вместе с записью в историю: параллельные
+    изменения из бота и админки не затирают друг друга, недопустимый переход — 409.
+    """
+    new_status = request.data.get('status')
+    print(f"🔍 Запрос на обновление заказа {order_id}, новый статус: {new_status}")  # ✅ Лог запроса
     try:
-        order = Order.objects.get(id=order_id)
-        print(f"🔍 Получен запрос на обновление заказа {order.id}")  # ✅ Лог запроса
-
-        # Проверка прав пользователя (админ или сам пользователь)
-        if not (request.user.is_staff or order.user == request.user):
-            print("🚫 Недостаточно прав для изменения статуса заказа")  # ✅ Лог ошибки прав
-            return Response({'error': 'Недостаточно прав для изменения статуса заказа'},
-                            status=status.HTTP_403_FORBIDDEN)
-
-        new_status = request.data.get('status', order.status)
-        print(f"🔄 Новый статус: {new_status}")  # ✅ Логируем переданный статус
-        if new_status not in ['processing', 'delivering', 'completed', 'canceled']:  # ✅ Добавили 'completed'
-            print("❌ Неверный статус!")  # ✅ Лог ошибки статуса
-            return Response({'error': 'Неверный статус'}, status=status.HTTP_400_BAD_REQUEST)
-
-        order.status = new_status
-        order.save()
-        print(f"✅ Статус заказа {order.id} успешно обновлен: {order.status}")  # ✅ Лог успешного обновления
-
-        return Response({'message': 'Статус заказа обновлен', 'status': order.status}, status=status.HTTP_200_OK)
-    except Order.DoesNotExist:
-        print("❌ Заказ не найден!")  # ✅ Лог ошибки отсутствия заказа
-        return Response({'error': 'Заказ не найден'}, status=status.HTTP_404_NOT_FOUND)
+        result = transition_status(request.user, order_id, new_status)
+    except StatusConflict as error:
+        return Response({'error': str(error)}, status=status.HTTP_409_CONFLICT)
+
+    errors = {
+        'not_found': ('Заказ не найден', status.HTTP_404_NOT_FOUND),
+        'forbidden': ('Недостаточно прав для изменения статуса заказа', status.HTTP_403_FORBIDDEN),
+        'invalid_status': ('Неверный статус', status.HTTP_400_BAD_REQUEST),
+        'invalid_transition': (f'Переход в статус {new_status} недопустим', status.HTTP_409_CONFLICT),
+    }
+    if result['result'] in errors:
+        message, code = errors[result['result']]
+        print(f"❌ {message}")  # ✅ Лог ошибки
+        return Response({'error': message, 'status': result['status']}, status=code)
+
+    print(f"✅ Статус заказа {order_id} обновлен: {result['status']}")  # ✅ Лог успешного обновления
+    return Response({'message': 'Статус заказа обновлен', 'status': result['status']}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_order_status(request):
+    """
+    Массовая смена статусов одним запросом и одной транзакцией.
+
+    Тело: {"orders": [{"id": 1, "status": "processing"}, ...]} или {"ids": [1, 2], "status": "delivering"}.
+    Ответ: {"updated": число, "results": [{"id", "result", "status"}, ...]} в порядке запроса;
+    недопустимые элементы не мешают остальным.
+    """
+    try:
+        changes = parse_status_changes(request.data)
+    except ValueError as error:
+        return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        results = bulk_update_status(request.user, changes)
+    except StatusConflict as error:
+        return Response({'error': str(error)}, status=status.HTTP_409_CONFLICT)
+
+    updated = sum(result["result"] == "updated" for result in results)
+    return Response({'updated': updated, 'results': results})
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])  # <-- Только для авторизованных
 def order_detail(request, order_id):
-    """Детали заказа: админ видит все, пользователь — только свои"""
+    """Детали заказа: админ видит все, пользователь — только свои (?fields= — только перечисленные поля)"""
     try:
-        order = Order.objects.get(id=order_id)
+        fields = parse_fields(request.query_params, OrderSerializer)
+    except ValueError as error:
+        return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not request.user.is_staff and order.user != request.user:
+    try:
+        order = shape_orders(order_queryset(), fields, required=("id", "user")).get(id=order_id)
+
+        if not request.user.is_staff and order.user_id != request.user.id:
             return Response({'error': 'Доступ запрещен'}, status=status.HTTP_403_FORBIDDEN)
 
-        serializer = OrderSerializer(order)
+        serializer = OrderSerializer(order, fields=fields)
         return Response(serializer.data)
 
     except Order.DoesNotExist:
@@ -99,37 +379,30 @@ def save_delivery_address(request):
 @csrf_exempt
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])  # Доступ только авторизованным
+@conditional(orders_etag_state)
 def api_orders(request):
     """Админ видит все заказы, пользователь — только свои"""
-    if request.user.is_staff:
-        orders = Order.objects.all()  # Админ видит все заказы
-    else:
-        orders = Order.objects.filter(user=request.user)  # Пользователь видит только свои заказы
-
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    orders = order_queryset(request.user)
+    return paginated_orders(request, orders, "api_orders")
 
 import logging
 logger = logging.getLogger(__name__)
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@conditional(telegram_orders_etag_state)
 def get_orders(request):
-    user = request.user
-    telegram_id = request.query_params.get('telegram_id')
-
-    if telegram_id:
-        user = User.objects.filter(telegram_id=telegram_id).first()
-        if not user:
-            return Response({'error': 'Пользователь не найден'}, status=status.HTTP_404_NOT_FOUND)
+    user = orders_owner(request)
+    if not user:
+        return Response({'error': 'Пользователь не найден'}, status=status.HTTP_404_NOT_FOUND)
 
     # Админ видит все заказы, пользователь только свои
-    orders = Order.objects.all() if user.is_staff else Order.objects.filter(user=user)
-
-    logger.debug(f"📦 {user.username} запросил заказы: {[order.id for order in orders]}")
+    orders = order_queryset(user)
+    response = paginated_orders(request, orders, "get_orders")
 
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    if response.status_code == status.HTTP_200_OK:
+        logger.debug(f"📦 {user.username} запросил заказы: {[order['id'] for order in response.data['results']]}")
+    return response
 
 
 @api_view(["GET"])
@@ -138,10 +411,7 @@ def get_order_details(request, order_id):
     """Возвращает детали заказа, но только если он принадлежит пользователю"""
     user = request.user  # Получаем авторизованного пользователя
 
-    if user.is_staff:
-        order = get_object_or_404(Order, id=order_id)  # Админ видит все заказы
-    else:
-        order = get_object_or_404(Order, id=order_id, user=user)  # Пользователь только свои
+    order = get_object_or_404(order_queryset(user), id=order_id)  # Админ видит все заказы, пользователь только свои
 
     logger.debug(f"📦 Запрошен заказ {order.id} пользователем {user.username}")
 
@@ -149,5 +419,31 @@ def get_order_details(request, order_id):
     return Response(serializer.data)
 
 
-
-
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def product_sales_report(request):
+    """
+    Продажи по товарам за период (только для персонала).
+
+    Параметры: `start`, `end` (ГГГГ-ММ-ДД, по умолчанию — последние 30 дней),
+    `status` — статусы заказов, можно несколько (?status=completed&status=delivering).
+    """
+    try:
+        start_date, end_date = parse_period(request.query_params)
+    except ValueError:
+        return Response({'error': 'Даты указываются в формате ГГГГ-ММ-ДД, начало — не позже конца'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    statuses = request.query_params.getlist('status')
+    unknown = set(statuses) - set(dict(Order.STATUS_CHOICES))
+    if unknown:
+        return Response({'error': f"Неверный статус: {', '.join(sorted(unknown))}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    products = product_sales(start_date, end_date, statuses)
+    return Response({
+        'start': start_date,
+        'end': end_date,
+        'statuses': sorted(set(statuses)),
+        'products': products,
+    })
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+authentication.py – аутентификация по токену DRF с кэшем токен → пользователь в памяти процесса.
+
+TokenAuthentication читает Token вместе с User на каждый запрос (включая каждый колбэк бота).
+Здесь результат хранится в ограниченном LRU-кэше со сроком жизни: повторные запросы
+с тем же токеном обходятся без обращения к БД. Удаление токена и любое сохранение
+пользователя (права, активность, адрес) сбрасывают запись — см. signals.py. Другие процессы
+узнают об изменении не позже чем через TOKEN_AUTH_CACHE_TTL секунд.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+_entries = OrderedDict()  # Ключ токена → (пользователь, токен, момент устаревания)
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _settings():
+    return (getattr(settings, "TOKEN_AUTH_CACHE_SIZE", 1024),
+            getattr(settings, "TOKEN_AUTH_CACHE_TTL", 60))
+
+
+def cached_credentials(key):
+    """(пользователь, токен) из кэша или None (промах или запись устарела)"""
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[2] > time.monotonic():
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry[:2]
+        if entry is not None:
+            del _entries[key]
+        _stats["misses"] += 1
+        return None
+
+
+def remember_credentials(key, user, token):
+    """Кладет пользователя и токен в кэш, вытесняя самые давние записи сверх размера"""
+    size, ttl = _settings()
+    with _lock:
+        _entries[key] = (user, token, time.monotonic() + ttl)
+        _entries.move_to_end(key)
+        while len(_entries) > size:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def forget_token(key):
+    """Сбрасывает запись токена (токен удален или пересоздан)"""
+    with _lock:
+        _entries.pop(key, None)
+
+
+def forget_user(user_id):
+    """Сбрасывает все токены пользователя (изменились его права или данные)"""
+    with _lock:
+        for key in [key for key, (user, _, _) in _entries.items() if user.pk == user_id]:
+            del _entries[key]
+
+
+def clear_token_cache():
+    """Очищает кэш и счетчики (для тестов и замеров)"""
+    with _lock:
+        _entries.clear()
+        _stats.update(hits=0, misses=0, evictions=0)
+
+
+def token_cache_stats():
+    """Счетчики кэша токенов в текущем процессе: попадания, промахи, вытеснения, размер и доля попаданий"""
+    with _lock:
+        stats = dict(_stats, size=len(_entries))
+    requests = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / requests if requests else 0.0
+    return stats
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кэшем токен → пользователь (подключается в REST_FRAMEWORK)"""
+
+    def authenticate_credentials(self, key):
+        credentials = cached_credentials(key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)  # Проверяет существование и is_active
+            remember_credentials(key, *credentials)
+        user, token = credentials
+        # Каждый запрос получает свою копию: представления могут менять request.user
+        return copy.copy(user), token
@@ -0,0 +1,62 @@
+"""
+conditional.py – условные GET-запросы (ETag) для каталога и списков заказов.
+
+Состояние данных берется одним агрегатом по таблице: время последнего изменения
+(max updated_at) и число строк — число ловит удаления. Если клиент прислал
+совпадающий ETag, представление отвечает 304 и ничего не сериализует.
+
+Last-Modified для таблиц не отдается: он с точностью до секунды и без числа строк,
+поэтому после удаления строки или двух правок за секунду If-Modified-Since дал бы ложный 304.
+"""
+import hashlib
+
+from django.db.models import Func, IntegerField, Subquery
+from django.views.decorators.http import condition
+
+from .models import Product
+
+
+def table_state(queryset):
+    """(время последнего изменения или None, число строк) для QuerySet модели с полем updated_at"""
+    # Два скалярных подзапроса вместо MAX и COUNT в одном агрегате: так SQLite берет MAX
+    # из индекса по updated_at, а COUNT(*) — из самого узкого индекса, без чтения всей таблицы
+    queryset = queryset.order_by()
+    latest = queryset.order_by("-updated_at").values("updated_at")[:1]
+    rows = queryset.annotate(rows=Func(template="COUNT(*)", output_field=IntegerField())).values("rows")
+    state = queryset.annotate(updated=Subquery(latest), rows=Subquery(rows)).values_list("updated", "rows")[:1]
+    return next(iter(state), (None, 0))  # Пустая выборка — ни одной строки
+
+
+def products_state():
+    """Состояние каталога товаров"""
+    return table_state(Product.objects.all())
+
+
+def conditional(state_func):
+    """
+    Декоратор условного GET по функции состояния `state_func(request, *args, **kwargs)`.
+
+    Функция возвращает (части ETag, время последнего изменения или None — без Last-Modified)
+    или None, если состояние не определить (тогда запрос обрабатывается как обычно).
+    Для DRF ставится под @api_view, чтобы состояние считалось уже для аутентифицированного пользователя.
+    """
+    def state(request, *args, **kwargs):
+        # condition() спрашивает ETag и Last-Modified по отдельности — считаем состояние один раз
+        if not hasattr(request, "_conditional_state"):
+            result = state_func(request, *args, **kwargs)
+            if result is not None:
+                parts, last_modified = result
+                digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+                result = (digest, last_modified)
+            request._conditional_state = result
+        return request._conditional_state
+
+    def etag_func(request, *args, **kwargs):
+        result = state(request, *args, **kwargs)
+        return result and result[0]
+
+    def last_modified_func(request, *args, **kwargs):
+        result = state(request, *args, **kwargs)
+        return result and result[1]
+
+    return condition(etag_func=etag_func, last_modified_func=last_modified_func)
@@ -0,0 +1,137 @@
+"""
+fast_serializers.py – быстрая сериализация списков товаров и заказов без ModelSerializer.
+
+Строки читаются через values(), а словари ответа собираются напрямую — без объектов
+моделей и полей DRF. Формат ответа тот же, что у ProductSerializer/OrderSerializer
+(проверяется тестом на совпадение). Каким представлениям включать этот путь —
+настройка FAST_SERIALIZER_ENDPOINTS.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .models import OrderItem, Product
+from .serializers import OrderSerializer
+
+CENTS = Decimal("0.01")
+
+PRODUCT_FIELDS = ("id", "name", "price", "image", "updated_at")  # Порядок полей ProductSerializer
+ORDER_FIELDS = tuple(OrderSerializer.Meta.fields)
+# Столбец Order для каждого поля заказа (products/items читаются отдельными запросами)
+ORDER_COLUMNS = {
+    "id": "id", "user": "user", "status": "status", "order_date": "order_date", "created_at": "order_date",
+    "updated_at": "updated_at", "total_price": "price", "delivery_address": "delivery_address",
+}
+DATETIME_FIELDS = {"order_date", "created_at", "updated_at"}
+
+
+def is_enabled(endpoint):
+    """Включен ли быстрый путь для представления `endpoint` (имя функции представления)"""
+    return endpoint in getattr(settings, "FAST_SERIALIZER_ENDPOINTS", ())
+
+
+def format_datetime(value, tz=None):
+    """Как DateTimeField DRF: в текущем (или переданном) часовом поясе, ISO 8601, UTC — с суффиксом Z"""
+    if value is None:
+        return None
+    value = value.astimezone(tz or timezone.get_current_timezone()).isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+
+def format_decimal(value):
+    """Как DecimalField DRF с decimal_places=2: строка с двумя знаками"""
+    return "" if value is None else f"{value.quantize(CENTS):f}"
+
+
+def format_image(name):
+    """Как ImageField DRF без request в контексте: URL файла из хранилища"""
+    return default_storage.url(name) if name else None
+
+
+def product_columns(fields=None):
+    """Столбцы values() для товаров с полями `fields` (id нужен всегда — для курсора страницы)"""
+    fields = PRODUCT_FIELDS if fields is None else fields
+    return [name for name in PRODUCT_FIELDS if name in fields or name == "id"]
+
+
+def format_products(rows, fields=None):
+    """Словари товаров в формате ProductSerializer из строк values(*product_columns(fields))"""
+    fields = PRODUCT_FIELDS if fields is None else [name for name in PRODUCT_FIELDS if name in fields]
+    tz = timezone.get_current_timezone()  # Один раз на список: получение пояса заметно в профиле
+    formatters = {"price": format_decimal, "image": format_image,
+                  "updated_at": lambda value: format_datetime(value, tz)}
+    converters = [(name, formatters[name]) for name in fields if name in formatters]
+    result = []
+    for row in rows:
+        product = {name: row[name] for name in fields}
+        for name, formatter in converters:
+            product[name] = formatter(product[name])
+        result.append(product)
+    return result
+
+
+def product_values(queryset, fields=None):
+    """Словари товаров в формате ProductSerializer (fields — подмножество полей или None)"""
+    return format_products(queryset.values(*product_columns(fields)), fields)
+
+
+def order_columns(fields=None, required=("id", "order_date")):
+    """Столбцы values() для заказов с полями `fields` (плюс нужные для пагинации)"""
+    fields = ORDER_FIELDS if fields is None else fields
+    columns = {ORDER_COLUMNS[name] for name in fields if name in ORDER_COLUMNS} | set(required)
+    return sorted(columns)
+
+
+def order_values(rows, fields=None, product_ids=False):
+    """
+    Словари заказов в формате OrderSerializer из строк values(*order_columns(...)).
+
+    Позиции (и товары, если нужны) читаются по одному запросу на весь список.
+    С `product_ids=True` поле products — список id (как OrderSideloadSerializer).
+    """
+    fields = ORDER_FIELDS if fields is None else [name for name in ORDER_FIELDS if name in fields]
+    ids = [row["id"] for row in rows]
+
+    items = {}
+    if "items" in fields or "products" in fields:
+        for order_id, product_id, quantity, unit_price in (
+                OrderItem.objects.filter(order_id__in=ids).order_by("id")
+                .values_list("order_id", "product_id", "quantity", "unit_price")):
+            items.setdefault(order_id, []).append((product_id, quantity, unit_price))
+
+    products = {}
+    if "products" in fields and not product_ids:
+        needed = {product_id for lines in items.values() for product_id, _, _ in lines}
+        products = {product["id"]: product for product in product_values(Product.objects.filter(id__in=needed))}
+
+    tz = timezone.get_current_timezone()
+    # Даты форматируются один раз на столбец: order_date и created_at — один и тот же столбец
+    date_columns = {ORDER_COLUMNS[name] for name in fields if name in DATETIME_FIELDS}
+
+    result = []
+    for row in rows:
+        lines = items.get(row["id"], ())
+        dates = {column: format_datetime(row[column], tz) for column in date_columns}
+        order = {}
+        for name in fields:
+            if name == "products":
+                order[name] = ([product_id for product_id, _, _ in lines] if product_ids
+                               else [products[product_id] for product_id, _, _ in lines])
+            elif name == "items":
+                order[name] = [{"product": product_id, "quantity": quantity, "unit_price": format_decimal(unit_price)}
+                               for product_id, quantity, unit_price in lines]
+            elif name in DATETIME_FIELDS:
+                order[name] = dates[ORDER_COLUMNS[name]]
+            else:
+                order[name] = row[ORDER_COLUMNS[name]]  # total_price — Decimal, как у свойства модели
+        result.append(order)
+    return result
+
+
+def sideloaded_product_values(order_ids):
+    """Товары заказов для ?include=products одним запросом: {id: товар}"""
+    ids = OrderItem.objects.filter(order_id__in=order_ids).values("product_id")
+    products = product_values(Product.objects.filter(id__in=ids).order_by("id"))
+    return {str(product["id"]): product for product in products}
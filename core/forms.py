@@ -18,7 +18,7 @@ class OrderForm(forms.ModelForm):
 
     class Meta:
         model = Order
-        fields = ['products', 'delivery_address']
+        fields = ['delivery_address']  # Состав заказа (позиции OrderItem) берется из корзины
 
 
 class UserUpdateForm(forms.ModelForm):
@@ -0,0 +1,108 @@
+# core/management/commands/backfill_reports.py
+# Пересчет истории отчетов за диапазон дат: диапазон режется на куски,
+# куски считаются параллельно в пуле процессов, отчеты сохраняются по одному на дату.
+
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from core.models import Order
+from reports.analytics import REPORT_PERIOD_DAYS
+
+
+def _init_worker():
+    """Дочерний процесс открывает собственные соединения с БД (работает и при fork, и при spawn)"""
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def compute_chunk(start, end, window):
+    """
+    Считает разбивку по статусам для каждого отчета с датой в [start, end].
+
+    Отчет за дату D покрывает D − `window` … D включительно, как живые отчеты
+    (reports.analytics.report_period). Заказы читаются одним
+    GROUP BY (день, статус) на весь кусок, окно сдвигается в Python.
+    Возвращает список (дата, {статус: {"count", "revenue"}}).
+    """
+    from reports.analytics import daily_sales_from_orders, orders_in_period, report_period
+
+    first, _ = report_period(start, window)
+    daily = daily_sales_from_orders(orders_in_period(first, end))
+    empty = (0, Decimal("0"))
+    running = {status: {"count": 0, "revenue": Decimal("0")} for status, _ in Order.STATUS_CHOICES}
+
+    results = []
+    day = first
+    while day <= end:
+        expired = day - timedelta(days=window + 1)  # Первый день, который уже не входит в период
+        for status, bucket in running.items():
+            count, revenue = daily.get((day, status), empty)
+            old_count, old_revenue = daily.get((expired, status), empty) if expired >= first else empty
+            bucket["count"] += count - old_count
+            bucket["revenue"] += revenue - old_revenue
+        if day >= start:
+            results.append((day, {status: dict(bucket) for status, bucket in running.items()}))
+        day += timedelta(days=1)
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Backfill one sales report per date for a date range using a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument("start", type=date.fromisoformat, help="Первая дата отчета (ГГГГ-ММ-ДД)")
+        parser.add_argument("end", type=date.fromisoformat, help="Последняя дата отчета (ГГГГ-ММ-ДД)")
+        parser.add_argument("--window", type=int, default=REPORT_PERIOD_DAYS,
+                            help="Отчет за дату D покрывает D − window … D (как живые отчеты)")
+        parser.add_argument("--chunk-days", type=int, default=31, help="Сколько дат считает один процесс за раз")
+        parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию — по числу ядер)")
+
+    def handle(self, *args, **options):
+        from reports.analytics import save_report
+
+        start, end, window = options["start"], options["end"], options["window"]
+        if end < start:
+            raise CommandError("Конечная дата раньше начальной")
+        if window < 0 or options["chunk_days"] < 1:
+            raise CommandError("--window не может быть отрицательным, а --chunk-days должен быть положительным")
+
+        chunks = []
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=options["chunk_days"] - 1), end)
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end + timedelta(days=1)
+
+        total_days = (end - start).days + 1
+        done_days = 0
+        started = time.perf_counter()
+
+        # Перед fork закрываем соединения, чтобы процессы не делили один дескриптор SQLite
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=_init_worker) as pool:
+            futures = {pool.submit(compute_chunk, s, e, window): (s, e) for s, e in chunks}
+            for number, future in enumerate(as_completed(futures), start=1):
+                chunk_start, chunk_end = futures[future]
+                results = future.result()
+                # Запись — в основном процессе, одной транзакцией на кусок
+                with transaction.atomic():
+                    for report_date, status_counts in results:
+                        save_report(report_date, status_counts)
+
+                done_days += len(results)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"[{number}/{len(chunks)}] {chunk_start}..{chunk_end}: "
+                    f"{done_days}/{total_days} дней, {done_days / elapsed:.1f} дней/с"
+                )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: {total_days} отчетов за {elapsed:.2f} с ({total_days / elapsed:.1f} дней/с)"
+        ))
@@ -0,0 +1,524 @@
+# core/management/commands/benchmark.py
+# Замеры производительности на синтетических данных.
+# Все данные создаются внутри транзакции и откатываются после замера — рабочая база не меняется.
+
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import re_path
+from django.utils import timezone
+from django.views.static import serve
+
+from core.media import serve_media
+from core.models import Order, OrderItem, Product, User
+from reports.analytics import rebuild_daily_sales
+
+SUITES = {}
+
+
+def suite(name):
+    """Регистрирует функцию замера под именем `name`"""
+    def decorator(func):
+        SUITES[name] = func
+        return func
+    return decorator
+
+
+def seed_orders(count, users=200, products=30, days=60, items_per_order=3, seed=42):
+    """
+    Создает пользователей, товары и `count` заказов, равномерно разбросанных по последним `days` дням.
+
+    Возвращает (список пользователей, список товаров). Вызывать только внутри transaction.atomic()
+    с откатом (как в Command.handle): иначе синтетические данные останутся в рабочей базе.
+    """
+    if not connection.in_atomic_block:
+        raise RuntimeError("seed_orders() вне транзакции записал бы синтетические данные в рабочую базу")
+    rnd = random.Random(seed)
+    stamp = int(time.time())
+    user_objs = User.objects.bulk_create(
+        [User(username=f"bench_{stamp}_{i}") for i in range(users)]
+    )
+    product_objs = Product.objects.bulk_create([
+        Product(name=f"Букет {i}", price=Decimal(rnd.randint(10, 100) * 100),
+                image=f"products/flower{i % 9 + 1}.jpg")
+        for i in range(products)
+    ])
+
+    statuses = [choice[0] for choice in Order.STATUS_CHOICES]
+    now = timezone.now()
+    batch = 5000
+    for offset in range(0, count, batch):
+        size = min(batch, count - offset)
+        # Позиции заказа: товары без повторов, количество 1–3, цена — цена товара
+        contents = [
+            [(product, rnd.randint(1, 3)) for product in rnd.sample(product_objs, rnd.randint(1, items_per_order))]
+            if items_per_order else []
+            for _ in range(size)
+        ]
+        orders = Order.objects.bulk_create([
+            Order(user=rnd.choice(user_objs), status=rnd.choice(statuses), delivery_address="ул. Тестовая, 1",
+                  price=(sum(product.price * quantity for product, quantity in lines) if lines
+                         else Decimal(rnd.randint(10, 500) * 10)))
+            for lines in contents
+        ])
+        # `order_date` заполняется auto_now_add, поэтому разносим даты отдельным UPDATE
+        # (executemany заметно быстрее bulk_update с его CASE WHEN на каждую строку)
+        for order in orders:
+            order.order_date = now - timedelta(seconds=rnd.randint(0, days * 86400))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {Order._meta.db_table} SET order_date = %s WHERE id = %s",
+                [(connection.ops.adapt_datetimefield_value(order.order_date), order.id) for order in orders],
+            )
+
+        OrderItem.objects.bulk_create([
+            OrderItem(order_id=order.id, product_id=product.id, quantity=quantity, unit_price=product.price)
+            for order, lines in zip(orders, contents)
+            for product, quantity in lines
+        ])
+
+    # bulk_create/bulk_update не вызывают сигналы — пересчитываем суточную сводку целиком
+    rebuild_daily_sales()
+    return user_objs, product_objs
+
+
+def measure(func, repeat=3):
+    """Выполняет `func` `repeat` раз; возвращает (лучшее время в секундах, число запросов, результат)"""
+    best = None
+    result = None
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+        queries = len(ctx.captured_queries)
+        best = elapsed if best is None else min(best, elapsed)
+    return best, queries, result
+
+
+@suite("reports")
+def bench_reports(command, options):
+    """generate_sales_report: цикл по заказам в Python, GROUP BY status по заказам и по суточной сводке"""
+    from reports.analytics import (aggregate_daily_sales_by_status, aggregate_orders_by_status,
+                                   orders_in_period)
+
+    seed_orders(options["orders"], items_per_order=0)
+    end = timezone.localdate()
+    start = end - timedelta(days=30)
+
+    def legacy():
+        # Прежняя реализация: каждая строка заказа загружается в Python
+        orders = Order.objects.filter(order_date__date__gte=start, order_date__date__lte=end)
+        orders.count()
+        orders.exists()
+        status_counts = {status[0]: {"count": 0, "revenue": 0} for status in Order.STATUS_CHOICES}
+        rows = 0
+        for order in orders:
+            rows += 1
+            status_counts[order.status]["count"] += 1
+            status_counts[order.status]["revenue"] += order.price
+        orders.count()
+        sum(order.price for order in orders)
+        return rows, status_counts
+
+    def aggregated():
+        status_counts = aggregate_orders_by_status(orders_in_period(start, end))
+        # GROUP BY возвращает по строке на каждый встретившийся статус
+        return sum(1 for bucket in status_counts.values() if bucket["count"]), status_counts
+
+    def rollup():
+        status_counts = aggregate_daily_sales_by_status(start, end)
+        return sum(1 for bucket in status_counts.values() if bucket["count"]), status_counts
+
+    for title, func in (("до (цикл Python)", legacy), ("GROUP BY по заказам", aggregated),
+                        ("суточная сводка", rollup)):
+        elapsed, queries, (rows, _) = measure(func)
+        command.stdout.write(f"{title:<22} строк из БД: {rows:>7}  запросов: {queries:>2}  время: {elapsed * 1000:8.1f} мс")
+
+
+@suite("columnar")
+def bench_columnar(command, options):
+    """Группировки по дням/неделям/месяцам, статусам и покупателям: цикл по ORM против NumPy"""
+    from collections import defaultdict
+    from reports.columnar import load_order_facts, moving_average
+
+    seed_orders(options["orders"], items_per_order=0, days=365)
+
+    def per_row():
+        by_day, by_week, by_month = defaultdict(Decimal), defaultdict(Decimal), defaultdict(Decimal)
+        by_status, by_user = defaultdict(Decimal), defaultdict(Decimal)
+        for order in Order.objects.all():
+            day = timezone.localdate(order.order_date)
+            by_day[day] += order.price
+            by_week[day - timedelta(days=day.weekday())] += order.price
+            by_month[day.replace(day=1)] += order.price
+            by_status[order.status] += order.price
+            by_user[order.user_id] += order.price
+        return by_day, by_week, by_month, by_status, by_user
+
+    def columnar():
+        facts = load_order_facts(with_products=False)
+        days, revenue, _ = facts.revenue_by_period("day")
+        moving_average(revenue, 7)
+        return (dict(zip(days.tolist(), revenue)), facts.revenue_by_period("week"),
+                facts.revenue_by_period("month"), facts.by_status(), facts.by_customer())
+
+    results = {}
+    for title, func in (("цикл по объектам ORM", per_row), ("NumPy (values_list)", columnar)):
+        elapsed, queries, results[title] = measure(func)
+        command.stdout.write(f"{title:<22} заказов: {options['orders']:>7}  запросов: {queries:>2}  "
+                             f"время: {elapsed * 1000:8.1f} мс")
+
+    expected, actual = results["цикл по объектам ORM"][0], results["NumPy (values_list)"][0]
+    same = expected.keys() == actual.keys() and all(abs(float(expected[d]) - actual[d]) < 0.01 for d in expected)
+    command.stdout.write(f"Выручка по дням совпадает: {'да' if same else 'НЕТ'}")
+
+
+@suite("products")
+def bench_products(command, options):
+    """Продажи по товарам: обход заказов с prefetch против GROUP BY по позициям и кэша"""
+    from collections import defaultdict
+    from django.core.cache import cache
+    from reports.analytics import orders_in_period, product_sales
+
+    seed_orders(options["orders"], days=365)
+    end = timezone.localdate()
+    start = end - timedelta(days=90)
+    command.stdout.write(f"Позиций заказов: {OrderItem.objects.count()}")
+
+    def per_order():
+        stats = defaultdict(lambda: {"units": 0, "revenue": Decimal("0"), "orders": 0})
+        for order in orders_in_period(start, end).prefetch_related("items"):
+            for item in order.items.all():
+                stats[item.product_id]["units"] += item.quantity
+                stats[item.product_id]["revenue"] += item.quantity * item.unit_price
+                stats[item.product_id]["orders"] += 1
+        return stats
+
+    def aggregated():
+        cache.clear()
+        return product_sales(start, end)
+
+    def cached():
+        return product_sales(start, end)
+
+    for title, func in (("обход заказов (prefetch)", per_order), ("GROUP BY в БД", aggregated),
+                        ("повтор из кэша", cached)):
+        elapsed, queries, _ = measure(func)
+        command.stdout.write(f"{title:<26} запросов: {queries:>2}  время: {elapsed * 1000:8.1f} мс")
+
+    items = OrderItem.objects.filter(order_id__in=orders_in_period(start, end).values("id"))
+    plan = (items.order_by().values("product_id", "product__name")
+            .annotate(units=Count("id"), orders=Count("order_id", distinct=True)).explain())
+    command.stdout.write("План запроса:\n" + plan)
+
+
+@suite("pagination")
+def bench_pagination(command, options):
+    """Страницы списка заказов для персонала: OFFSET против курсора (order_date, id)"""
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from core.api_views import order_list
+    from core.pagination import OrderCursorPagination, encode_cursor
+
+    seed_orders(options["orders"], items_per_order=1, days=365)
+    staff = User.objects.create(username=f"bench_staff_{int(time.time())}", is_staff=True)
+    factory = APIRequestFactory()
+    size = OrderCursorPagination.page_size
+    ordered = Order.objects.order_by(*OrderCursorPagination.ordering)
+
+    def offset_page(number):
+        return lambda: list(ordered[number * size:(number + 1) * size])
+
+    def cursor_query(number):
+        if not number:
+            return ""
+        last = ordered.values_list("order_date", "id")[number * size - 1]
+        return f"?cursor={encode_cursor(*last)}"
+
+    def keyset_page(number):
+        request = factory.get(f"/api/orders/{cursor_query(number)}", HTTP_HOST="127.0.0.1")
+        return lambda: OrderCursorPagination().paginate_queryset(Order.objects.all(), Request(request))
+
+    def api_page(number):
+        query = cursor_query(number)
+
+        def page():
+            request = factory.get(f"/api/orders/{query}", HTTP_HOST="127.0.0.1")
+            force_authenticate(request, user=staff)
+            return order_list(request).data
+        return page
+
+    last_page = (options["orders"] - 1) // size
+    for number in (0, last_page // 2, last_page):
+        offset_time, _, _ = measure(offset_page(number))
+        keyset_time, _, _ = measure(keyset_page(number))
+        api_time, queries, _ = measure(api_page(number))
+        command.stdout.write(f"страница {number:>6}  OFFSET: {offset_time * 1000:6.1f} мс  "
+                             f"курсор: {keyset_time * 1000:6.1f} мс  "
+                             f"ответ API (запросов: {queries}): {api_time * 1000:6.1f} мс")
+
+    plan = ordered.filter(order_date__lte=timezone.now())[:size + 1].explain()
+    command.stdout.write("План запроса страницы:\n" + plan)
+
+
+@suite("sideload")
+def bench_sideload(command, options):
+    """Список заказов: товары внутри каждого заказа против ?include=products (размер ответа и время)"""
+    from rest_framework.renderers import JSONRenderer
+    from core.api_views import order_queryset, sideloaded_products
+    from core.serializers import OrderSerializer, OrderSideloadSerializer
+
+    seed_orders(options["orders"], days=365)
+    renderer = JSONRenderer()
+
+    def nested(orders):
+        return lambda: renderer.render(OrderSerializer(list(orders.all()), many=True).data)
+
+    def sideloaded(orders):
+        def render():
+            page = list(orders.all().prefetch_related(None).prefetch_related("items"))
+            return renderer.render({"results": OrderSideloadSerializer(page, many=True).data,
+                                    "products": sideloaded_products(page)})
+        return render
+
+    for size in (200, 5000):
+        orders = order_queryset().order_by("-order_date", "-id")[:size]
+        for title, func in (("товары в каждом заказе", nested(orders)), ("?include=products", sideloaded(orders))):
+            elapsed, queries, body = measure(func)
+            command.stdout.write(f"{size:>5} заказов  {title:<24} размер: {len(body) / 1024:8.1f} КБ  "
+                                 f"запросов: {queries}  время: {elapsed * 1000:7.1f} мс")
+
+
+@suite("fields")
+def bench_fields(command, options):
+    """Страница списка заказов целиком против ?fields= (поля, которые нужны боту)"""
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from core.api_views import order_list
+
+    seed_orders(options["orders"], days=365)
+    staff = User.objects.create(username=f"bench_staff_{int(time.time())}", is_staff=True)
+    factory = APIRequestFactory()
+
+    def page(query):
+        def call():
+            request = factory.get(f"/api/orders/?page_size=200{query}", HTTP_HOST="127.0.0.1")
+            force_authenticate(request, user=staff)
+            return order_list(request).render().content
+        return call
+
+    for title, query in (("все поля", ""), ("?fields=id,status,created_at,total_price",
+                                             "&fields=id,status,created_at,total_price")):
+        elapsed, queries, body = measure(page(query))
+        command.stdout.write(f"{title:<42} размер: {len(body) / 1024:7.1f} КБ  запросов: {queries}  "
+                             f"время: {elapsed * 1000:6.1f} мс")
+
+
+@suite("serializers")
+def bench_serializers(command, options):
+    """Пропускная способность сериализации: ModelSerializer против values() (core/fast_serializers.py)"""
+    from core.api_views import order_queryset
+    from core.fast_serializers import order_columns, order_values, product_values
+    from core.serializers import OrderSerializer, ProductSerializer
+
+    seed_orders(options["orders"], days=365)
+    ordered = Order.objects.order_by("-order_date", "-id")
+
+    for size in (1000, 10000, 100000):
+        if size > options["orders"]:
+            break
+        ids = ordered.values("id")[:size]  # Подзапрос: не упираемся в лимит параметров SQLite
+
+        def drf():
+            return OrderSerializer(order_queryset().filter(id__in=ids), many=True).data
+
+        def fast():
+            return order_values(list(Order.objects.filter(id__in=ids).values(*order_columns())))
+
+        for title, func in (("OrderSerializer", drf), ("values()", fast)):
+            elapsed, queries, _ = measure(func, repeat=1 if size >= 100000 else 3)
+            command.stdout.write(f"{size:>6} заказов  {title:<16} запросов: {queries}  время: {elapsed * 1000:8.1f} мс  "
+                                 f"{size / elapsed:>9.0f} заказов/с")
+
+    products = Product.objects.all()
+    for title, func in (("ProductSerializer", lambda: ProductSerializer(products.all(), many=True).data),
+                        ("values()", lambda: product_values(products.all()))):
+        elapsed, _, data = measure(func, repeat=20)
+        command.stdout.write(f"{len(data):>6} товаров  {title:<17} время: {elapsed * 1000:6.2f} мс  "
+                             f"{len(data) / elapsed:>9.0f} товаров/с")
+
+
+@suite("search")
+def bench_search(command, options):
+    """Поиск товаров по названию: FTS5 против icontains; страницы каталога по курсору"""
+    from unittest import mock
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from core.api_views import product_list
+    from core.pagination import ProductCursorPagination
+    from core.search import fts_enabled, rebuild_search_index, search_products
+
+    if not fts_enabled():
+        command.stdout.write("FTS5 недоступен: замер только для icontains")
+
+    count = options["products"]
+    rnd = random.Random(42)
+    kinds = ["Розы", "Тюльпаны", "Пионы", "Хризантемы", "Лилии", "Орхидеи", "Гортензии", "Ромашки", "Ирисы"]
+    colors = ["красные", "белые", "розовые", "желтые", "синие", "кремовые", "пурпурные", "персиковые"]
+    for offset in range(0, count, 5000):
+        Product.objects.bulk_create([
+            Product(name=f"{rnd.choice(kinds)} {rnd.choice(colors)} №{offset + i}", price=Decimal(1000),
+                    image="products/flower1.jpg")
+            for i in range(min(5000, count - offset))
+        ])
+    rebuild_search_index()  # bulk_create не вызывает сигналы
+    command.stdout.write(f"Товаров: {Product.objects.count()}")
+
+    user = User.objects.create(username=f"bench_user_{int(time.time())}")
+    factory = APIRequestFactory()
+    size = ProductCursorPagination.page_size
+
+    def page(queryset):
+        return lambda: list(queryset.order_by("id")[:size + 1])
+
+    def api(query):
+        def call():
+            request = factory.get(f"/api/products/{query}", HTTP_HOST="127.0.0.1")
+            force_authenticate(request, user=user)
+            return product_list(request).data
+        return call
+
+    for query in ("роз", "розы красные", "персик", "№4999", "васильки"):
+        fts_time, _, found = measure(page(search_products(Product.objects.all(), query)), repeat=5)
+        with mock.patch("core.search.fts_enabled", return_value=False):
+            like_time, _, _ = measure(page(search_products(Product.objects.all(), query)), repeat=5)
+        command.stdout.write(f"{query!r:<16} найдено на странице: {len(found):>2}  FTS5: {fts_time * 1000:6.2f} мс  "
+                             f"icontains: {like_time * 1000:6.2f} мс")
+
+    last_id = Product.objects.order_by("-id").values_list("id", flat=True)[size]
+    cursor = ProductCursorPagination().make_cursor({"id": last_id})
+    for title, query in (("первая страница", ""), ("последняя страница", f"?cursor={cursor}"),
+                         ("поиск ?search=роз", "?search=роз")):
+        elapsed, queries, _ = measure(api(query), repeat=5)
+        command.stdout.write(f"API {title:<20} запросов: {queries}  время: {elapsed * 1000:6.2f} мс")
+
+
+# Маршруты для замера раздачи media: старый обработчик (django.views.static.serve) и новый рядом
+urlpatterns = [
+    re_path(r"^old/(?P<path>.+)$", serve, {"document_root": settings.MEDIA_ROOT}),
+    re_path(r"^new/(?P<path>.+)$", serve_media),
+]
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass  # Без строки в консоли на каждый запрос
+
+
+@suite("media")
+def bench_media(command, options):
+    """Раздача изображений под параллельной нагрузкой: static.serve против core.media.serve_media"""
+    folder = os.path.join(settings.MEDIA_ROOT, "products")
+    names = sorted(f"products/{name}" for name in os.listdir(folder) if name.endswith(".jpg"))
+    if not names:
+        command.stdout.write("Нет изображений в media/products")
+        return
+    command.stdout.write(f"Изображений: {len(names)}, средний размер: "
+                         f"{sum(os.path.getsize(os.path.join(settings.MEDIA_ROOT, name)) for name in names) / len(names) / 1024:.0f} КБ, "
+                         f"запросов: {options['requests']}, потоков: {options['concurrency']}")
+
+    with override_settings(ROOT_URLCONF=__name__, DEBUG=True):
+        server = ThreadedWSGIServer(("127.0.0.1", 0), QuietRequestHandler)
+        server.set_app(WSGIHandler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        def fetch(url, headers):
+            request = urllib.request.Request(url, headers=headers)
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return response.status, len(response.read())
+            except urllib.error.HTTPError as error:  # 304
+                return error.code, 0
+
+        def run(prefix, headers=None):
+            urls = [f"{base}/{prefix}/{names[i % len(names)]}" for i in range(options["requests"])]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+                results = list(pool.map(lambda url: fetch(url, headers or {}), urls))
+            elapsed = time.perf_counter() - started
+            return elapsed, results
+
+        with urllib.request.urlopen(f"{base}/new/{names[0]}") as response:
+            last_modified = response.headers["Last-Modified"]
+        scenarios = [
+            ("static.serve: 200", "old", {}, None),
+            ("serve_media: 200", "new", {}, None),
+            ("serve_media: 200 X-Accel-Redirect", "new", {}, "x-accel-redirect"),
+            ("static.serve: 304 If-Modified-Since", "old", {"If-Modified-Since": last_modified}, None),
+            ("serve_media: 304 If-Modified-Since", "new", {"If-Modified-Since": last_modified}, None),
+            ("serve_media: 206 Range 16 КБ", "new", {"Range": "bytes=0-16383"}, None),
+        ]
+        try:
+            for title, prefix, headers, sendfile in scenarios:
+                with override_settings(MEDIA_SENDFILE=sendfile):
+                    elapsed, results = run(prefix, headers)
+                statuses = sorted({status for status, _ in results})
+                received = sum(size for _, size in results)
+                command.stdout.write(f"{title:<38} {len(results) / elapsed:7.0f} запр/с  "
+                                     f"{received / elapsed / 1024 / 1024:7.1f} МБ/с  статусы: {statuses}")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    # Те же обработчики без сети и HTTP-клиента: время Django на один ответ вместе с чтением файла
+    factory = RequestFactory()
+
+    def call(view, headers, **kwargs):
+        def run():
+            for name in names:
+                response = view(factory.get(f"/media/{name}", headers=headers), path=name, **kwargs)
+                for _ in response:
+                    pass
+                response.close()
+        return run
+
+    for title, view, headers, kwargs in (
+        ("static.serve: 200", serve, {}, {"document_root": settings.MEDIA_ROOT}),
+        ("serve_media: 200", serve_media, {}, {}),
+        ("static.serve: 304", serve, {"If-Modified-Since": last_modified}, {"document_root": settings.MEDIA_ROOT}),
+        ("serve_media: 304", serve_media, {"If-Modified-Since": last_modified}, {}),
+    ):
+        elapsed, _, _ = measure(call(view, headers, **kwargs), repeat=5)
+        command.stdout.write(f"в процессе {title:<27} {elapsed / len(names) * 1e6:7.0f} мкс на ответ")
+
+
+class Command(BaseCommand):
+    help = "Замеры производительности на синтетических данных (данные откатываются после замера)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("suite", choices=sorted(SUITES), help="Какой замер запустить")
+        parser.add_argument("--orders", type=int, default=20000, help="Сколько заказов сгенерировать")
+        parser.add_argument("--products", type=int, default=50000, help="Сколько товаров сгенерировать (search)")
+        parser.add_argument("--requests", type=int, default=2000, help="Сколько запросов отправить (media)")
+        parser.add_argument("--concurrency", type=int, default=16, help="Параллельных запросов (media)")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            SUITES[options["suite"]](self, options)
+            transaction.set_rollback(True)  # ✅ Синтетические данные не сохраняются
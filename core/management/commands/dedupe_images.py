@@ -0,0 +1,89 @@
+# core/management/commands/dedupe_images.py
+# Схлопывание дубликатов в media/products: одинаковые по содержимому файлы заменяются
+# одним файлом с именем по хешу (как у ContentHashStorage), товары переводятся на него.
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Product
+from core.storage import content_hash, hashed_name, product_image_storage
+from core.thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_WIDTHS, thumbnail_name
+
+IMAGE_DIR = "products"
+
+
+def hash_image(name):
+    """(имя, sha256, размер) файла в хранилище"""
+    with product_image_storage.open(name, "rb") as image_file:
+        return name, content_hash(image_file), product_image_storage.size(name)
+
+
+def move_thumbnails(old_name, new_name):
+    """Уменьшенные копии старого файла переезжают под новое имя (или удаляются, если там уже есть свои)"""
+    for width in THUMBNAIL_WIDTHS:
+        for ext in THUMBNAIL_FORMATS:
+            source = thumbnail_name(old_name, width, ext)
+            if not default_storage.exists(source):
+                continue
+            target = thumbnail_name(new_name, width, ext)
+            if not default_storage.exists(target):
+                with default_storage.open(source, "rb") as thumbnail:
+                    default_storage.save(target, thumbnail)
+            default_storage.delete(source)
+
+
+class Command(BaseCommand):
+    help = 'Collapse duplicate product images into content-addressed files and report reclaimed disk space'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет сделано")
+        parser.add_argument("--workers", type=int, default=None, help="Потоков для хеширования")
+
+    def handle(self, *args, **options):
+        _, files = product_image_storage.listdir(IMAGE_DIR)
+        names = [f"{IMAGE_DIR}/{filename}" for filename in sorted(files)]
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            hashed = list(pool.map(hash_image, names))
+
+        groups = defaultdict(list)
+        sizes = {}
+        for name, digest, size in hashed:
+            groups[hashed_name(name, digest)].append(name)
+            sizes[name] = size
+
+        # Для каждой группы: файл с именем по хешу и список старых имен, которые он заменяет
+        renames = {canonical: [name for name in group if name != canonical]
+                   for canonical, group in groups.items() if group != [canonical]}
+        duplicates = sum(len(group) - 1 for group in groups.values())
+        reclaimed = sum(sizes[name] for group in groups.values() for name in group[1:])
+        self.stdout.write(f"Файлов: {len(names)}, уникальных: {len(groups)}, дубликатов: {duplicates}")
+
+        if options["dry_run"]:
+            self.stdout.write(f"Освободится {reclaimed / 1024:.0f} КБ (--dry-run: ничего не изменено)")
+            return
+
+        for canonical, old_names in renames.items():
+            if canonical not in groups[canonical]:
+                with product_image_storage.open(old_names[0], "rb") as image_file:
+                    product_image_storage.save(canonical, image_file)
+
+        # update() не трогает updated_at — ставим сами, чтобы сменились ETag и кэш каталога
+        with transaction.atomic():
+            updated = sum(Product.objects.filter(image__in=old_names).update(image=canonical, updated_at=timezone.now())
+                          for canonical, old_names in renames.items())
+
+        # Старые файлы удаляем только после фиксации: при откате товары ссылались бы в пустоту
+        for canonical, old_names in renames.items():
+            for name in old_names:
+                move_thumbnails(name, canonical)
+                product_image_storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: товаров обновлено {updated}, файлов удалено {sum(map(len, renames.values()))}, "
+            f"освобождено {reclaimed / 1024:.0f} КБ"
+        ))
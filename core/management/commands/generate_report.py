@@ -1,8 +1,8 @@
 # core/management/commands/generate_report.py
 
 from django.core.management.base import BaseCommand
-from datetime import datetime, timedelta
-from reports.analytics import generate_sales_report  # функция находится в reports/analytics.py
+from datetime import datetime
+from reports.analytics import generate_sales_report, report_period  # функции находятся в reports/analytics.py
 
 
 class Command(BaseCommand):
@@ -11,7 +11,7 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         # Получаем сегодняшнюю дату и дату вчера
         today = datetime.now().date()
-        yesterday = today - timedelta(days=30)
+        yesterday, today = report_period(today)
 
         # Генерируем отчёт за вчера
         report = generate_sales_report(yesterday, today)
@@ -0,0 +1,67 @@
+# core/management/commands/generate_thumbnails.py
+# Создание уменьшенных копий изображений всех товаров: изображения обрабатываются
+# параллельно в пуле процессов, размеры оригиналов записываются в основном процессе.
+
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Product
+
+
+def _init_worker():
+    """Дочерний процесс настраивает Django сам (нужно при spawn; при fork ничего не меняет)"""
+    import django
+    django.setup()
+
+
+def process_image(name, force):
+    """Создает копии одного изображения; (имя, ширина, высота, байт) или (имя, ошибка)"""
+    from core.thumbnails import generate_thumbnails
+
+    try:
+        return (name, *generate_thumbnails(name, force=force))
+    except OSError as error:
+        return name, str(error)
+
+
+class Command(BaseCommand):
+    help = 'Generate WebP/JPEG thumbnails for all product images using a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Пересоздать уже существующие копии")
+        parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию — по числу ядер)")
+
+    def handle(self, *args, **options):
+        # Одно изображение может быть у нескольких товаров — обрабатываем его один раз
+        names = sorted(set(Product.objects.exclude(image="").values_list("image", flat=True)))
+        if not names:
+            self.stdout.write("Нет изображений товаров")
+            return
+
+        done, failed, written = 0, 0, 0
+        started = time.perf_counter()
+
+        # Процессы работают только с файлами и к БД не обращаются — соединение остается у основного
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=_init_worker) as pool:
+            futures = [pool.submit(process_image, name, options["force"]) for name in names]
+            for future in as_completed(futures):
+                name, *result = future.result()
+                if len(result) == 1:
+                    failed += 1
+                    self.stderr.write(f"{name}: {result[0]}")
+                    continue
+                width, height, size = result
+                # update() не трогает updated_at — ставим сами, чтобы сменились ETag и кэш каталога
+                Product.objects.filter(image=name).update(image_width=width, image_height=height,
+                                                          updated_at=timezone.now())
+                done += 1
+                written += size
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: {done} изображений за {elapsed:.2f} с ({done / elapsed:.1f} изображений/с), "
+            f"записано {written / 1024:.0f} КБ, ошибок: {failed}"
+        ))
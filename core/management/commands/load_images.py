@@ -1,24 +1,85 @@
 # core/management/commands/load_images.py
-from django.core.management.base import BaseCommand
-from django.core.files import File
-from core.models import Product  # Убедитесь, что импортируете правильную модель
-from django.conf import settings
+# Загрузка товаров из папки с изображениями: файлы хешируются параллельно, уже известные
+# изображения пропускаются, новые товары создаются пачками через bulk_create.
+# Известные сравниваются по содержимому: у имен по хешу sha256 берется из имени,
+# файлы со старыми именами (products/flower1.jpg) хешируются вместе с папкой.
+
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Product
+from core.search import index_products
+from core.storage import content_hash, hashed_name, product_image_storage
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+HASHED_STEM_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def hash_file(path):
+    """(путь, sha256 содержимого)"""
+    with open(path, "rb") as image_file:
+        return path, content_hash(image_file)
+
 
 class Command(BaseCommand):
     help = 'Загружает изображения из папки media/products'
 
-    def handle(self, *args, **kwargs):
-        products_dir = os.path.join(settings.MEDIA_ROOT, 'products')
-        for image_filename in os.listdir(products_dir):
-            if image_filename.endswith('.jpg'):
-                image_path = os.path.join(products_dir, image_filename)
-                with open(image_path, 'rb') as image_file:
-                    product = Product(
-                        name=image_filename,
-                        price=100.00
-                    )
-                    product.image.save(image_filename, File(image_file))
-                    product.save()
-        self.stdout.write(self.style.SUCCESS('Изображения успешно загружены'))
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=os.path.join(settings.MEDIA_ROOT, "products"),
+                            help="Папка с изображениями (по умолчанию media/products)")
+        parser.add_argument("--batch-size", type=int, default=500, help="Товаров в одном INSERT")
+        parser.add_argument("--workers", type=int, default=None, help="Потоков для хеширования")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        paths = sorted(os.path.realpath(entry.path) for entry in os.scandir(options["dir"])
+                       if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS))
+
+        # Изображения существующих товаров: имя по хешу уже содержит sha256, старые имена хешируем
+        known, legacy = set(), set()
+        for image in Product.objects.exclude(image="").values_list("image", flat=True).distinct():
+            stem = os.path.splitext(os.path.basename(image))[0]
+            if HASHED_STEM_RE.match(stem):
+                known.add(stem)
+            elif os.path.isfile(product_image_storage.path(image)):
+                legacy.add(os.path.realpath(product_image_storage.path(image)))
+
+        # ✅ Хеширование — чтение файлов, sha256 отпускает GIL: потоков достаточно
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            digests = dict(pool.map(hash_file, sorted(legacy.union(paths))))
+        known.update(digests[path] for path in legacy)
+
+        # Одинаковые файлы в папке дают один товар; известные по содержимому изображения пропускаем
+        names = {}
+        for path in paths:
+            if digests[path] not in known:
+                names.setdefault(hashed_name(f"products/{os.path.basename(path)}", digests[path]), path)
+
+        products = []
+        for name, path in names.items():
+            if not product_image_storage.exists(name):
+                with open(path, "rb") as image_file:
+                    product_image_storage.save(name, File(image_file))
+            products.append(Product(name=os.path.basename(path), price=100.00, image=name))
+
+        # bulk_create не вызывает сигналы — поисковый индекс обновляем сами
+        created = []
+        if products:
+            with transaction.atomic():
+                created = Product.objects.bulk_create(products, batch_size=options["batch_size"])
+                index_products(created)
 
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Изображения успешно загружены: новых товаров {len(created)}, "
+            f"пропущено {len(paths) - len(created)} из {len(paths)} файлов за {elapsed:.2f} с"
+        ))
+        if created:
+            self.stdout.write("Уменьшенные копии: python manage.py generate_thumbnails")
@@ -0,0 +1,25 @@
+# core/management/commands/rebuild_sales_rollup.py
+
+from django.core.management.base import BaseCommand, CommandError
+from reports.analytics import rebuild_daily_sales, verify_daily_sales
+
+
+class Command(BaseCommand):
+    help = 'Rebuild (or verify) the daily sales rollup from raw orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true",
+                            help="Только сверить сводку с заказами, ничего не меняя")
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            mismatches = verify_daily_sales()
+            for day, status, actual, expected in mismatches:
+                self.stdout.write(f"{day} {status}: в сводке {actual}, по заказам {expected}")
+            if mismatches:
+                raise CommandError(f"Найдено расхождений: {len(mismatches)}")
+            self.stdout.write(self.style.SUCCESS("Сводка совпадает с заказами"))
+            return
+
+        rows = rebuild_daily_sales()
+        self.stdout.write(self.style.SUCCESS(f"Сводка пересчитана: {rows} строк"))
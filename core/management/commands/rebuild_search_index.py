@@ -0,0 +1,15 @@
+# core/management/commands/rebuild_search_index.py
+
+from django.core.management.base import BaseCommand
+from core.search import fts_enabled, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product name search index (SQLite FTS5) from the products table'
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            self.stdout.write("Полнотекстовый индекс не используется: поиск идет через icontains")
+            return
+        rows = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Индекс пересобран: {rows} товаров"))
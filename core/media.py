@@ -0,0 +1,155 @@
+"""
+media.py – раздача загруженных файлов (media/) с заголовками кэширования.
+
+- Файлы с именем по хешу содержимого (core/storage.py и их уменьшенные копии) не меняются:
+  Cache-Control на год с immutable — браузер не перепроверяет их вовсе.
+  Остальные кэшируются на MEDIA_MAX_AGE секунд и перепроверяются по ETag/Last-Modified (304).
+- Range: отдается один диапазон байт (206), недостижимый — 416; несколько диапазонов
+  и устаревший If-Range — весь файл.
+- Если задан MEDIA_SENDFILE, файл отдает веб-сервер (X-Accel-Redirect у nginx,
+  X-Sendfile у Apache/lighttpd); иначе — FileResponse, который WSGI-сервер с
+  wsgi.file_wrapper (gunicorn и др.) отправляет через sendfile без копирования в Python.
+"""
+import mimetypes
+import os
+import re
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .conditional import conditional
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+HASHED_NAME_RE = re.compile(r"(^|/)[0-9a-f]{64}(_\d+w)?\.\w+$")  # products/<sha256>.jpg, thumbs/.../<sha256>_640w.webp
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    """Диапазон начинается за концом файла"""
+
+
+def parse_range(header, size):
+    """
+    (первый, последний байт) из заголовка Range для файла размером `size`.
+
+    None — заголовок не разобран или диапазонов несколько: отдаем весь файл.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:  # bytes=-500 — последние 500 байт
+        if int(last) == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+class FileRange:
+    """Часть открытого файла для FileResponse: read() не выходит за конец диапазона, fileno() — для sendfile"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size) if size > 0 else b""
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def media_file(request, path):
+    """(полный путь, os.stat) файла из MEDIA_ROOT; один раз на запрос, Http404 — если файла нет"""
+    if not hasattr(request, "_media_file"):
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+            stat = os.stat(full_path)
+        except (SuspiciousFileOperation, OSError):
+            raise Http404("Файл не найден")
+        if not os.path.isfile(full_path):
+            raise Http404("Файл не найден")
+        request._media_file = full_path, stat
+    return request._media_file
+
+
+def media_state(request, path):
+    """Состояние для ETag: файлу с именем по хешу хватает имени, остальным — время изменения и размер"""
+    _, stat = media_file(request, path)
+    parts = ("media", path) if HASHED_NAME_RE.search(path) else ("media", path, stat.st_mtime_ns, stat.st_size)
+    return parts, datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+
+
+@conditional(media_state)
+def serve_media(request, path):
+    """Отдает файл из MEDIA_ROOT (вместо django.views.static.serve)"""
+    full_path, stat = media_file(request, path)
+    content_type, _ = mimetypes.guess_type(full_path)
+    content_type = content_type or "application/octet-stream"
+
+    if settings.MEDIA_SENDFILE == "x-accel-redirect":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    elif settings.MEDIA_SENDFILE == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = full_path
+    else:
+        response = file_response(request, full_path, stat.st_size, content_type)
+
+    if HASHED_NAME_RE.search(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_MAX_AGE)
+    return response
+
+
+def file_response(request, full_path, size, content_type):
+    """FileResponse на весь файл или на диапазон из заголовка Range"""
+    byte_range = None
+    header = request.headers.get("Range")
+    if header and if_range_matches(request):
+        try:
+            byte_range = parse_range(header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    file = open(full_path, "rb")
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end - start + 1), status=206, content_type=content_type)
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def if_range_matches(request):
+    """If-Range: диапазон отдаем, только если у клиента та же версия файла (ETag или дата)"""
+    validator = request.headers.get("If-Range")
+    if not validator:
+        return True
+    etag, last_modified = request._conditional_state
+    return validator in (quote_etag(etag), http_date(last_modified.timestamp()))
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:05
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_daily_sales(apps, schema_editor):
+    """Заполняет сводку по уже существующим заказам"""
+    Order = apps.get_model('core', 'Order')
+    DailySales = apps.get_model('core', 'DailySales')
+    rows = (Order.objects.order_by()
+            .annotate(day=TruncDate('order_date'))
+            .values('day', 'status')
+            .annotate(count=Count('id'), revenue=Sum('price')))
+    DailySales.objects.bulk_create([
+        DailySales(date=row['day'], status=row['status'], orders=row['count'], revenue=row['revenue'] or 0)
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_report_canceled_orders_report_canceled_revenue_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('status', models.CharField(choices=[('pending', 'В обработке'), ('processing', 'В работе'), ('delivering', 'В доставке'), ('completed', 'Выполнен'), ('canceled', 'Отменён')], max_length=20, verbose_name='Статус')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказы')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+            ],
+            options={
+                'verbose_name': 'Сводка продаж за день',
+                'verbose_name_plural': 'Сводки продаж по дням',
+                'constraints': [models.UniqueConstraint(fields=('date', 'status'), name='unique_daily_sales_date_status')],
+            },
+        ),
+        migrations.RunPython(fill_daily_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:07
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def drop_duplicate_reports(apps, schema_editor):
+    """Оставляет по одному (самому свежему) отчету на каждую дату"""
+    Report = apps.get_model('core', 'Report')
+    latest_ids = Report.objects.values('date').annotate(latest=Max('id')).values_list('latest', flat=True)
+    Report.objects.exclude(id__in=list(latest_ids)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_dailysales'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_reports, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='report',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate, unique=True, verbose_name='Дата отчета'),
+        ),
+    ]
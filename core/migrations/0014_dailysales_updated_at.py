@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_order_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailysales',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Обновлено'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Перевод Order.products на промежуточную модель OrderItem (количество и цена на момент покупки)
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_products_to_items(apps, schema_editor):
+    """Переносит связи заказ–товар в позиции: количество 1, цена — текущая цена товара"""
+    Order = apps.get_model('core', 'Order')
+    OrderItem = apps.get_model('core', 'OrderItem')
+    links = (Order.products.through.objects
+             .values_list('order_id', 'product_id', 'product__price')
+             .order_by('id'))
+
+    batch = []
+    for order_id, product_id, price in links.iterator(chunk_size=2000):
+        batch.append(OrderItem(order_id=order_id, product_id=product_id, quantity=1, unit_price=price))
+        if len(batch) >= 2000:
+            OrderItem.objects.bulk_create(batch)
+            batch = []
+    OrderItem.objects.bulk_create(batch)
+
+
+def copy_items_to_products(apps, schema_editor):
+    """Обратный перенос: позиции снова становятся простыми связями (количество теряется)"""
+    Order = apps.get_model('core', 'Order')
+    OrderItem = apps.get_model('core', 'OrderItem')
+    through = Order.products.through
+    through.objects.bulk_create(
+        [through(order_id=order_id, product_id=product_id)
+         for order_id, product_id in OrderItem.objects.values_list('order_id', 'product_id')],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_dailysales_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Количество')),
+                ('unit_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, verbose_name='Цена за штуку')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='core.order', verbose_name='Заказ')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='core.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Позиция заказа',
+                'verbose_name_plural': 'Позиции заказа',
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='unique_order_item_product')],
+            },
+        ),
+        migrations.RunPython(copy_products_to_items, copy_items_to_products),
+        migrations.RemoveField(
+            model_name='order',
+            name='products',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='products',
+            field=models.ManyToManyField(through='core.OrderItem', to='core.product', verbose_name='Товары'),
+        ),
+    ]
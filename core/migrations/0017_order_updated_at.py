@@ -0,0 +1,30 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:28
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_updated_at(apps, schema_editor):
+    """Существующие заказы считаем измененными в момент оформления"""
+    Order = apps.get_model('core', 'Order')
+    Order.objects.update(updated_at=F('order_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_order_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Изменен'),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at'], name='order_updated_at_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_status', models.CharField(choices=[('pending', 'В обработке'), ('processing', 'В работе'), ('delivering', 'В доставке'), ('completed', 'Выполнен'), ('canceled', 'Отменён')], max_length=20, verbose_name='Был статус')),
+                ('new_status', models.CharField(choices=[('pending', 'В обработке'), ('processing', 'В работе'), ('delivering', 'В доставке'), ('completed', 'Выполнен'), ('canceled', 'Отменён')], max_length=20, verbose_name='Стал статус')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, verbose_name='Когда')),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Кто изменил')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_changes', to='core.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Смена статуса заказа',
+                'verbose_name_plural': 'История статусов заказов',
+                'ordering': ('order', 'changed_at', 'id'),
+                'indexes': [models.Index(fields=['order', 'changed_at'], name='status_change_order_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    """Полнотекстовый индекс названий товаров (только SQLite с FTS5; иначе поиск идет через icontains)"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Product = apps.get_model('core', 'Product')
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE core_product_search USING fts5("
+                "name, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        except OperationalError:  # SQLite собран без FTS5
+            return
+        rows = [(product_id, name.lower().replace('ё', 'е'))
+                for product_id, name in Product.objects.values_list('id', 'name')]
+        cursor.executemany("INSERT INTO core_product_search (rowid, name) VALUES (%s, %s)", rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS core_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_order_status_change'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
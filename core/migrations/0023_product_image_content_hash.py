@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-18 14:08
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_product_image_size'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(storage=core.storage.ContentHashStorage(), upload_to='products/', verbose_name='Изображение'),
+        ),
+    ]
@@ -1,7 +1,14 @@
 # Модели базы данных
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum
+from decimal import Decimal
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+
+from . import thumbnails
+from .storage import product_image_storage
 
 
 class User(AbstractUser):
@@ -32,11 +39,46 @@ class Product(models.Model):
     """Модель для хранения информации о цветах"""
     name = models.CharField(max_length=255, verbose_name="Название")
     price = models.DecimalField(max_digits=10, decimal_places=2, default=1000.0, verbose_name="Цена")
-    image = models.ImageField(upload_to="products/", verbose_name="Изображение")
+    # Имя файла — хеш содержимого (core/storage.py): одинаковые изображения хранятся один раз
+    image = models.ImageField(upload_to="products/", storage=product_image_storage, verbose_name="Изображение")
+    # Размеры оригинала заполняются при создании уменьшенных копий (core/thumbnails.py); None — копий еще нет
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Ширина изображения")
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Высота изображения")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменен")  # Для ETag каталога
 
     def __str__(self):
         return self.name
 
+    @property
+    def image_srcset_webp(self):
+        return thumbnails.srcset(self.image.name, self.image_width, "webp")
+
+    @property
+    def image_srcset_jpeg(self):
+        return thumbnails.srcset(self.image.name, self.image_width, "jpg")
+
+    def thumbnail_url(self, width):
+        """URL JPEG-копии не шире `width` (или оригинала, если копий нет)"""
+        widths = [w for w in thumbnails.available_widths(self.image_width) if w <= width]
+        if not widths:
+            return self.image.url
+        return default_storage.url(thumbnails.thumbnail_name(self.image.name, widths[-1], "jpg"))
+
+    @property
+    def image_card_url(self):
+        """Изображение для карточки каталога, если браузер не поддерживает srcset"""
+        return self.thumbnail_url(640)
+
+    @property
+    def image_small_url(self):
+        """Маленькое изображение (корзина)"""
+        return self.thumbnail_url(320)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["updated_at"], name="product_updated_at_idx"),  # Состояние каталога для ETag
+        ]
+
 
 class Order(models.Model):
     """Модель заказа"""
@@ -49,24 +91,91 @@ class Order(models.Model):
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
-    products = models.ManyToManyField(Product, verbose_name="Товары")
+    products = models.ManyToManyField(Product, through="OrderItem", verbose_name="Товары")
+    # Сумма заказа хранится денормализованно: сумма позиций по ценам на момент покупки
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
     order_date = models.DateTimeField(auto_now_add=True, verbose_name="Дата заказа")
+    # Время последнего изменения — водяной знак для выгрузки изменений (/api/orders/changes/).
+    # QuerySet.update() и save(update_fields=...) его не обновляют: передавайте updated_at явно
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменен")
     delivery_address = models.CharField(max_length=255, blank=True, null=True,
                                         verbose_name="Адрес доставки")
 
     @property
     def total_price(self):
-        return sum(product.price for product in self.products.all())    # ✅ Вычисляем сумму заказа
+        return self.price    # ✅ Сохраненная сумма заказа, без запроса к товарам
+
+    def recalculate_price(self):
+        """Пересчитывает сохраненную сумму по позициям заказа (не сохраняет заказ)"""
+        total = self.items.aggregate(total=Sum(F("quantity") * F("unit_price"), output_field=models.DecimalField()))
+        self.price = total["total"] or Decimal("0")
+        return self.price
 
     def __str__(self):
         return f"Заказ {self.id} - {self.user.username}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["order_date"], name="order_date_idx"),  # Выборки заказов за период
+            models.Index(fields=["user", "order_date"], name="order_user_date_idx"),  # Заказы покупателя по дате
+            models.Index(fields=["status", "order_date"], name="order_status_date_idx"),  # Фильтр по статусу и дате
+            models.Index(fields=["updated_at"], name="order_updated_at_idx"),  # Выгрузка изменений по водяному знаку
+        ]
+
+
+class OrderItem(models.Model):
+    """Позиция заказа: товар, количество и цена за штуку на момент покупки"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items", verbose_name="Заказ")
+    # Товар с продажами удалить нельзя: позиции — история заказов, по ним считаются сумма заказа и продажи
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name="order_items", verbose_name="Товар")
+    quantity = models.PositiveIntegerField(default=1, verbose_name="Количество")
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, verbose_name="Цена за штуку")
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:  # Если цена не указана — фиксируем текущую цену товара
+            self.unit_price = self.product.price
+        super().save(*args, **kwargs)
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_price
+
+    def __str__(self):
+        return f"{self.product} × {self.quantity}"
+
+    class Meta:
+        verbose_name = "Позиция заказа"
+        verbose_name_plural = "Позиции заказа"
+        constraints = [
+            models.UniqueConstraint(fields=["order", "product"], name="unique_order_item_product"),
+        ]
+
+
+class OrderStatusChange(models.Model):
+    """История статусов заказа: одна строка на переход, только добавляется (см. order_status.py)"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="status_changes", verbose_name="Заказ")
+    old_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Был статус")
+    new_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Стал статус")
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name="+", verbose_name="Кто изменил")
+    changed_at = models.DateTimeField(auto_now_add=True, verbose_name="Когда")
+
+    def __str__(self):
+        return f"Заказ {self.order_id}: {self.old_status} → {self.new_status}"
+
+    class Meta:
+        verbose_name = "Смена статуса заказа"
+        verbose_name_plural = "История статусов заказов"
+        ordering = ("order", "changed_at", "id")
+        indexes = [
+            models.Index(fields=["order", "changed_at"], name="status_change_order_idx"),
+        ]
+
 
 class Report(models.Model):
     """Модель отчета по заказам с разбивкой по статусам"""
-    date = models.DateField(auto_now_add=True, verbose_name="Дата отчета")
+    date = models.DateField(default=timezone.localdate, unique=True, verbose_name="Дата отчета")
 
     # Общие суммы и количество
     total_orders = models.PositiveIntegerField(default=0, verbose_name="Всего заказов")
@@ -96,3 +205,31 @@ class Report(models.Model):
         verbose_name = "Отчет"
         verbose_name_plural = "Отчеты"
 
+
+
+class DailySales(models.Model):
+    """Суточная сводка продаж по статусам: поддерживается сигналами при каждом изменении заказа"""
+    date = models.DateField(verbose_name="Дата")
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Статус")
+    orders = models.IntegerField(default=0, verbose_name="Заказы")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Выручка")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")  # По нему инвалидируется кэш отчетов
+
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.orders} шт."
+
+    @classmethod
+    def apply(cls, date, status, orders, revenue):
+        """Атомарно добавляет приращение к строке (date, status), создавая её при необходимости"""
+        with transaction.atomic():
+            cls.objects.get_or_create(date=date, status=status)
+            cls.objects.filter(date=date, status=status).update(
+                orders=F("orders") + orders, revenue=F("revenue") + revenue, updated_at=timezone.now()
+            )
+
+    class Meta:
+        verbose_name = "Сводка продаж за день"
+        verbose_name_plural = "Сводки продаж по дням"
+        constraints = [
+            models.UniqueConstraint(fields=["date", "status"], name="unique_daily_sales_date_status"),
+        ]
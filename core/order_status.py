@@ -0,0 +1,145 @@
+"""
+order_status.py – смена статусов заказов по автомату переходов (одиночная, массовая, админка, бот).
+
+Каждый переход — условный UPDATE: `WHERE id IN (...) AND status = <прочитанный статус>`,
+а прочитанный статус заранее проверен по ALLOWED_TRANSITIONS. Если заказ успели
+изменить параллельно, UPDATE затронет меньше строк — транзакция откатывается
+и пакет перечитывается заново, так что ни одна запись не теряется молча.
+В той же транзакции пишется история (OrderStatusChange).
+
+QuerySet.update() не вызывает сигналы, поэтому здесь вручную делается то же, что
+в signals.py: ставится updated_at (по нему меняется версия "orders") и переносятся
+заказы в суточной сводке (DailySales).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DailySales, Order, OrderStatusChange
+from .signals import _rollup_key
+
+# Разрешенные переходы: из какого статуса в какие можно перевести заказ
+ALLOWED_TRANSITIONS = {
+    "pending": {"processing", "canceled"},
+    "processing": {"delivering", "completed", "canceled"},
+    "delivering": {"completed", "canceled"},
+    "completed": set(),
+    "canceled": set(),
+}
+MAX_BULK_CHANGES = 500  # Больше заказов за один вызов не принимаем
+MAX_ATTEMPTS = 3  # Сколько раз перечитывать пакет при параллельном изменении
+
+
+def predecessors(new_status):
+    """Статусы, из которых разрешен переход в `new_status`"""
+    return {status for status, targets in ALLOWED_TRANSITIONS.items() if new_status in targets}
+
+
+class StatusConflict(Exception):
+    """Статус заказов менялся параллельно все MAX_ATTEMPTS попыток (пакет откатывается)"""
+
+
+def parse_status_changes(data):
+    """
+    Пары (id заказа, новый статус) из тела запроса.
+
+    Принимается {"orders": [{"id": 1, "status": "processing"}, ...]}
+    или {"ids": [1, 2], "status": "processing"}; ValueError, если тело неверное.
+    """
+    if "ids" in data:
+        items = [{"id": order_id, "status": data.get("status")} for order_id in data["ids"] or ()]
+    else:
+        items = data.get("orders")
+    if not isinstance(items, list) or not items:
+        raise ValueError("Передайте непустой список orders или ids со status")
+    if len(items) > MAX_BULK_CHANGES:
+        raise ValueError(f"Не больше {MAX_BULK_CHANGES} заказов за один запрос")
+
+    changes = []
+    for item in items:
+        try:
+            changes.append((int(item["id"]), str(item["status"])))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Неверный элемент: {item}")
+    return changes
+
+
+def bulk_update_status(user, changes):
+    """
+    Применяет пары (id заказа, новый статус) от имени `user`; результаты — в порядке пар.
+
+    Результат: {"id", "result", "status"}, где result — updated, unchanged, not_found,
+    forbidden, invalid_status, invalid_transition или duplicate. Персонал меняет любые
+    заказы, пользователь — только свои. StatusConflict, если пакет не удалось применить целиком.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            return _apply_changes(user, changes)
+        except StatusConflict:
+            continue  # Перечитываем: переход мог стать недопустимым или уже выполненным
+    raise StatusConflict("Статус заказов меняется параллельно, повторите запрос")
+
+
+def transition_status(user, order_id, new_status):
+    """Переход одного заказа; результат как у bulk_update_status"""
+    return bulk_update_status(user, [(order_id, new_status)])[0]
+
+
+def _apply_changes(user, changes):
+    """Одна попытка применить пакет; StatusConflict, если заказ изменили параллельно"""
+    with transaction.atomic():
+        ids = {order_id for order_id, _ in changes}
+        orders = {
+            row["id"]: row for row in Order.objects.select_for_update().filter(id__in=ids)
+            .values("id", "user_id", "status", "order_date", "price")
+        }
+
+        results = []
+        groups = defaultdict(list)  # (старый статус, новый) → id заказов
+        seen = set()
+        for order_id, new_status in changes:
+            order = orders.get(order_id)
+            if order_id in seen:
+                result = "duplicate"
+            elif order is None:
+                result = "not_found"
+            elif not (user.is_staff or order["user_id"] == user.pk):
+                result = "forbidden"
+            elif new_status not in ALLOWED_TRANSITIONS:
+                result = "invalid_status"
+            elif new_status == order["status"]:
+                result = "unchanged"
+            elif order["status"] not in predecessors(new_status):
+                result = "invalid_transition"
+            else:
+                result = "updated"
+                groups[order["status"], new_status].append(order_id)
+            seen.add(order_id)
+            visible = order is not None and result not in ("forbidden", "duplicate")
+            results.append({"id": order_id, "result": result,
+                            "status": (new_status if result == "updated" else order["status"]) if visible else None})
+
+        now = timezone.now()
+        history = []
+        deltas = defaultdict(lambda: [0, 0])  # (день, статус) → [заказов, выручка]
+        for (old_status, new_status), group in groups.items():
+            # Условие по прочитанному статусу: SQLite не блокирует строки при чтении
+            updated = Order.objects.filter(id__in=group, status=old_status).update(status=new_status, updated_at=now)
+            if updated != len(group):
+                raise StatusConflict("Статус части заказов изменился во время обновления")
+            for order_id in group:
+                order = orders[order_id]
+                history.append(OrderStatusChange(order_id=order_id, old_status=old_status, new_status=new_status,
+                                                 changed_by=user if user.pk else None))
+                for status, sign in ((old_status, -1), (new_status, 1)):
+                    day, status, revenue = _rollup_key(order["order_date"], status, order["price"])
+                    deltas[day, status][0] += sign
+                    deltas[day, status][1] += sign * revenue
+
+        OrderStatusChange.objects.bulk_create(history)
+        for (day, status), (count, revenue) in deltas.items():
+            if count or revenue:
+                DailySales.apply(day, status, count, revenue)
+
+    return results
@@ -0,0 +1,133 @@
+"""
+pagination.py – курсорная (keyset) пагинация списков заказов и товаров.
+
+Страница выбирается условием по ключу (order_date, id) последнего заказа предыдущей
+страницы, а не OFFSET: время ответа не зависит от номера страницы и размера таблицы.
+Курсор — непрозрачная строка, новые заказы не сдвигают уже выданные страницы.
+"""
+import base64
+import binascii
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(moment, order_id):
+    """Курсор из ключа (время, id) заказа: микросекунды от эпохи и id в urlsafe base64 без '='"""
+    micros = (moment - EPOCH) // timedelta(microseconds=1)
+    raw = f"{micros}:{order_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Обратное к encode_cursor; ValueError, если курсор поврежден"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        micros, order_id = raw.split(":")
+        return EPOCH + timedelta(microseconds=int(micros)), int(order_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError, OverflowError):
+        raise ValueError(f"Неверный курсор: {cursor}")
+
+
+def after_key(queryset, order_date, order_id):
+    """Заказы после ключа (order_date, id) в порядке от новых к старым"""
+    # Лишнее на вид order_date__lte дает планировщику диапазон по индексу order_date
+    return queryset.filter(
+        Q(order_date__lt=order_date) | Q(order_date=order_date, id__lt=order_id),
+        order_date__lte=order_date,
+    )
+
+
+class OrderCursorPagination(BasePagination):
+    """
+    Заказы от новых к старым страницами по `page_size` (`?page_size=`, не больше `max_page_size`).
+
+    Ответ: {"next": ссылка на следующую страницу или null, "results": [...]}.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    ordering = ("-order_date", "-id")
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                queryset = self.after_cursor(queryset, cursor)
+            except ValueError as error:
+                raise NotFound(str(error))
+
+        # Одна лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+        page = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(page) > self.page_size_value
+        page = page[:self.page_size_value]
+        self.next_cursor = self.make_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def after_cursor(self, queryset, cursor):
+        """Строки после курсора; ValueError, если курсор поврежден"""
+        return after_key(queryset, *decode_cursor(cursor))
+
+    def make_cursor(self, row):
+        """Курсор, указывающий на строку `row`"""
+        return encode_cursor(*self.row_key(row))
+
+    @staticmethod
+    def row_key(row):
+        """Ключ (order_date, id) заказа — объекта модели или строки values()"""
+        if isinstance(row, dict):
+            return row["order_date"], row["id"]
+        return row.order_date, row.id
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class ProductCursorPagination(OrderCursorPagination):
+    """Товары по возрастанию id страницами по `page_size`; курсор — id последнего товара страницы"""
+    ordering = ("id",)
+
+    def after_cursor(self, queryset, cursor):
+        try:
+            product_id = int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise ValueError(f"Неверный курсор: {cursor}")
+        return queryset.filter(id__gt=product_id)
+
+    def make_cursor(self, row):
+        product_id = row["id"] if isinstance(row, dict) else row.id
+        return base64.urlsafe_b64encode(str(product_id).encode()).decode().rstrip("=")
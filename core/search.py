@@ -0,0 +1,89 @@
+"""
+search.py – поиск товаров по названию.
+
+На SQLite поиск идет по полнотекстовому индексу FTS5 (таблица core_product_search,
+rowid = id товара): каждое слово запроса ищется как префикс, так что «роз» находит
+«Розы». Индекс обновляется сигналами при сохранении и удалении товара (signals.py);
+после bulk_create/update() его нужно пересобрать командой
+`python manage.py rebuild_search_index`. На других СУБД (или если FTS5 недоступен)
+используется icontains по каждому слову.
+"""
+import functools
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+SEARCH_TABLE = "core_product_search"
+
+
+def normalize(text):
+    """Текст для индекса и запроса: нижний регистр, «ё» как «е» (unicode61 их не сводит)"""
+    return text.lower().replace("ё", "е")
+
+
+def search_terms(query):
+    """Слова поискового запроса"""
+    return re.findall(r"\w+", normalize(query or ""))
+
+
+@functools.cache
+def _table_exists(alias):
+    return SEARCH_TABLE in connection.introspection.table_names()
+
+
+def fts_enabled():
+    """Есть ли полнотекстовый индекс товаров в текущей базе"""
+    return connection.vendor == "sqlite" and _table_exists(connection.alias)
+
+
+def search_products(queryset, query):
+    """Товары из `queryset`, в названии которых есть все слова `query` (по началу слова на FTS5)"""
+    terms = search_terms(query)
+    if not terms:
+        return queryset if not query else queryset.none()
+
+    if fts_enabled():
+        match = " ".join(f'"{term}"*' for term in terms)
+        ids = RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", (match,))
+        return queryset.filter(id__in=ids)
+
+    for term in terms:
+        queryset = queryset.filter(name__icontains=term)
+    return queryset
+
+
+def index_product(product_id, name):
+    """Добавляет или обновляет название товара в индексе"""
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [product_id])
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE} (rowid, name) VALUES (%s, %s)", [product_id, normalize(name)])
+
+
+def index_products(products):
+    """Добавляет в индекс только что созданные товары одним executemany (для bulk_create)"""
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, name) VALUES (%s, %s)",
+                               [(product.pk, normalize(product.name)) for product in products])
+
+
+def unindex_product(product_id):
+    """Убирает товар из индекса"""
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [product_id])
+
+
+def rebuild_search_index():
+    """Пересобирает индекс по всем товарам; возвращает число проиндексированных товаров"""
+    if not fts_enabled():
+        return 0
+    rows = [(product_id, normalize(name)) for product_id, name in Product.objects.values_list("id", "name")]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, name) VALUES (%s, %s)", rows)
+    return len(rows)
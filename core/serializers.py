@@ -1,19 +1,44 @@
 from rest_framework import serializers
-from .models import Order, Product
+from .models import Order, OrderItem, Product
 
-class ProductSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Сериализатор только с частью полей: Serializer(..., fields={"id", "status"}) (для ?fields=)"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
+        fields = ["id", "name", "price", "image", "updated_at"]  # Размеры изображения — служебные, в API не отдаем
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ["product", "quantity", "unit_price"]
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # ✅ Сериализация связанных товаров
     products = ProductSerializer(many=True)
 
+    # ✅ Позиции заказа: количество и цена за штуку на момент покупки
+    items = OrderItemSerializer(many=True, read_only=True)
+
     # ✅ Переименовываем order_date → created_at для соответствия в боте
     created_at = serializers.DateTimeField(source="order_date")
 
     class Meta:
         model = Order
-        fields = ["id", "user", "products", "status", "order_date", "created_at", "total_price",
-                  "delivery_address"]  # ✅ Добавили delivery_address
\ No newline at end of file
+        fields = ["id", "user", "products", "items", "status", "order_date", "created_at", "updated_at",
+                  "total_price", "delivery_address"]  # ✅ Добавили delivery_address
+
+class OrderSideloadSerializer(OrderSerializer):
+    """Заказ, где товары — список id; сами товары передаются один раз рядом со списком (?include=products)"""
+    products = serializers.SerializerMethodField()
+
+    def get_products(self, order):
+        return [item.product_id for item in order.items.all()]  # ✅ Из уже загруженных позиций, без запроса
@@ -0,0 +1,150 @@
+"""
+signals.py – поддержка суточной сводки продаж (DailySales) и версий данных в актуальном состоянии.
+
+Сводка меняется при создании заказа, изменении его цены, статуса или даты и при удалении.
+Массовые QuerySet.update()/bulk_create() сигналы не вызывают — после них сводку
+нужно пересчитать командой `python manage.py rebuild_sales_rollup`
+(массовая смена статусов в order_status.py переносит заказы в сводке сама).
+
+Изменение позиций заказа обновляет updated_at самого заказа — по нему считается
+версия "orders" (см. versions.py), по которой инвалидируются кэши аналитики.
+
+Удаление токена и изменение пользователя сбрасывают кэш аутентификации (см. authentication.py),
+сохранение и удаление товара обновляют поисковый индекс (см. search.py),
+загрузка нового изображения товара создает его уменьшенные копии (см. thumbnails.py).
+"""
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_token, forget_user
+from .models import DailySales, Order, OrderItem, Product, User
+from .search import index_product, unindex_product
+from .thumbnails import generate_thumbnails
+
+ROLLUP_FIELDS = ("order_date", "status", "price")
+CENTS = Decimal("0.01")
+
+
+def _rollup_key(order_date, status, price):
+    """Переводит значения заказа в (день, статус, выручка) для сводки"""
+    return timezone.localdate(order_date), status, Decimal(str(price or 0)).quantize(CENTS)
+
+
+def _loaded_state(instance):
+    """Значения полей сводки без обращения к БД (None, если часть полей отложена через only()/defer())"""
+    values = instance.__dict__
+    if any(field not in values for field in ROLLUP_FIELDS) or values["order_date"] is None:
+        return None
+    return values["order_date"], values["status"], values["price"]
+
+
+@receiver(post_init, sender=Order)
+def remember_rollup_state(sender, instance, **kwargs):
+    """Запоминаем состояние заказа при загрузке, чтобы после save() посчитать разницу"""
+    instance._rollup_state = None if instance._state.adding else _loaded_state(instance)
+
+
+@receiver(pre_save, sender=Order)
+def load_missing_rollup_state(sender, instance, **kwargs):
+    """Если заказ был загружен с отложенными полями, дочитываем их прежние значения из БД"""
+    if instance._state.adding or instance._rollup_state is not None:
+        return
+    instance._rollup_state = (
+        Order.objects.filter(pk=instance.pk).values_list(*ROLLUP_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=Order)
+def update_daily_sales(sender, instance, created, **kwargs):
+    """Переносит заказ в сводке из старой ячейки (день, статус) в новую"""
+    new_state = (instance.order_date, instance.status, instance.price)
+    old_state = None if created else instance._rollup_state
+    new_key = _rollup_key(*new_state)
+    old_key = None if old_state is None else _rollup_key(*old_state)
+
+    if old_key != new_key:
+        if old_key is not None:
+            day, status, revenue = old_key
+            DailySales.apply(day, status, -1, -revenue)
+        day, status, revenue = new_key
+        DailySales.apply(day, status, 1, revenue)
+
+    instance._rollup_state = new_state
+
+
+@receiver(post_delete, sender=Order)
+def remove_from_daily_sales(sender, instance, **kwargs):
+    """Убирает удаленный заказ из сводки"""
+    state = instance._rollup_state or _loaded_state(instance)
+    if state is not None:
+        day, status, revenue = _rollup_key(*state)
+        DailySales.apply(day, status, -1, -revenue)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def touch_order(sender, instance, **kwargs):
+    """Изменение позиции меняет updated_at заказа: так его видят версия "orders", ETag и /api/orders/changes/"""
+    Order.objects.filter(pk=instance.order_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+def index_product_name(sender, instance, **kwargs):
+    """Новое или измененное название товара попадает в поисковый индекс"""
+    index_product(instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product_name(sender, instance, **kwargs):
+    """Удаленный товар убирается из поискового индекса"""
+    unindex_product(instance.pk)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def forget_cached_token(sender, instance, **kwargs):
+    """
+    Удаленный или пересохраненный токен больше не берется из кэша аутентификации.
+
+    Сбрасываем сразу и еще раз после фиксации: параллельный запрос мог успеть
+    закэшировать старое состояние до конца транзакции.
+    """
+    forget_token(instance.key)
+    transaction.on_commit(lambda: forget_token(instance.key))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    """Любое сохранение пользователя (is_staff, is_active, адрес и т.д.) сбрасывает его токены в кэше"""
+    forget_user(instance.pk)
+    transaction.on_commit(lambda: forget_user(instance.pk))
+
+
+@receiver(pre_save, sender=Product)
+def remember_image_upload(sender, instance, **kwargs):
+    """Запоминаем, загружен ли новый файл: FileField сохранит его уже после этого сигнала"""
+    instance._image_uploaded = bool(instance.image) and not instance.image._committed
+
+
+@receiver(post_save, sender=Product)
+def create_thumbnails(sender, instance, **kwargs):
+    """Для нового изображения сразу создаются уменьшенные копии и запоминаются размеры оригинала"""
+    if not getattr(instance, "_image_uploaded", False):
+        return
+    try:
+        width, height, _ = generate_thumbnails(instance.image.name)  # Копии — в default_storage: имена по хешу им не нужны
+    except OSError as error:  # Битый файл не должен мешать сохранить товар — копии создаст команда
+        logging.warning(f"Не удалось создать копии {instance.image.name}: {error}")
+        return
+    # update() не трогает updated_at — ставим сами, чтобы сменились версия "products", ETag и кэш каталога
+    instance.updated_at = timezone.now()
+    Product.objects.filter(pk=instance.pk).update(image_width=width, image_height=height,
+                                                  updated_at=instance.updated_at)
+    instance.image_width, instance.image_height = width, height
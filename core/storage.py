@@ -0,0 +1,55 @@
+"""
+storage.py – хранилище изображений товаров с именами по содержимому.
+
+Файл сохраняется как products/<sha256>.jpg: одинаковые загрузки получают одно
+и то же имя и делят один файл, а повторная загрузка ничего не пишет на диск
+(раньше Django добавлял к имени случайный суффикс: flower1_djQbv2t.jpg).
+Файлы неизменяемы — новое содержимое всегда дает новое имя.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(file):
+    """sha256 содержимого файла (читается частями, позиция возвращается в начало)"""
+    digest = hashlib.sha256()
+    if hasattr(file, "seek"):
+        file.seek(0)
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    """Имя по содержимому в том же каталоге и с тем же расширением: products/a.JPG → products/<digest>.jpg"""
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, f"{digest}{extension}")
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """FileSystemStorage, который называет файлы по sha256 содержимого и не хранит дубликаты"""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        name = hashed_name(name, content_hash(content))
+        if self.exists(name):
+            return name  # Такой файл уже есть — делим его
+        return super().save(name, content, max_length)
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name  # Параллельная загрузка того же файла успела раньше
+        return super()._save(name, content)
+
+
+product_image_storage = ContentHashStorage()
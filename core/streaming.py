@@ -0,0 +1,63 @@
+"""
+streaming.py – потоковая выгрузка всех заказов в JSON или NDJSON.
+
+Заказы читаются порциями по ключу (order_date, id), каждая порция сериализуется
+быстрым путем (fast_serializers) и сразу отдается клиенту: память не зависит от
+числа заказов, весь список и весь ответ целиком не собираются.
+"""
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from .fast_serializers import order_columns, order_values
+from .pagination import OrderCursorPagination, after_key
+
+STREAM_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def iter_order_chunks(orders, fields=None, chunk_size=1000):
+    """Порции сериализованных заказов от новых к старым; в памяти одновременно одна порция"""
+    rows = (orders.select_related(None).prefetch_related(None)
+            .order_by(*OrderCursorPagination.ordering).values(*order_columns(fields)))
+    chunk = list(rows[:chunk_size])
+    while chunk:
+        yield order_values(chunk, fields)
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+        chunk = list(after_key(rows, last["order_date"], last["id"])[:chunk_size])
+
+
+def _dumps(order):
+    # Как JSONRenderer DRF: компактно, без экранирования кириллицы, Decimal — числом
+    return json.dumps(order, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":"))
+
+
+def iter_json_array(chunks):
+    """JSON-массив по частям: "[", заказы через запятую, "]" """
+    yield "["
+    first = True
+    for chunk in chunks:
+        body = ",".join(_dumps(order) for order in chunk)
+        if body:
+            yield body if first else "," + body
+            first = False
+    yield "]"
+
+
+def iter_ndjson(chunks):
+    """По заказу на строку (NDJSON)"""
+    for chunk in chunks:
+        if chunk:
+            yield "".join(_dumps(order) + "\n" for order in chunk)
+
+
+def stream_orders(orders, stream_format, fields=None, chunk_size=1000):
+    """Потоковый ответ со всеми заказами `orders` в формате `stream_format` (json или ndjson)"""
+    chunks = iter_order_chunks(orders, fields, chunk_size)
+    content = iter_json_array(chunks) if stream_format == "json" else iter_ndjson(chunks)
+    return StreamingHttpResponse(content, content_type=f"{STREAM_FORMATS[stream_format]}; charset=utf-8")
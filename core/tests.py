@@ -1,3 +1,1736 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import ProtectedError
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.query import QuerySet
+from django.http import Http404, QueryDict, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+import numpy as np
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from .api_views import (api_orders, filter_orders, get_order_details, get_orders, order_detail, order_list,
+                        order_queryset)
+from . import fast_serializers
+from .authentication import CachedTokenAuthentication, clear_token_cache, token_cache_stats
+from .management.commands.backfill_reports import compute_chunk
+from .media import serve_media
+from .models import DailySales, Order, OrderItem, OrderStatusChange, Product, User
+from .order_status import transition_status
+from .search import rebuild_search_index, search_products
+from .pagination import OrderCursorPagination, decode_cursor, encode_cursor
+from .streaming import iter_order_chunks, stream_orders
+from .versions import get_version
+from reports import report_cache
+from reports.columnar import (load_order_facts, local_days, moving_average, period_over_period, period_range,
+                              period_start, sales_summary)
+from reports.analytics import (REPORT_PERIOD_DAYS, aggregate_daily_sales_by_status, aggregate_orders_by_status,
+                               daily_sales_from_orders, generate_sales_report, orders_in_period, product_sales,
+                               report_fields, report_period, verify_daily_sales)
+from reports.report_cache import get_sales_report, report_cache_stats, window_version
+
+
+def create_orders(user, count, products):
+    """Создает `count` заказов пользователя, в каждом — все переданные товары"""
+    orders = []
+    for _ in range(count):
+        order = Order.objects.create(user=user, price=sum(p.price for p in products), status="pending")
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=2, unit_price=product.price) for product in products
+        ])
+        orders.append(order)
+    return orders
+
+
+class DailySalesRollupTests(TestCase):
+    """Суточная сводка, которую ведут сигналы, совпадает с пересчетом по заказам после любого изменения"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username="customer")
+        cls.product = Product.objects.create(name="Розы", price=Decimal("1500.00"))
+
+    def assertRollupMatchesOrders(self):
+        rollup = {(row.date, row.status): (row.orders, row.revenue)
+                  for row in DailySales.objects.all() if row.orders or row.revenue}
+        self.assertEqual(rollup, daily_sales_from_orders())
+
+    def test_create(self):
+        create_orders(self.customer, 2, [self.product])
+        today = timezone.localdate()
+        self.assertEqual(daily_sales_from_orders(), {(today, "pending"): (2, Decimal("3000.00"))})
+        self.assertRollupMatchesOrders()
+
+    def test_status_change(self):
+        order = create_orders(self.customer, 1, [self.product])[0]
+        order.status = "completed"
+        order.save()
+        self.assertRollupMatchesOrders()
+        self.assertEqual(DailySales.objects.get(status="pending").orders, 0)
+
+    def test_price_and_date_change(self):
+        order = create_orders(self.customer, 1, [self.product])[0]
+        order.price = Decimal("999.99")
+        order.save()
+        self.assertRollupMatchesOrders()
+        order.order_date -= timedelta(days=3)  # Заказ переезжает в другой день
+        order.save()
+        self.assertRollupMatchesOrders()
+
+    def test_save_of_deferred_instance(self):
+        order = create_orders(self.customer, 1, [self.product])[0]
+        deferred = Order.objects.only("id").get(pk=order.pk)  # Прежние поля сводки дочитываются из БД
+        deferred.status = "processing"
+        deferred.save()
+        self.assertRollupMatchesOrders()
+
+    def test_admin_list_editable(self):
+        orders = create_orders(self.customer, 2, [self.product])
+        admin = User.objects.create(username="admin", is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        data = {"form-TOTAL_FORMS": 2, "form-INITIAL_FORMS": 2, "_save": "Сохранить"}
+        for number, order in enumerate(Order.objects.order_by("-order_date")):
+            data.update({f"form-{number}-id": order.id, f"form-{number}-delivery_address": "ул. Цветочная, 1",
+                         f"form-{number}-status": "processing" if order == orders[0] else "pending"})
+        self.client.post("/admin/core/order/", data)
+        self.assertEqual(Order.objects.get(pk=orders[0].pk).status, "processing")
+        self.assertRollupMatchesOrders()
+
+    def test_delete(self):
+        orders = create_orders(self.customer, 2, [self.product])
+        orders[0].delete()
+        self.assertRollupMatchesOrders()
+        Order.objects.get(pk=orders[1].pk).delete()  # Загруженный заново, а не тот же объект
+        self.assertRollupMatchesOrders()
+
+    def test_group_by_status_matches_rollup(self):
+        orders = create_orders(self.customer, 4, [self.product])
+        for order, status in zip(orders, ("completed", "completed", "canceled")):
+            order.status = status
+            order.save()
+        start, end = report_period(timezone.localdate())
+        with self.assertNumQueries(1):  # Один GROUP BY status по заказам периода
+            by_orders = aggregate_orders_by_status(orders_in_period(start, end))
+        self.assertEqual(by_orders, aggregate_daily_sales_by_status(start, end))
+        self.assertEqual(by_orders["completed"], {"count": 2, "revenue": Decimal("3000.00")})
+        self.assertEqual(by_orders["delivering"], {"count": 0, "revenue": Decimal("0")})
+
+    def test_rebuild_command_verify(self):
+        create_orders(self.customer, 2, [self.product])
+        DailySales.objects.update(orders=5)  # Сводку испортили в обход сигналов
+
+        output = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command("rebuild_sales_rollup", verify=True, stdout=output)
+        self.assertIn("в сводке (5,", output.getvalue())
+
+        call_command("rebuild_sales_rollup", stdout=io.StringIO())
+        output = io.StringIO()
+        call_command("rebuild_sales_rollup", verify=True, stdout=output)
+        self.assertIn("Сводка совпадает с заказами", output.getvalue())
+        self.assertRollupMatchesOrders()
+
+
+class ReportBackfillTests(TestCase):
+    """Отчет из backfill_reports совпадает с отчетом, который строят живые пути (команда, админка, бот)"""
+
+    def test_backfilled_report_equals_live_report(self):
+        customer = User.objects.create(username="customer")
+        product = Product.objects.create(name="Розы", price=Decimal("1500.00"))
+        report_date = timezone.localdate() - timedelta(days=1)
+        # Заказы на границах периода: D − 31 не входит, D − 30 и D входят, D + 1 — уже после
+        for days_before, status in ((31, "completed"), (30, "completed"), (15, "canceled"), (0, "pending"),
+                                    (-1, "pending")):
+            order = create_orders(customer, 1, [product])[0]
+            order.order_date -= timedelta(days=days_before + 1)
+            order.status = status
+            order.save()
+
+        backfilled = dict(compute_chunk(report_date - timedelta(days=2), report_date, REPORT_PERIOD_DAYS))
+        for day, status_counts in backfilled.items():
+            live = generate_sales_report(*report_period(day), report_date=day)
+            self.assertEqual(report_fields(status_counts),
+                             {field: getattr(live, field) for field in report_fields(status_counts)}, day)
+        self.assertEqual(report_fields(backfilled[report_date])["completed_orders"], 1)
+        self.assertEqual(report_fields(backfilled[report_date])["total_orders"], 3)
+
+
+class DataVersionTests(TestCase):
+    """Версии данных считаются по базе: их меняют записи из любого процесса, а очистка кэша не откатывает"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username="customer")
+        cls.product = Product.objects.create(name="Розы", price=Decimal("1500.00"))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_version_follows_database(self):
+        order = create_orders(self.customer, 1, [self.product])[0]
+        version = get_version("orders")
+        cache.clear()  # Вытеснение из кэша не возвращает прежнюю версию
+        self.assertEqual(get_version("orders"), version)
+
+        OrderItem.objects.filter(order=order).first().delete()  # Позиция обновляет updated_at заказа
+        self.assertNotEqual(get_version("orders"), version)
+
+        version = get_version("products")
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal("1.00"), updated_at=timezone.now())
+        self.assertNotEqual(get_version("products"), version)
+
+    def test_product_sales_sees_writes_without_signals(self):
+        today = timezone.localdate()
+        create_orders(self.customer, 1, [self.product])
+        self.assertEqual(product_sales(today, today)[0]["units"], 2)
+
+        # Как запись другого процесса: ни сигналов, ни кэша этого процесса
+        order = Order.objects.bulk_create([Order(user=self.customer, price=Decimal("1500.00"))])[0]
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=self.product, quantity=3,
+                                                 unit_price=Decimal("1500.00"))])
+        self.assertEqual(product_sales(today, today)[0]["units"], 5)
+
+
+class ProductSalesTests(TestCase):
+    """Продажи по товарам: штуки и выручка по ценам покупки, фильтр статусов и отчет API для персонала"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        cls.customer = User.objects.create(username="customer")
+        cls.roses = Product.objects.create(name="Розы", price=Decimal("1500.00"))
+        cls.tulips = Product.objects.create(name="Тюльпаны", price=Decimal("300.00"))
+        completed = Order.objects.create(user=cls.customer, price=Decimal("4500.00"), status="completed")
+        OrderItem.objects.create(order=completed, product=cls.roses, quantity=2, unit_price=Decimal("1500.00"))
+        OrderItem.objects.create(order=completed, product=cls.tulips, quantity=5, unit_price=Decimal("300.00"))
+        pending = Order.objects.create(user=cls.customer, price=Decimal("1400.00"))
+        OrderItem.objects.create(order=pending, product=cls.roses, quantity=1, unit_price=Decimal("1400.00"))
+
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.client = APIClient()
+
+    def rows(self, statuses=None):
+        return [(row["name"], row["units"], row["orders"], row["revenue"], round(row["share"], 2))
+                for row in product_sales(self.today, self.today, statuses)]
+
+    def test_units_revenue_orders_and_share(self):
+        self.assertEqual(self.rows(), [("Розы", 3, 2, Decimal("4400.00"), 74.58),  # 1400 — цена на момент покупки
+                                       ("Тюльпаны", 5, 1, Decimal("1500.00"), 25.42)])
+
+    def test_status_filter_has_own_cache_key(self):
+        self.assertEqual(self.rows(["completed"]), [("Розы", 2, 1, Decimal("3000.00"), 66.67),
+                                                    ("Тюльпаны", 5, 1, Decimal("1500.00"), 33.33)])
+        self.assertEqual(self.rows(["pending"]), [("Розы", 1, 1, Decimal("1400.00"), 100.0)])
+        self.assertEqual(len(self.rows()), 2)
+        both = self.rows(["completed", "pending"])
+        with self.assertNumQueries(2):  # Тот же набор статусов в другом порядке — из кэша, запросы только за версиями
+            self.assertEqual(self.rows(["pending", "completed", "pending"]), both)
+
+    def test_api_report(self):
+        url = f"/api/reports/products/?start={self.today}&end={self.today}&status=completed"
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["statuses"], ["completed"])
+        self.assertEqual([(row["product_id"], row["units"]) for row in response.data["products"]],
+                         [(self.roses.id, 2), (self.tulips.id, 5)])
+        self.assertEqual(self.client.get(url + "&status=lost").status_code, 400)
+        self.assertEqual(self.client.get("/api/reports/products/?start=2026-13-01").status_code, 400)
+
+
+class SalesReportCacheTests(TestCase):
+    """Кэш отчетов: одно вычисление на всех, новая версия при изменении сводки, ошибка не застревает"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username="customer")
+        cls.product = Product.objects.create(name="Розы", price=Decimal("1500.00"))
+
+    def setUp(self):
+        cache.clear()
+        self.period = report_period(timezone.localdate())
+
+    def test_concurrent_callers_share_one_computation(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_report(*args, **kwargs):
+            calls.append(args)
+            release.wait(5)
+            return "report"
+
+        waits_before = report_cache_stats()["waits"]
+        results = []
+        # Потоки без БД: версию периода подменяем, чтобы не открывать соединения из потоков
+        with mock.patch("reports.report_cache.window_version", return_value="v1"), \
+                mock.patch("reports.report_cache.generate_sales_report", side_effect=slow_report):
+            threads = [threading.Thread(target=lambda: results.append(get_sales_report(*self.period)))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            deadline = time.monotonic() + 5
+            while report_cache_stats()["waits"] - waits_before < 7 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            release.set()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(get_sales_report(*self.period), "report")  # Уже из кэша
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["report"] * 8)
+        self.assertEqual(report_cache_stats()["waits"] - waits_before, 7)
+
+    def test_daily_sales_change_invalidates_report(self):
+        create_orders(self.customer, 1, [self.product])
+        with mock.patch("reports.report_cache.generate_sales_report", wraps=generate_sales_report) as generate:
+            self.assertEqual(get_sales_report(*self.period).total_orders, 1)
+            self.assertEqual(get_sales_report(*self.period).total_orders, 1)
+            self.assertEqual(generate.call_count, 1)
+
+            version = window_version(*self.period)
+            create_orders(self.customer, 1, [self.product])  # Сигналы обновляют DailySales
+            self.assertNotEqual(window_version(*self.period), version)
+            self.assertEqual(get_sales_report(*self.period).total_orders, 2)
+            self.assertEqual(generate.call_count, 2)
+
+    def test_failed_computation_does_not_poison_inflight(self):
+        with mock.patch("reports.report_cache.generate_sales_report", side_effect=RuntimeError("БД недоступна")):
+            with self.assertRaises(RuntimeError):
+                get_sales_report(*self.period)
+        self.assertEqual(report_cache._inflight, {})
+        with mock.patch("reports.report_cache.generate_sales_report", return_value="report"):
+            self.assertEqual(get_sales_report(*self.period), "report")
+
+
+class ColumnarAnalyticsTests(TestCase):
+    """NumPy-аналитика: локальные даты, периоды, скользящее среднее и сводка для админки и бота"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create(username="alice")
+        cls.bob = User.objects.create(username="bob")
+        cls.carol = User.objects.create(username="carol")
+        cls.product = Product.objects.create(name="Розы", price=Decimal("500.00"))
+        # Текущий период — 10–12 октября, предыдущий — 7–9 октября (местное время, Europe/Moscow)
+        cls.first = cls.order(cls.alice, datetime(2026, 10, 10, 0, 30), "1000.00")  # 9 октября 21:30 UTC
+        cls.order(cls.alice, datetime(2026, 10, 12, 18, 0), "500.00", "pending")
+        cls.order(cls.bob, datetime(2026, 10, 11, 12, 0), "2000.00")
+        cls.order(cls.carol, datetime(2026, 10, 8, 12, 0), "1500.00", "canceled")
+        cls.order(cls.carol, datetime(2026, 10, 6, 23, 59), "9999.00")  # До обоих периодов
+        cls.order(cls.carol, datetime(2026, 10, 13, 0, 0), "9999.00")  # После текущего
+        OrderItem.objects.create(order=cls.first, product=cls.product, quantity=2, unit_price=Decimal("500.00"))
+
+    @staticmethod
+    def order(user, local_time, price, status="completed"):
+        order = Order.objects.create(user=user, price=Decimal(price), status=status)
+        order.order_date = timezone.make_aware(local_time)
+        order.save()
+        return order
+
+    def test_local_days_follow_time_zone_offset(self):
+        facts = load_order_facts()
+        days = dict(zip(facts.order_id.tolist(), facts.day.tolist()))
+        self.assertEqual(days[self.first.id], date(2026, 10, 10))  # Не 9 октября, как в UTC
+        self.assertEqual(facts.item_order.tolist(), [facts.order_id.tolist().index(self.first.id)])
+        self.assertEqual(facts.item_quantity.tolist(), [2])
+
+        # Смещение берется на каждый час: переход на летнее время в Берлине 29 марта в 01:00 UTC
+        utc = ZoneInfo("UTC")
+        timestamps = [datetime(2026, 3, 28, 22, 59, tzinfo=utc).timestamp(),  # 23:59 CET
+                      datetime(2026, 3, 29, 22, 30, tzinfo=utc).timestamp()]  # 00:30 CEST
+        with override_settings(TIME_ZONE="Europe/Berlin"):
+            self.assertEqual(local_days(timestamps).tolist(), [date(2026, 3, 28), date(2026, 3, 30)])
+
+    def test_period_start(self):
+        days = np.array(["2026-10-12", "2026-10-18", "2026-10-19", "2026-02-28"], dtype="datetime64[D]")
+        self.assertEqual(period_start(days, "day").tolist(), days.tolist())
+        self.assertEqual(period_start(days, "week").astype(str).tolist(),  # С понедельника
+                         ["2026-10-12", "2026-10-12", "2026-10-19", "2026-02-23"])
+        self.assertEqual(period_start(days, "month").astype(str).tolist(),
+                         ["2026-10-01", "2026-10-01", "2026-10-01", "2026-02-01"])
+        self.assertEqual(period_range(date(2026, 1, 15), date(2026, 3, 2), "month").astype(str).tolist(),
+                         ["2026-01-01", "2026-02-01", "2026-03-01"])
+        self.assertEqual(period_range(date(2026, 10, 14), date(2026, 10, 26), "week").astype(str).tolist(),
+                         ["2026-10-12", "2026-10-19", "2026-10-26"])
+        with self.assertRaises(ValueError):
+            period_start(days, "year")
+
+    def test_moving_average_and_period_over_period(self):
+        np.testing.assert_array_equal(moving_average([1, 2, 3, 4, 5], 3), [np.nan, np.nan, 2, 3, 4])
+        self.assertTrue(np.isnan(moving_average([1, 2], 3)).all())
+
+        delta, percent = period_over_period([100, 150, 0, 50])
+        np.testing.assert_array_equal(delta, [np.nan, 50, -150, 50])
+        np.testing.assert_array_equal(percent, [np.nan, 50, -100, np.nan])  # С нулем не сравниваем
+
+    def test_sales_summary(self):
+        summary = sales_summary(date(2026, 10, 10), date(2026, 10, 12), top_customers=5, moving_window=2)
+        self.assertEqual((summary["revenue"], summary["orders"]), (3500.0, 3))
+        self.assertEqual((summary["previous_revenue"], summary["previous_orders"]), (1500.0, 1))
+        self.assertEqual((summary["revenue_delta"], summary["orders_delta"]), (2000.0, 2))
+        self.assertAlmostEqual(summary["revenue_delta_percent"], 2000 / 1500 * 100)
+        self.assertEqual(summary["by_status"]["completed"], (2, 3000.0))
+        self.assertEqual(summary["by_status"]["pending"], (1, 500.0))
+        self.assertEqual(summary["by_status"]["canceled"], (0, 0.0))
+        self.assertEqual([(row["date"], row["revenue"], row["orders"], row["moving_average"])
+                          for row in summary["daily"]],
+                         [(date(2026, 10, 10), 1000.0, 1, None), (date(2026, 10, 11), 2000.0, 1, 1500.0),
+                          (date(2026, 10, 12), 500.0, 1, 1250.0)])
+        self.assertEqual([(row["username"], row["revenue"], row["orders"]) for row in summary["top_customers"]],
+                         [("bob", 2000.0, 1), ("alice", 1500.0, 2)])
+
+        top = sales_summary(date(2026, 10, 10), date(2026, 10, 12), top_customers=1)["top_customers"]
+        self.assertEqual([row["user_id"] for row in top], [self.bob.id])
+
+
+class SalesReportExportTests(TestCase):
+    """CSV-выгрузка заказов: поток без файлов на диске, границы периода включительно, gzip"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        cls.customer = User.objects.create(username="customer")
+        for local_time in (datetime(2026, 10, 9, 23, 59), datetime(2026, 10, 10, 0, 0),
+                           datetime(2026, 10, 12, 23, 59), datetime(2026, 10, 13, 0, 0)):
+            cls.add_order(local_time)
+
+    @classmethod
+    def add_order(cls, local_time):
+        order = Order.objects.create(user=cls.customer, price=Decimal("1500.00"), status="completed")
+        order.order_date = timezone.make_aware(local_time)
+        order.save()
+        return order
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+        # Рабочий каталог — пустая временная папка: выгрузка не должна ничего в нее писать
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(workdir.name)
+        self.workdir = workdir.name
+
+    def download(self, query="start=2026-10-10&end=2026-10-12"):
+        response = self.client.get(f"/reports/sales/download/?{query}")
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_streams_inclusive_period(self):
+        response, body = self.download()
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(response["Content-Disposition"], "attachment; filename=sales_report_2026-10-10_2026-10-12.csv")
+        lines = body.decode().splitlines()
+        self.assertEqual(lines[0], "Дата,ID заказа,Клиент,Сумма,Статус")
+        self.assertEqual([line.split(",")[0] for line in lines[1:]], ["2026-10-10", "2026-10-12"])
+        self.assertEqual(os.listdir(self.workdir), [])
+
+    def test_gzip_matches_plain_csv(self):
+        _, plain = self.download()
+        response, body = self.download("start=2026-10-10&end=2026-10-12&gzip=1")
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertTrue(response["Content-Disposition"].endswith(".csv.gz"))
+        self.assertEqual(gzip.decompress(body), plain)
+        self.assertEqual(os.listdir(self.workdir), [])
+
+    def test_malformed_dates(self):
+        for query in ("start=2026-13-01", "end=10.10.2026", "start=2026-10-12&end=2026-10-10"):
+            response, _ = self.download(query)
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as few:
+            self.download()
+        for minute in range(50):
+            self.add_order(datetime(2026, 10, 11, 12, minute))
+        with CaptureQueriesContext(connection) as many:
+            _, body = self.download()
+        self.assertEqual(body.decode().count("\n"), 53)
+        self.assertEqual(len(many), len(few))
+
+
+class OrderItemTests(TestCase):
+    """Позиции заказа: количество из корзины и цена на момент покупки"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username="customer", delivery_address="ул. Цветочная, 1")
+        cls.roses = Product.objects.create(name="Розы", price=Decimal("1500.00"))
+        cls.tulips = Product.objects.create(name="Тюльпаны", price=Decimal("300.00"))
+
+    @mock.patch("core.views.notify_admin", new_callable=mock.AsyncMock)
+    def test_place_order_captures_quantity_and_price(self, notify_admin):
+        self.client.force_login(self.customer)
+        session = self.client.session
+        session["cart"] = {str(self.roses.id): {"quantity": 2}, str(self.tulips.id): {"quantity": 5}}
+        session.save()
+
+        self.client.post("/catalog/order/", {"delivery_address": "ул. Цветочная, 1"})
+        order = Order.objects.get(user=self.customer)
+        items = {item.product_id: (item.quantity, item.unit_price) for item in order.items.all()}
+        self.assertEqual(items, {self.roses.id: (2, Decimal("1500.00")), self.tulips.id: (5, Decimal("300.00"))})
+        self.assertEqual(order.total_price, Decimal("4500.00"))
+
+        Product.objects.filter(pk=self.roses.pk).update(price=Decimal("9999.00"))  # Цена в заказе не меняется
+        order.refresh_from_db()
+        self.assertEqual(order.items.get(product=self.roses).unit_price, Decimal("1500.00"))
+        self.assertEqual(order.recalculate_price(), Decimal("4500.00"))
+
+    def test_missing_unit_price_takes_current_price(self):
+        order = Order.objects.create(user=self.customer, price=0)
+        item = OrderItem.objects.create(order=order, product=self.tulips, quantity=3)
+        self.assertEqual((item.unit_price, item.line_total), (Decimal("300.00"), Decimal("900.00")))
+
+    def test_product_with_sales_cannot_be_deleted(self):
+        order = create_orders(self.customer, 1, [self.roses, self.tulips])[0]
+        with self.assertRaises(ProtectedError):
+            self.roses.delete()
+        self.assertEqual(order.items.count(), 2)  # Позиции прошлого заказа не стираются вместе с товаром
+        Product.objects.create(name="Пионы", price=Decimal("700.00")).delete()  # Товар без продаж удаляется
+
+
+class OrderItemMigrationTests(TransactionTestCase):
+    """Миграция 0015 переносит старые связи заказ–товар в позиции и обратно"""
+
+    before = [("core", "0014_dailysales_updated_at")]
+    after = [("core", "0015_orderitem")]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())  # Остальным тестам — снова последняя схема
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_links_become_items(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model("core", "User").objects.create(username="customer")
+        Product = apps.get_model("core", "Product")
+        roses = Product.objects.create(name="Розы", price=Decimal("1500.00"))
+        tulips = Product.objects.create(name="Тюльпаны", price=Decimal("300.00"))
+        order = apps.get_model("core", "Order").objects.create(user=user, price=Decimal("1800.00"))
+        order.products.add(roses, tulips)
+
+        apps = self.migrate(self.after)
+        items = apps.get_model("core", "OrderItem").objects.filter(order_id=order.id)
+        self.assertEqual(sorted(items.values_list("product_id", "quantity", "unit_price")),
+                         [(roses.id, 1, Decimal("1500.00")), (tulips.id, 1, Decimal("300.00"))])
+
+        apps = self.migrate(self.before)  # Обратно — снова простые связи
+        order = apps.get_model("core", "Order").objects.get(pk=order.id)
+        self.assertEqual(sorted(order.products.values_list("id", flat=True)), [roses.id, tulips.id])
+
+
+class OrderApiQueryCountTests(TestCase):
+    """Число запросов в API заказов не зависит от числа заказов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        cls.customer = User.objects.create(username="customer")
+        cls.products = [
+            Product.objects.create(name=f"Букет {i}", price=Decimal("1000.00") * (i + 1), image="products/flower1.jpg")
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def call(self, view, user, *args, path="/api/orders/"):
+        request = self.factory.get(path)
+        force_authenticate(request, user=user)
+        return view(request, *args)
+
+    def assert_constant_queries(self, view, user, path="/api/orders/", queries=5):
+        # Состояние для ETag (заказы, товары) + заказы с пользователем + товары + позиции
+        create_orders(user, 1, self.products)
+        with self.assertNumQueries(queries):
+            response = self.call(view, user, path=path)
+        self.assertEqual(len(response.data["results"]), Order.objects.filter(user=user).count() if not user.is_staff
+                         else Order.objects.count())
+
+        create_orders(user, 20, self.products)
+        with self.assertNumQueries(queries):
+            response = self.call(view, user, path=path)
+        self.assertEqual(response.status_code, 200)
+
+    def test_order_list_staff(self):
+        self.assert_constant_queries(order_list, self.staff)
+
+    def test_order_list_customer(self):
+        create_orders(self.staff, 5, self.products)  # Чужие заказы не видны и не запрашиваются
+        self.assert_constant_queries(order_list, self.customer)
+        self.assertTrue(all(order["user"] == self.customer.id
+                            for order in self.call(order_list, self.customer).data["results"]))
+
+    def test_api_orders(self):
+        self.assert_constant_queries(api_orders, self.staff)
+
+    def test_get_orders(self):
+        self.assert_constant_queries(get_orders, self.customer)
+
+    def test_order_detail_endpoints(self):
+        order = create_orders(self.customer, 1, self.products)[0]
+        for view in (order_detail, get_order_details):
+            with self.assertNumQueries(3):
+                response = self.call(view, self.customer, order.id, path=f"/api/orders/{order.id}/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["products"]), 3)
+            self.assertEqual(Decimal(str(response.data["total_price"])), Decimal("6000.00"))
+
+    def test_serialized_order_shape(self):
+        order = create_orders(self.customer, 1, self.products)[0]
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        data = client.get(f"/api/orders/{order.id}/").json()
+        self.assertEqual(data["created_at"], data["order_date"])
+        self.assertEqual([item["quantity"] for item in data["items"]], [2, 2, 2])
+
+
+class OrderPaginationTests(TestCase):
+    """Курсорная пагинация списка заказов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        cls.orders = [Order.objects.create(user=cls.staff, price=Decimal("100.00")) for _ in range(7)]
+        # Два заказа с одинаковой датой: порядок между ними задает id
+        Order.objects.filter(id=cls.orders[3].id).update(order_date=cls.orders[4].order_date)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def collect_pages(self, url):
+        ids, pages = [], 0
+        while url:
+            data = self.client.get(url).json()
+            ids += [order["id"] for order in data["results"]]
+            url, pages = data["next"], pages + 1
+        return ids, pages
+
+    def test_pages_cover_all_orders_newest_first(self):
+        ids, pages = self.collect_pages("/api/orders/?page_size=3")
+        expected = list(Order.objects.order_by("-order_date", "-id").values_list("id", flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_new_orders_do_not_shift_next_page(self):
+        first = self.client.get("/api/orders/?page_size=3").json()
+        Order.objects.create(user=self.staff, price=Decimal("1.00"))
+        ids, _ = self.collect_pages(first["next"])
+        self.assertEqual(len(ids), 4)
+        self.assertNotIn(first["results"][-1]["id"], ids)
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(OrderCursorPagination, "max_page_size", 2):
+            data = self.client.get("/api/orders/?page_size=1000").json()
+        self.assertEqual(len(data["results"]), 2)
+        self.assertIsNotNone(data["next"])
+
+    def test_cursor_round_trip_and_invalid_cursor(self):
+        order = self.orders[0]
+        self.assertEqual(decode_cursor(encode_cursor(order.order_date, order.id)), (order.order_date, order.id))
+        self.assertEqual(self.client.get("/api/orders/?cursor=not-a-cursor").status_code, 404)
+
+
+class OrderFilterTests(TestCase):
+    """Фильтры списка заказов и индексы под них"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        cls.alice = User.objects.create(username="alice", telegram_id=111)
+        cls.bob = User.objects.create(username="bob", telegram_id=222)
+        cls.orders = {}
+        for user, order_status, day in ((cls.alice, "pending", "2025-03-01"), (cls.alice, "completed", "2025-03-05"),
+                                        (cls.bob, "processing", "2025-03-05"), (cls.bob, "canceled", "2025-03-10")):
+            order = Order.objects.create(user=user, price=Decimal("10.00"), status=order_status)
+            Order.objects.filter(id=order.id).update(order_date=f"{day}T12:00:00+03:00")
+            cls.orders[(user.username, order_status)] = order.id
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def ids(self, query):
+        response = self.client.get(f"/api/orders/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return {order["id"] for order in response.json()["results"]}
+
+    def test_status_multi_value(self):
+        self.assertEqual(self.ids("status=pending&status=processing"),
+                         {self.orders[("alice", "pending")], self.orders[("bob", "processing")]})
+
+    def test_date_range_is_inclusive(self):
+        self.assertEqual(self.ids("start=2025-03-05&end=2025-03-05"),
+                         {self.orders[("alice", "completed")], self.orders[("bob", "processing")]})
+        self.assertEqual(len(self.ids("start=2025-03-02")), 3)
+
+    def test_user_and_telegram_id(self):
+        bob_orders = {self.orders[("bob", "processing")], self.orders[("bob", "canceled")]}
+        self.assertEqual(self.ids(f"user={self.bob.id}"), bob_orders)
+        self.assertEqual(self.ids("telegram_id=222"), bob_orders)
+
+    def test_customer_filters_only_narrow_own_orders(self):
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.ids(f"user={self.bob.id}"), set())
+        self.assertEqual(self.ids("status=pending"), {self.orders[("alice", "pending")]})
+
+    def test_invalid_filters(self):
+        for query in ("status=lost", "start=03.05.2025", "start=2025-03-10&end=2025-03-01", "user=bob"):
+            self.assertEqual(self.client.get(f"/api/orders/?{query}").status_code, 400, query)
+
+    @skipUnless(connection.vendor == "sqlite", "План запроса проверяется на SQLite")
+    def test_filters_use_composite_indexes(self):
+        def plan(query):
+            return filter_orders(order_queryset(), QueryDict(query)).order_by("-order_date", "-id").explain()
+
+        self.assertIn("order_user_date_idx", plan(f"user={self.bob.id}&start=2025-03-01"))
+        self.assertIn("order_user_date_idx", plan("telegram_id=222"))
+        self.assertIn("order_status_date_idx", plan("status=pending&status=processing&start=2025-03-01"))
+
+
+@mock.patch("core.api_views.CHANGES_SETTLE_TIME", timedelta(0))
+class OrderChangesTests(TestCase):
+    """Выгрузка изменений заказов по водяному знаку"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username="customer")
+        cls.other = User.objects.create(username="other")
+        cls.orders = [Order.objects.create(user=cls.customer, price=Decimal("10.00")) for _ in range(3)]
+        Order.objects.create(user=cls.other, price=Decimal("10.00"))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def changes(self, since=None, **params):
+        if since:
+            params["since"] = since
+        response = self.client.get("/api/orders/changes/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_initial_sync_then_only_changes(self):
+        first = self.changes()
+        self.assertEqual([order["id"] for order in first["results"]], [order.id for order in self.orders])
+        self.assertFalse(first["has_more"])
+
+        empty = self.changes(first["watermark"])
+        self.assertEqual(empty["results"], [])
+        self.assertEqual(empty["watermark"], first["watermark"])
+
+        order = self.orders[0]
+        order.status = "processing"
+        order.save()
+        new_order = Order.objects.create(user=self.customer, price=Decimal("5.00"))
+        delta = self.changes(first["watermark"])
+        self.assertEqual([(o["id"], o["status"]) for o in delta["results"]],
+                         [(order.id, "processing"), (new_order.id, "pending")])
+
+    def test_paging_with_equal_timestamps(self):
+        Order.objects.filter(user=self.customer).update(updated_at=timezone.now() - timedelta(minutes=1))
+        seen, watermark = [], None
+        while True:
+            page = self.changes(watermark, page_size=2)
+            seen += [order["id"] for order in page["results"]]
+            watermark = page["watermark"]
+            if not page["has_more"]:
+                break
+        self.assertEqual(seen, [order.id for order in self.orders])
+
+    def test_recent_changes_wait_until_settled(self):
+        with mock.patch("core.api_views.CHANGES_SETTLE_TIME", timedelta(minutes=5)):
+            self.assertEqual(self.changes()["results"], [])
+
+    def test_invalid_watermark(self):
+        self.assertEqual(self.client.get("/api/orders/changes/?since=not-a-watermark").status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    """ETag: без изменений — 304 без сериализации"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username="customer")
+        cls.other = User.objects.create(username="other")
+        cls.product = Product.objects.create(name="Розы", price=Decimal("1500.00"), image="products/flower1.jpg")
+        create_orders(cls.customer, 2, [cls.product])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def assert_not_modified(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response)  # Только ETag: в нем есть и число строк
+        repeat = self.client.get(url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.content, b"")
+        return response["ETag"]
+
+    def test_product_list(self):
+        etag = self.assert_not_modified("/api/products/")
+        with self.assertNumQueries(1):  # Только агрегат состояния, товары не читаются
+            self.client.get("/api/products/", headers={"If-None-Match": etag})
+
+        self.product.price = Decimal("1600.00")
+        self.product.save()
+        response = self.client.get("/api/products/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["price"], "1600.00")
+
+    def test_if_modified_since_ignored_after_delete(self):
+        Product.objects.create(name="Тюльпаны", price=Decimal("300.00"), image="products/flower2.jpg")
+        since = http_date(time.time() + 60)  # Клиент «видел» все правки: max(updated_at) после удаления не вырастет
+        Product.objects.filter(name="Тюльпаны").delete()
+        response = self.client.get("/api/products/", headers={"If-Modified-Since": since})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product["name"] for product in response.json()["results"]], ["Розы"])
+
+    def test_catalog_etag_follows_csrf_secret(self):
+        self.client.force_login(self.customer)
+        self.client.get("/catalog/")  # Первая страница ставит cookie с CSRF-секретом
+        etag = self.client.get("/catalog/")["ETag"]
+        self.assertEqual(self.client.get("/catalog/", headers={"If-None-Match": etag}).status_code, 304)
+        self.client.cookies["csrftoken"] = "x" * 32  # Новый вход меняет CSRF-секрет
+        response = self.client.get("/catalog/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "csrfmiddlewaretoken")
+
+    def test_order_list(self):
+        etag = self.assert_not_modified("/api/orders/")
+        with self.assertNumQueries(2):  # Агрегаты заказов и товаров
+            self.client.get("/api/orders/", headers={"If-None-Match": etag})
+
+        order = Order.objects.filter(user=self.customer).first()
+        order.status = "processing"
+        order.save()
+        self.assertEqual(self.client.get("/api/orders/", headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_order_list_etag_depends_on_user_and_query(self):
+        etag = self.assert_not_modified("/api/orders/")
+        self.assertEqual(self.client.get("/api/orders/?status=pending",
+                                         headers={"If-None-Match": etag}).status_code, 200)
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get("/api/orders/", headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_get_orders_by_telegram_id(self):
+        bot = User.objects.create(username="bot", is_staff=True)
+        User.objects.filter(pk=self.customer.pk).update(telegram_id=42)
+        factory = APIRequestFactory()
+
+        def call(**headers):
+            request = factory.get("/api/get_orders/?telegram_id=42", headers=headers)
+            force_authenticate(request, user=bot)
+            return get_orders(request)
+
+        etag = call()["ETag"]
+        self.assertEqual(call(If_None_Match=etag).status_code, 304)
+        Order.objects.filter(user=self.customer).update(status="processing", updated_at=timezone.now())
+        self.assertEqual(call(If_None_Match=etag).status_code, 200)
+
+        request = factory.get("/api/get_orders/?telegram_id=404")
+        force_authenticate(request, user=bot)
+        self.assertEqual(get_orders(request).status_code, 404)
+
+    def test_catalog_html(self):
+        etag = self.assert_not_modified("/catalog/")
+        self.client.force_login(self.customer)  # Вошедшему пользователю — другая страница
+        response = self.client.get("/catalog/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+
+class OrderSideloadTests(TestCase):
+    """Нормализованный список заказов: ?include=products"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username="customer")
+        cls.products = [
+            Product.objects.create(name=f"Букет {i}", price=Decimal("500.00"), image="products/flower1.jpg")
+            for i in range(3)
+        ]
+        create_orders(cls.customer, 2, cls.products[:2])
+        create_orders(cls.customer, 1, cls.products[1:])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_products_sent_once(self):
+        nested = self.client.get("/api/orders/").json()
+        with self.assertNumQueries(5):  # Состояние для ETag + заказы + позиции + товары
+            response = self.client.get("/api/orders/?include=products")
+        data = response.json()
+
+        self.assertEqual(set(data["products"]), {str(product.id) for product in self.products})
+        self.assertEqual(data["products"][str(self.products[0].id)]["name"], "Букет 0")
+        for slim, full in zip(data["results"], nested["results"]):
+            self.assertEqual(sorted(slim["products"]), sorted(product["id"] for product in full["products"]))
+            self.assertEqual(slim["items"], full["items"])
+        self.assertLess(len(response.content), len(self.client.get("/api/orders/").content))
+
+    def test_unknown_include(self):
+        self.assertEqual(self.client.get("/api/orders/?include=users").status_code, 400)
+
+
+class SparseFieldsTests(TestCase):
+    """?fields= сужает и ответ, и запрос к БД"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username="customer")
+        cls.product = Product.objects.create(name="Розы", price=Decimal("1500.00"), image="products/flower1.jpg")
+        cls.order = create_orders(cls.customer, 3, [cls.product])[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_order_list_fields_skip_prefetch_and_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get("/api/orders/?fields=id,status,created_at,total_price").json()
+        self.assertEqual(set(data["results"][0]), {"id", "status", "created_at", "total_price"})
+        self.assertEqual(len(ctx.captured_queries), 3)  # Состояние для ETag + одна выборка заказов
+        select = ctx.captured_queries[-1]["sql"]
+        self.assertNotIn("delivery_address", select)
+        self.assertNotIn("core_user", select)
+
+    def test_nested_fields_still_prefetched(self):
+        data = self.client.get("/api/orders/?fields=id&fields=products").json()
+        self.assertEqual(set(data["results"][0]), {"id", "products"})
+        self.assertEqual(data["results"][0]["products"][0]["name"], "Розы")
+
+    def test_order_detail_and_changes(self):
+        detail = self.client.get(f"/api/orders/{self.order.id}/?fields=id,user").json()
+        self.assertEqual(detail, {"id": self.order.id, "user": self.customer.id})
+        with mock.patch("core.api_views.CHANGES_SETTLE_TIME", timedelta(0)):
+            changes = self.client.get("/api/orders/changes/?fields=id").json()
+        self.assertEqual(changes["results"][0], {"id": self.order.id})
+
+    def test_product_fields(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get("/api/products/?fields=name,price").json()
+        self.assertEqual(data["results"], [{"name": "Розы", "price": "1500.00"}])
+        self.assertNotIn("image", ctx.captured_queries[-1]["sql"])
+
+    def test_unknown_field(self):
+        self.assertEqual(self.client.get("/api/orders/?fields=id,secret").status_code, 400)
+        self.assertEqual(self.client.get("/api/products/?fields=cost").status_code, 400)
+
+
+class FastSerializerParityTests(TestCase):
+    """Быстрая сериализация (values()) дает тот же ответ, что и ModelSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        cls.customer = User.objects.create(username="customer")
+        cls.products = [
+            Product.objects.create(name="Розы", price=Decimal("1500.50"), image="products/flower1.jpg"),
+            Product.objects.create(name="Тюльпаны", price=Decimal("990.00"), image="products/flower2.jpg"),
+            Product.objects.create(name="Без фото", price=Decimal("100.00"), image=""),
+        ]
+        create_orders(cls.customer, 3, cls.products)
+        create_orders(cls.staff, 2, cls.products[1:])
+        Order.objects.create(user=cls.customer, price=Decimal("0.00"), status="canceled", delivery_address=None)
+        Order.objects.filter(user=cls.staff).update(delivery_address="ул. Цветочная, 5", status="completed")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def get_both(self, url):
+        with self.settings(FAST_SERIALIZER_ENDPOINTS=set()):
+            expected = self.client.get(url).json()
+        with self.settings(FAST_SERIALIZER_ENDPOINTS={"product_list", "order_list"}):
+            actual = self.client.get(url).json()
+        return expected, actual
+
+    @staticmethod
+    def normalized(data):
+        # Порядок товаров в M2M-подгрузке ModelSerializer не определен — сравниваем по id
+        for order in data.get("results", []):
+            if "products" in order:
+                order["products"] = sorted(order["products"], key=lambda p: p if isinstance(p, int) else p["id"])
+        return data
+
+    def test_order_list_parity(self):
+        for query in ("", "?page_size=2", "?fields=id,status,created_at,total_price", "?fields=products,items",
+                      "?include=products", "?include=products&fields=id,products", "?status=completed"):
+            expected, actual = self.get_both(f"/api/orders/{query}")
+            self.assertEqual(self.normalized(actual), self.normalized(expected), query)
+
+    def test_next_page_parity(self):
+        expected, actual = self.get_both("/api/orders/?page_size=2")
+        self.assertEqual(actual["next"], expected["next"])
+        expected, actual = self.get_both(expected["next"])
+        self.assertEqual(self.normalized(actual), self.normalized(expected))
+
+    def test_product_list_parity(self):
+        for query in ("", "?fields=name,image", "?page_size=2", "?search=роз"):
+            expected, actual = self.get_both(f"/api/products/{query}")
+            self.assertEqual(actual, expected, query)
+        expected, actual = self.get_both("/api/products/?fields=name,image")
+        self.assertIsNone(actual["results"][2]["image"])
+
+
+class OrderStreamingTests(TestCase):
+    """Потоковая выгрузка заказов: ?stream=json|ndjson"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        products = [Product.objects.create(name=f"Букет {i}", price=Decimal("700.00"), image="products/flower1.jpg")
+                    for i in range(2)]
+        create_orders(cls.staff, 7, products)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def all_pages(self, query=""):
+        orders, url = [], f"/api/orders/?page_size=3{query}"
+        while url:
+            data = self.client.get(url).json()
+            orders += data["results"]
+            url = data["next"]
+        return orders
+
+    def test_json_array_matches_pages(self):
+        with mock.patch("core.streaming.order_values", wraps=fast_serializers.order_values) as serialize:
+            response = self.client.get("/api/orders/?stream=json")
+            body = b"".join(response.streaming_content)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/json; charset=utf-8")
+        self.assertEqual(json.loads(body), self.all_pages())
+        self.assertEqual(serialize.call_count, 1)
+
+    def test_ndjson_with_filters_and_fields(self):
+        response = self.client.get("/api/orders/?stream=ndjson&fields=id,status&status=pending")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.all_pages("&fields=id,status&status=pending"))
+
+    def test_chunks_follow_keyset(self):
+        chunks = list(iter_order_chunks(order_queryset(), fields={"id"}, chunk_size=3))
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 1])
+        self.assertEqual([order["id"] for chunk in chunks for order in chunk],
+                         [order["id"] for order in self.all_pages("&fields=id")])
+
+    def test_empty_and_invalid(self):
+        response = self.client.get("/api/orders/?stream=json&status=canceled")
+        self.assertEqual(b"".join(response.streaming_content), b"[]")
+        self.assertEqual(self.client.get("/api/orders/?stream=xml").status_code, 400)
+        self.assertEqual(self.client.get("/api/orders/?stream=json&include=products").status_code, 400)
+
+
+class BenchmarkSeedTests(TransactionTestCase):
+    """Синтетические данные замеров не попадают в базу мимо отката"""
+
+    def test_seed_outside_transaction_refused(self):
+        from core.management.commands.benchmark import seed_orders
+        with self.assertRaises(RuntimeError):
+            seed_orders(10, users=2, products=2)
+        self.assertFalse(User.objects.exists())
+
+    def test_command_rolls_back(self):
+        call_command("benchmark", "reports", orders=50, stdout=io.StringIO())
+        self.assertFalse(Order.objects.exists() or User.objects.exists() or Product.objects.exists())
+
+
+class OrderStreamingMemoryTests(TestCase):
+    """Пиковая память потоковой выгрузки не растет вместе с числом заказов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from core.management.commands.benchmark import seed_orders
+        seed_orders(12000, users=50, products=20)
+
+    def peak_memory(self, limit):
+        orders = Order.objects.filter(id__in=Order.objects.order_by("id").values("id")[:limit])
+        response = stream_orders(orders, "ndjson", chunk_size=250)
+        tracemalloc.start()
+        try:
+            size = sum(len(part) for part in response.streaming_content)
+            return tracemalloc.get_traced_memory()[1], size
+        finally:
+            tracemalloc.stop()
+
+    def test_memory_stays_flat(self):
+        self.peak_memory(100)  # Прогрев: ленивые импорты и кэши Django не относятся к выгрузке
+        small_peak, small_size = self.peak_memory(2000)
+        large_peak, large_size = self.peak_memory(12000)
+        self.assertGreater(large_size, 5 * small_size)
+        self.assertLess(large_peak, small_peak * 1.5)  # В 6 раз больше заказов — почти та же память
+        self.assertLess(large_peak, large_size / 3)  # И намного меньше самого ответа (пик — около одной порции)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Кэш токен → пользователь: повторный запрос с тем же токеном не читает Token и User"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        cls.customer = User.objects.create(username="customer")
+        cls.product = Product.objects.create(name="Розы", price=Decimal("1500.00"))
+        create_orders(cls.customer, 2, [cls.product])
+
+    def setUp(self):
+        clear_token_cache()
+        self.token = Token.objects.create(user=self.staff)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_second_request_skips_token_query(self):
+        with self.assertNumQueries(3):  # Token+User, агрегат состояния, товары
+            self.client.get("/api/products/")
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get("/api/products/").status_code, 200)
+        stats = token_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 1, 1))
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_deleted_token_is_rejected(self):
+        self.assertEqual(self.client.get("/api/products/").status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get("/api/products/").status_code, 401)
+
+    def test_staff_flag_change_is_visible(self):
+        Order.objects.create(user=self.staff, price=Decimal("100.00"))
+        self.assertEqual(len(self.client.get("/api/orders/").json()["results"]), 3)
+        self.staff.is_staff = False
+        self.staff.save()
+        self.assertEqual(len(self.client.get("/api/orders/").json()["results"]), 1)
+
+    def test_inactive_user_is_rejected(self):
+        self.assertEqual(self.client.get("/api/products/").status_code, 200)
+        self.staff.is_active = False
+        self.staff.save()
+        self.assertEqual(self.client.get("/api/products/").status_code, 401)
+
+    def test_entries_expire(self):
+        with mock.patch("core.authentication.time.monotonic", return_value=1000.0):
+            self.client.get("/api/products/")
+        with mock.patch("core.authentication.time.monotonic", return_value=1000.0 + 61):
+            with self.assertNumQueries(3):
+                self.client.get("/api/products/")
+        self.assertEqual(token_cache_stats()["misses"], 2)
+
+    def test_cache_is_bounded(self):
+        tokens = [self.token] + [Token.objects.create(user=User.objects.create(username=f"user{i}"))
+                                 for i in range(3)]
+        with self.settings(TOKEN_AUTH_CACHE_SIZE=2):
+            for token in tokens:
+                self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+                self.client.get("/api/products/")
+        stats = token_cache_stats()
+        self.assertEqual((stats["size"], stats["evictions"]), (2, 2))
+
+    def test_cached_user_is_not_shared_between_requests(self):
+        factory = APIRequestFactory()
+        authentication = CachedTokenAuthentication()
+        request = factory.get("/api/products/", HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        first, _ = authentication.authenticate(request)
+        first.delivery_address = "изменено в запросе"
+        second, token = authentication.authenticate(request)
+        self.assertNotEqual(second.delivery_address, "изменено в запросе")
+        self.assertEqual(token, self.token)
+
+
+class BulkOrderStatusTests(TestCase):
+    """POST /api/orders/bulk-status/: пакет статусов одной транзакцией, сводка и updated_at в порядке"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        cls.customer = User.objects.create(username="customer")
+        cls.other = User.objects.create(username="other")
+        cls.product = Product.objects.create(name="Розы", price=Decimal("1500.00"))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def post(self, data):
+        return self.client.post("/api/orders/bulk-status/", data, format="json")
+
+    def test_updates_batch_and_rollup(self):
+        orders = create_orders(self.customer, 3, [self.product])
+        before = Order.objects.get(id=orders[0].id).updated_at
+        response = self.post({"ids": [order.id for order in orders], "status": "processing"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["updated"], 3)
+        self.assertEqual({result["status"] for result in response.json()["results"]}, {"processing"})
+        self.assertEqual(Order.objects.filter(status="processing").count(), 3)
+        self.assertGreater(Order.objects.get(id=orders[0].id).updated_at, before)
+        self.assertEqual(verify_daily_sales(), [])
+        self.assertEqual(DailySales.objects.get(status="processing").orders, 3)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        def queries(count, status):
+            ids = [order.id for order in create_orders(self.customer, count, [self.product])]
+            with CaptureQueriesContext(connection) as context:
+                self.post({"ids": ids, "status": status})
+            return len(context)
+
+        self.assertEqual(queries(2, "processing"), queries(20, "canceled"))
+
+    def test_per_order_results(self):
+        pending, processing = create_orders(self.customer, 2, [self.product])
+        processing.status = "processing"
+        processing.save()
+        response = self.post({"orders": [
+            {"id": pending.id, "status": "delivering"},   # Нельзя минуя «в работе»
+            {"id": processing.id, "status": "delivering"},
+            {"id": processing.id, "status": "completed"},
+            {"id": 999999, "status": "processing"},
+            {"id": pending.id, "status": "unknown"},
+        ]})
+        results = [(result["id"], result["result"]) for result in response.json()["results"]]
+        self.assertEqual(results, [(pending.id, "invalid_transition"), (processing.id, "updated"),
+                                   (processing.id, "duplicate"), (999999, "not_found"), (pending.id, "duplicate")])
+        self.assertEqual(Order.objects.get(id=processing.id).status, "delivering")
+        self.assertEqual(verify_daily_sales(), [])
+
+    def test_customer_changes_only_own_orders(self):
+        own = create_orders(self.customer, 1, [self.product])[0]
+        foreign = create_orders(self.other, 1, [self.product])[0]
+        self.client.force_authenticate(self.customer)
+        response = self.post({"ids": [own.id, foreign.id], "status": "canceled"})
+        self.assertEqual([result["result"] for result in response.json()["results"]], ["updated", "forbidden"])
+        self.assertIsNone(response.json()["results"][1]["status"])
+        self.assertEqual(Order.objects.get(id=foreign.id).status, "pending")
+
+    def test_bad_body(self):
+        self.assertEqual(self.post({}).status_code, 400)
+        self.assertEqual(self.post({"orders": [{"id": "x", "status": "processing"}]}).status_code, 400)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.post({"ids": [1], "status": "processing"}).status_code, 401)
+
+    def test_conflict_rolls_back_batch(self):
+        orders = create_orders(self.customer, 2, [self.product])
+        with mock.patch.object(QuerySet, "update", return_value=0):
+            response = self.post({"ids": [order.id for order in orders], "status": "processing"})
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exclude(status="pending").exists())
+
+    def test_admin_action(self):
+        admin = User.objects.create(username="admin", is_staff=True, is_superuser=True)
+        orders = create_orders(self.customer, 2, [self.product])
+        self.client.force_login(admin)
+        self.client.post("/admin/core/order/", {"action": "confirm_orders",
+                                                "_selected_action": [order.id for order in orders]})
+        self.assertEqual(Order.objects.filter(status="processing").count(), 2)
+        self.assertEqual(verify_daily_sales(), [])
+
+
+class OrderStatusTransitionTests(TestCase):
+    """Автомат статусов: условный переход и история в одной транзакции"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        cls.customer = User.objects.create(username="customer")
+        cls.product = Product.objects.create(name="Розы", price=Decimal("1500.00"))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.order = create_orders(self.customer, 1, [self.product])[0]
+
+    def update(self, new_status):
+        return self.client.post(f"/api/orders/{self.order.id}/update/", {"status": new_status}, format="json")
+
+    def test_transition_writes_history(self):
+        self.assertEqual(self.update("processing").json()["status"], "processing")
+        self.assertEqual(self.update("delivering").status_code, 200)
+        history = list(self.order.status_changes.values_list("old_status", "new_status", "changed_by"))
+        self.assertEqual(history, [("pending", "processing", self.staff.id),
+                                   ("processing", "delivering", self.staff.id)])
+        self.assertEqual(verify_daily_sales(), [])
+
+    def test_completed_order_cannot_go_back(self):
+        for new_status in ("processing", "completed"):
+            self.update(new_status)
+        response = self.update("processing")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["status"], "completed")
+        self.assertEqual(self.order.status_changes.count(), 2)
+
+    def test_single_conditional_update(self):
+        with CaptureQueriesContext(connection) as context:
+            self.update("processing")
+        writes = [query["sql"] for query in context if query["sql"].startswith('UPDATE "core_order"')]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"core_order"."status" = ', writes[0])
+
+    def test_errors(self):
+        self.assertEqual(self.update("unknown").status_code, 400)
+        self.assertEqual(self.client.post("/api/orders/999999/update/", {"status": "processing"}).status_code, 404)
+        self.client.force_authenticate(User.objects.create(username="other"))
+        self.assertEqual(self.update("canceled").status_code, 403)
+
+    def test_admin_status_change_goes_through_state_machine(self):
+        admin = User.objects.create(username="admin", is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        data = {"user": self.customer.id, "status": "processing", "delivery_address": "ул. Цветочная, 1",
+                "items-TOTAL_FORMS": 0, "items-INITIAL_FORMS": 0,
+                "status_changes-TOTAL_FORMS": 0, "status_changes-INITIAL_FORMS": 0}
+        self.client.post(f"/admin/core/order/{self.order.id}/change/", data)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.delivery_address), ("processing", "ул. Цветочная, 1"))
+        self.assertEqual(self.order.status_changes.get().changed_by, admin)
+        self.assertEqual(verify_daily_sales(), [])
+
+    def admin_change(self, new_status):
+        self.client.force_login(User.objects.create(username="admin", is_staff=True, is_superuser=True))
+        data = {"user": self.customer.id, "status": new_status, "delivery_address": "ул. Цветочная, 1",
+                "items-TOTAL_FORMS": 0, "items-INITIAL_FORMS": 0,
+                "status_changes-TOTAL_FORMS": 0, "status_changes-INITIAL_FORMS": 0}
+        return self.client.post(f"/admin/core/order/{self.order.id}/change/", data, follow=True)
+
+    def test_admin_rejects_invalid_transition(self):
+        response = self.admin_change("completed")
+        self.assertEqual(response.redirect_chain, [])
+        self.assertTrue(response.context["adminform"].form.has_error("status"))
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.delivery_address), ("pending", None))
+        self.assertFalse(self.order.status_changes.exists())
+
+    def test_admin_concurrent_transition_not_reported_as_success(self):
+        rejected = {"id": self.order.id, "result": "invalid_transition", "status": "canceled"}
+        with mock.patch("core.admin.transition_status", return_value=rejected):
+            response = self.admin_change("processing")
+        self.assertEqual(response.redirect_chain, [(f"/admin/core/order/{self.order.id}/change/", 302)])
+        levels = [message.level_tag for message in response.context["messages"]]
+        self.assertEqual(levels, ["error"])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.delivery_address, "ул. Цветочная, 1")
+
+
+class ConcurrentStatusTransitionTests(TransactionTestCase):
+    """Параллельные переходы (бот и админка) не теряют записей: история сходится со статусом"""
+
+    def test_concurrent_transitions(self):
+        staff = User.objects.create(username="staff", is_staff=True)
+        customer = User.objects.create(username="customer")
+        product = Product.objects.create(name="Розы", price=Decimal("1500.00"))
+        orders = create_orders(customer, 5, [product])
+        targets = ["processing", "canceled", "delivering", "completed"] * 3
+        barrier = threading.Barrier(len(targets))
+        results, errors = [], []
+
+        def worker(new_status):
+            try:
+                barrier.wait()
+                for order in orders:
+                    results.append(transition_status(staff, order.id, new_status))
+            except Exception as error:  # Ошибка в потоке не должна потеряться
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(new_status,)) for new_status in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        updated = [result for result in results if result["result"] == "updated"]
+        self.assertEqual(len(updated), OrderStatusChange.objects.count())
+        for order in orders:
+            history = list(OrderStatusChange.objects.filter(order=order).order_by("id")
+                           .values_list("old_status", "new_status"))
+            # Цепочка без разрывов: каждый переход начинается там, где закончился предыдущий
+            chain = ["pending"] + [new for _, new in history]
+            self.assertEqual([old for old, _ in history], chain[:-1])
+            order.refresh_from_db()
+            self.assertEqual(order.status, chain[-1])
+        self.assertEqual(verify_daily_sales(), [])
+
+
+class ProductSearchTests(TestCase):
+    """Постраничный каталог и поиск товаров по названию (FTS5 на SQLite, icontains — на других СУБД)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username="customer")
+        names = ["Розы красные", "Розы белые", "Тюльпаны", "Ёлочный венок", "Red Roses"]
+        cls.products = [Product.objects.create(name=name, price=Decimal("100.00"), image="products/flower1.jpg")
+                        for name in names]
+
+    def setUp(self):
+        cache.clear()  # Фрагменты каталога из других тестов
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def search(self, query):
+        return sorted(search_products(Product.objects.all(), query).values_list("name", flat=True))
+
+    def test_search_by_word_prefix(self):
+        self.assertEqual(self.search("роз"), ["Розы белые", "Розы красные"])
+        self.assertEqual(self.search("РОЗЫ бел"), ["Розы белые"])
+        self.assertEqual(self.search("елочн"), ["Ёлочный венок"])
+        self.assertEqual(self.search("ос"), [])  # Только начало слова
+        self.assertEqual(self.search("!!!"), [])
+        self.assertEqual(len(self.search("")), 5)
+
+    def test_index_follows_save_and_delete(self):
+        product = self.products[2]
+        product.name = "Пионы"
+        product.save()
+        self.assertEqual(self.search("тюльп"), [])
+        self.assertEqual(self.search("пион"), ["Пионы"])
+        product.delete()
+        self.assertEqual(self.search("пион"), [])
+
+    def test_rebuild_after_bulk_create(self):
+        Product.objects.bulk_create([Product(name="Хризантемы", price=Decimal("100.00"))])
+        self.assertEqual(self.search("хриз"), [])  # bulk_create не вызывает сигналы
+        self.assertEqual(rebuild_search_index(), 6)
+        self.assertEqual(self.search("хриз"), ["Хризантемы"])
+
+    def test_fallback_without_fts(self):
+        with mock.patch("core.search.fts_enabled", return_value=False):
+            self.assertEqual(self.search("rose"), ["Red Roses"])
+            self.assertEqual(self.search("ros red"), ["Red Roses"])
+
+    def test_api_pages_and_search(self):
+        names, url = [], "/api/products/?page_size=2&fields=name"
+        while url:
+            page = self.client.get(url).json()
+            names += [product["name"] for product in page["results"]]
+            url = page["next"]
+        self.assertEqual(names, [product.name for product in self.products])
+
+        found = self.client.get("/api/products/?search=роз").json()["results"]
+        self.assertEqual([product["id"] for product in found], [self.products[0].id, self.products[1].id])
+        self.assertEqual(self.client.get("/api/products/?cursor=%%%").status_code, 404)
+
+    def test_catalog_pages_and_search(self):
+        Product.objects.bulk_create([Product(name=f"Букет {i}", price=Decimal("100.00"), image="products/flower1.jpg")
+                                     for i in range(30)])
+        response = self.client.get("/catalog/")
+        self.assertEqual(len(response.context["page"].object_list), 24)
+        self.assertEqual(len(self.client.get("/catalog/?page=2").context["page"].object_list), 11)
+        response = self.client.get("/catalog/?q=розы")
+        self.assertEqual([product.name for product in response.context["page"].object_list],
+                         ["Розы красные", "Розы белые"])
+
+
+class CatalogPageCacheTests(TestCase):
+    """Фрагменты каталога кэшируются по состоянию таблицы товаров, отдельно для гостей и вошедших"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username="customer")
+        cls.product = Product.objects.create(name="Розы", price=Decimal("1500.00"), image="products/flower1.jpg")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_repeat_visit_skips_product_queries(self):
+        self.client.get("/catalog/")
+        with self.assertNumQueries(1):  # Только состояние каталога для ETag
+            response = self.client.get("/catalog/")
+        self.assertContains(response, "Розы")
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get("/"), "Перейти в каталог")
+
+    def test_product_edit_shows_up_immediately(self):
+        self.assertContains(self.client.get("/catalog/"), "1500,00")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal("1700.00")
+            self.product.save()
+        self.assertContains(self.client.get("/catalog/"), "1700,00")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertNotContains(self.client.get("/catalog/"), "Розы")
+
+    def test_guest_and_user_variants(self):
+        self.assertContains(self.client.get("/catalog/"), "Авторизуйтесь для покупки")
+        self.client.force_login(self.customer)
+        response = self.client.get("/catalog/")
+        self.assertContains(response, "Добавить в корзину")
+        self.assertNotContains(response, "Авторизуйтесь для покупки")
+
+    def test_write_from_another_process_shows_up(self):
+        self.assertContains(self.client.get("/catalog/"), "1500,00")
+        # QuerySet.update() — как команда или другой воркер: ни сигналов, ни кэша этого процесса
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal("1700.00"), updated_at=timezone.now())
+        self.assertContains(self.client.get("/catalog/"), "1700,00")
+
+    def test_search_results_not_cached(self):
+        self.assertContains(self.client.get("/catalog/?q=роз"), "Розы")
+        self.assertContains(self.client.get("/catalog/?q=тюльп"), "Ничего не найдено")
+        with CaptureQueriesContext(connection) as context:
+            self.client.get("/catalog/?q=роз")
+        self.assertTrue(any('FROM "core_product"' in query["sql"] for query in context if "COUNT" not in query["sql"]))
+
+    def test_page_number_normalized(self):
+        self.client.get("/catalog/")
+        for page in ("abc", "0", "999999", "%C2%B2", "-1"):  # Все — первая (и единственная) страница, одна запись кэша
+            with self.assertNumQueries(1):
+                self.assertContains(self.client.get(f"/catalog/?page={page}"), "Розы")
+
+
+class ProductThumbnailTests(TestCase):
+    """Уменьшенные копии изображений товаров: при загрузке, командой и в srcset каталога"""
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, name, size):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "red").save(buffer, "JPEG")
+        return Product.objects.create(name=name, price=Decimal("100.00"),
+                                      image=SimpleUploadedFile(f"{name}.jpg", buffer.getvalue()))
+
+    def thumbs(self):
+        folder = os.path.join(self.media_root, "thumbs", "products")
+        return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+    def test_variants_created_on_upload(self):
+        product = self.upload("roses", (1500, 1000))
+        stem = os.path.splitext(os.path.basename(product.image.name))[0]  # Имя файла — хеш содержимого
+        self.assertEqual((product.image_width, product.image_height), (1500, 1000))
+        self.assertEqual(self.thumbs(), [f"{stem}_{width}w.{ext}" for width in (1280, 320, 640) for ext in ("jpg", "webp")])
+        with Image.open(os.path.join(self.media_root, "thumbs", "products", f"{stem}_640w.webp")) as image:
+            self.assertEqual(image.size, (640, 427))
+        self.assertEqual(product.image_srcset_webp, f"/media/thumbs/products/{stem}_320w.webp 320w, "
+                                                    f"/media/thumbs/products/{stem}_640w.webp 640w, "
+                                                    f"/media/thumbs/products/{stem}_1280w.webp 1280w")
+        self.assertEqual(product.image_small_url, f"/media/thumbs/products/{stem}_320w.jpg")
+
+    def test_dimensions_update_changes_updated_at(self):
+        with CaptureQueriesContext(connection) as context:
+            self.upload("roses", (700, 700))
+        # Размеры пишутся отдельным UPDATE — он тоже сдвигает updated_at, иначе версия "products" не сменится
+        updates = [query["sql"] for query in context if query["sql"].startswith('UPDATE "core_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"updated_at" = ', updates[0])
+
+    def test_small_original_is_not_upscaled(self):
+        product = self.upload("tiny", (200, 100))
+        stem = os.path.splitext(os.path.basename(product.image.name))[0]
+        self.assertEqual(self.thumbs(), [f"{stem}_320w.jpg", f"{stem}_320w.webp"])
+        with Image.open(os.path.join(self.media_root, "thumbs", "products", f"{stem}_320w.jpg")) as image:
+            self.assertEqual(image.size, (200, 100))
+        self.assertEqual(product.image_srcset_jpeg, f"/media/thumbs/products/{stem}_320w.jpg 320w")
+
+    def test_catalog_uses_srcset(self):
+        product = self.upload("roses", (800, 800))
+        stem = os.path.splitext(os.path.basename(product.image.name))[0]
+        Product.objects.create(name="Без копий", price=Decimal("100.00"), image="products/legacy.jpg")
+        response = self.client.get("/catalog/")
+        self.assertContains(response, f'srcset="/media/thumbs/products/{stem}_320w.webp 320w, '
+                                      f'/media/thumbs/products/{stem}_640w.webp 640w"')
+        self.assertContains(response, 'src="/media/products/legacy.jpg"')  # Копий еще нет — оригинал
+
+    def test_command_regenerates_everything(self):
+        product = self.upload("roses", (700, 700))
+        Product.objects.filter(pk=product.pk).update(image_width=None)
+        for name in self.thumbs():
+            os.remove(os.path.join(self.media_root, "thumbs", "products", name))
+        Product.objects.create(name="Битый", price=Decimal("100.00"), image="products/missing.jpg")
+
+        output, errors = io.StringIO(), io.StringIO()
+        call_command("generate_thumbnails", workers=2, stdout=output, stderr=errors)
+        self.assertIn("Готово: 1 изображений", output.getvalue())
+        self.assertIn("products/missing.jpg", errors.getvalue())
+        self.assertEqual(len(self.thumbs()), 4)
+        product.refresh_from_db()
+        self.assertEqual(product.image_width, 700)
+
+
+class ContentHashStorageTests(TestCase):
+    """Изображения товаров по хешу содержимого: общие файлы, load_images и dedupe_images"""
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root, "products"))
+
+    def jpeg(self, color):
+        buffer = io.BytesIO()
+        Image.new("RGB", (40, 40), color).save(buffer, "JPEG")
+        return buffer.getvalue()
+
+    def write(self, name, data):
+        with open(os.path.join(self.media_root, "products", name), "wb") as image_file:
+            image_file.write(data)
+
+    def files(self):
+        return sorted(os.listdir(os.path.join(self.media_root, "products")))
+
+    def test_identical_uploads_share_one_file(self):
+        data = self.jpeg("red")
+        first = Product.objects.create(name="Розы", image=SimpleUploadedFile("roses.JPG", data))
+        second = Product.objects.create(name="Розы 2", image=SimpleUploadedFile("roses.jpg", data))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r"^products/[0-9a-f]{64}\.jpg$")
+        self.assertEqual(self.files(), [os.path.basename(first.image.name)])
+
+    def test_load_images_skips_known_images(self):
+        self.write("red.jpg", self.jpeg("red"))
+        self.write("red_copy.jpg", self.jpeg("red"))
+        self.write("blue.jpg", self.jpeg("blue"))
+
+        call_command("load_images", batch_size=1, stdout=io.StringIO())
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(list(search_products(Product.objects.all(), "blue").values_list("name", flat=True)),
+                         ["blue.jpg"])
+
+        with self.assertNumQueries(1):  # Повторный запуск: один запрос и ни одной новой записи
+            call_command("load_images", stdout=io.StringIO())
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_load_images_matches_legacy_names_by_content(self):
+        red = self.jpeg("red")
+        self.write("flower1.jpg", red)
+        self.write("flower1_djQbv2t.jpg", red)
+        self.write("flower2.jpg", self.jpeg("blue"))
+        self.write("flower3.jpg", self.jpeg("green"))
+        Product.objects.create(name="Розы", image="products/flower1.jpg")
+        Product.objects.create(name="Ирисы", image="products/flower2.jpg")
+
+        call_command("load_images", stdout=io.StringIO())
+        created = Product.objects.get(name="flower3.jpg")
+        self.assertEqual(Product.objects.count(), 3)  # Розы и Ирисы узнаны по содержимому, не задвоены
+        self.assertRegex(created.image.name, r"^products/[0-9a-f]{64}\.jpg$")
+        self.assertEqual(self.files(), sorted(["flower1.jpg", "flower1_djQbv2t.jpg", "flower2.jpg", "flower3.jpg",
+                                               os.path.basename(created.image.name)]))
+
+    def test_dedupe_collapses_duplicates(self):
+        red = self.jpeg("red")
+        for name in ("flower1.jpg", "flower1_djQbv2t.jpg", "flower1_VaE6D0Y.jpg"):
+            self.write(name, red)
+        self.write("flower2.jpg", self.jpeg("blue"))
+        legacy = Product.objects.create(name="Розы", image="products/flower1_djQbv2t.jpg")
+        other = Product.objects.create(name="Ирисы", image="products/flower2.jpg")
+
+        output = io.StringIO()
+        call_command("dedupe_images", dry_run=True, stdout=output)
+        self.assertIn("дубликатов: 2", output.getvalue())
+        self.assertEqual(len(self.files()), 4)
+
+        output = io.StringIO()
+        call_command("dedupe_images", stdout=output)
+        self.assertIn(f"освобождено {2 * len(red) / 1024:.0f} КБ", output.getvalue())
+        legacy.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.files(), sorted(os.path.basename(product.image.name) for product in (legacy, other)))
+        self.assertRegex(legacy.image.name, r"^products/[0-9a-f]{64}\.jpg$")
+
+
+class MediaServingTests(TestCase):
+    """Раздача media/: кэширование, ETag, Range и X-Accel-Redirect"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.hashed = f"products/{'a' * 64}.jpg"
+        os.makedirs(os.path.join(media.name, "products"))
+        for name in (self.hashed, "products/flower1.jpg"):
+            with open(os.path.join(media.name, name), "wb") as image_file:
+                image_file.write(bytes(range(256)) * 4)
+        self.factory = RequestFactory()
+
+    def get(self, path, **headers):
+        response = serve_media(self.factory.get(f"/media/{path}", headers=headers), path=path)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_hashed_name_is_immutable(self):
+        response, body = self.get(self.hashed)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(body), 1024)
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+        response = self.get("products/flower1.jpg")[0]
+        self.assertEqual(response["Cache-Control"], "public, max-age=3600")
+
+    def test_etag_revalidation(self):
+        etag = self.get(self.hashed)[0]["ETag"]
+        response, body = self.get(self.hashed, If_None_Match=etag)
+        self.assertEqual((response.status_code, body), (304, b""))
+
+    def test_range(self):
+        response, body = self.get(self.hashed, Range="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, bytes(range(10, 20)))
+        self.assertEqual((response["Content-Range"], response["Content-Length"]), ("bytes 10-19/1024", "10"))
+
+        response, body = self.get(self.hashed, Range="bytes=-4")
+        self.assertEqual(body, bytes(range(252, 256)))
+
+        response = self.get(self.hashed, Range="bytes=2000-")[0]
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */1024"))
+
+        response, body = self.get(self.hashed, Range="bytes=0-1,5-6")  # Несколько диапазонов — весь файл
+        self.assertEqual((response.status_code, len(body)), (200, 1024))
+
+        response, body = self.get(self.hashed, Range="bytes=0-9", If_Range='"stale"')
+        self.assertEqual((response.status_code, len(body)), (200, 1024))
+
+    def test_missing_and_outside_files(self):
+        for path in ("products/missing.jpg", "../settings.py", "products"):
+            with self.assertRaises(Http404):
+                self.get(path)
+
+    @override_settings(MEDIA_SENDFILE="x-accel-redirect")
+    def test_accel_redirect(self):
+        response, body = self.get(self.hashed)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.hashed}")
+        self.assertEqual(body, b"")
+        self.assertIn("immutable", response["Cache-Control"])
@@ -0,0 +1,74 @@
+"""
+thumbnails.py – уменьшенные копии изображений товаров для srcset.
+
+Для каждого изображения создаются варианты шириной THUMBNAIL_WIDTHS в WebP и JPEG
+(JPEG — для браузеров без WebP) рядом с оригиналом, в каталоге thumbs/:
+products/flower1.jpg → thumbs/products/flower1_640w.webp. Больше оригинала
+копии не растягиваются — вариант такой ширины просто не создается
+(кроме самого узкого: он нужен всегда). Варианты создаются при сохранении товара
+с новым изображением (signals.py) и командой `python manage.py generate_thumbnails`.
+"""
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+THUMBNAIL_FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}),
+                     "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True})}
+THUMBNAIL_DIR = "thumbs"
+
+
+def thumbnail_name(name, width, ext):
+    """Имя файла варианта шириной `width` в формате `ext` для изображения `name`"""
+    stem, _ = os.path.splitext(name)
+    return f"{THUMBNAIL_DIR}/{stem}_{width}w.{ext}"
+
+
+def available_widths(image_width):
+    """Ширины вариантов для оригинала шириной `image_width` (None — варианты еще не созданы)"""
+    if not image_width:
+        return ()
+    widths = [width for width in THUMBNAIL_WIDTHS if width <= image_width]
+    return tuple(widths) or THUMBNAIL_WIDTHS[:1]
+
+
+def generate_thumbnails(name, storage=None, force=False):
+    """
+    Создает варианты изображения `name`; возвращает (ширина, высота оригинала, записано байт).
+
+    Уже существующие варианты пропускаются, если не передан `force`.
+    """
+    storage = storage or default_storage
+    with storage.open(name, "rb") as source:
+        image = ImageOps.exif_transpose(Image.open(source))  # Поворот по EXIF, как у камеры
+        image.load()
+    original_width, original_height = image.size
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")  # JPEG не поддерживает прозрачность и палитру
+
+    written = 0
+    for width in available_widths(original_width):
+        resized = None
+        for ext, (image_format, options) in THUMBNAIL_FORMATS.items():
+            target = thumbnail_name(name, width, ext)
+            if not force and storage.exists(target):
+                continue
+            if resized is None:
+                height = max(1, round(original_height * min(width, original_width) / original_width))
+                resized = image.resize((min(width, original_width), height), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            if storage.exists(target):
+                storage.delete(target)  # Иначе хранилище сохранит под другим именем
+            storage.save(target, ContentFile(buffer.getvalue()))
+            written += buffer.tell()
+    return original_width, original_height, written
+
+
+def srcset(name, image_width, ext):
+    """Значение srcset для вариантов в формате `ext` ("" — вариантов нет)"""
+    return ", ".join(f"{default_storage.url(thumbnail_name(name, width, ext))} {width}w"
+                     for width in available_widths(image_width))
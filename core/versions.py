@@ -0,0 +1,26 @@
+"""
+versions.py – версии данных для ключей кэша.
+
+Версия считается по самой базе, как ETag в conditional.py: время последнего изменения
+(max updated_at) и число строк таблицы. Поэтому изменения из любого процесса — бота,
+команды, другого воркера — сразу дают новую версию, а вытеснение из кэша не может
+вернуть старую. Запись, которая меняет данные через QuerySet.update(), должна
+передавать updated_at явно (см. Order.updated_at).
+"""
+import hashlib
+
+from .conditional import table_state
+from .models import Order, Product
+
+# Набор данных → QuerySet, по которому считается версия. Позиции заказа отдельно
+# не учитываются: их изменение обновляет updated_at заказа (signals.py)
+VERSION_SOURCES = {
+    "orders": lambda: Order.objects.all(),
+    "products": lambda: Product.objects.all(),
+}
+
+
+def get_version(name):
+    """Текущая версия набора данных `name` — строка для ключа кэша (два скалярных подзапроса)"""
+    state = table_state(VERSION_SOURCES[name]())
+    return hashlib.md5(repr(state).encode(), usedforsecurity=False).hexdigest()
@@ -3,16 +3,22 @@ from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Product, Order, User
+from .models import Product, Order, OrderItem, User
+from django.db import transaction
 from .forms import OrderForm, UserRegisterForm
 from core.telegram_bot import notify_admin
 from asgiref.sync import sync_to_async
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
 from .forms import UserUpdateForm  # Импорт формы обновления профиля
+from .conditional import conditional, products_state
+from .search import search_products
+from django.core.paginator import Paginator
+from django.utils.functional import SimpleLazyObject
 
 
 import asyncio
+import math
 import threading
 
 def register(request):
@@ -45,10 +51,41 @@ def index(request):
     """Главная страница"""
     return render(request, "index.html")
 
+CATALOG_PAGE_SIZE = 24  # Товаров на странице каталога
+CATALOG_CACHE_TIMEOUT = 300  # Фрагмент каталога живет ограниченное время, даже если товары не меняются
+
+
+def catalog_etag_state(request):
+    """
+    Страница каталога зависит от товаров, от того, кто вошел (шапка, кнопки покупки), от ?page=/?q=
+    и от CSRF-секрета: он попадает в форму выхода, и после нового входа старая страница дала бы 403.
+    """
+    updated, rows = request._products_state = products_state()  # Пригодится и для ключа кэша фрагмента
+    parts = ("catalog", request.user.pk, request.get_full_path(), updated, rows, request.META.get("CSRF_COOKIE"))
+    return parts, None
+
+
+@conditional(catalog_etag_state)
 def catalog(request):
-    """Отображение каталога цветов"""
-    products = Product.objects.all()
-    return render(request, 'catalog.html', {'products': products})
+    """Отображение каталога цветов: постранично (?page=) и с поиском по названию (?q=)"""
+    query = request.GET.get("q", "").strip()
+    page_number = request.GET.get("page", "1")
+    # Ключ фрагмента — состояние таблицы товаров из базы (то же, что в ETag): его меняют записи любого процесса
+    state = getattr(request, "_products_state", None) or products_state()
+    if not query:
+        # Номер страницы приводим к существующему, чтобы произвольные ?page= не плодили записи кэша
+        pages = max(1, math.ceil(state[1] / CATALOG_PAGE_SIZE))
+        try:
+            page_number = min(max(int(page_number), 1), pages)
+        except ValueError:  # "abc", "²" (isdigit() его пропускает, а int() — нет)
+            page_number = 1
+    products = search_products(Product.objects.order_by("id"), query)
+    # Страница вычисляется лениво: при попадании в кэш фрагмента товары не читаются вовсе
+    page = SimpleLazyObject(lambda: Paginator(products, CATALOG_PAGE_SIZE).get_page(page_number))
+    return render(request, 'catalog.html', {
+        'page': page, 'query': query, 'page_number': page_number,
+        'catalog_state': state, 'cache_timeout': CATALOG_CACHE_TIMEOUT,
+    })
 
 @login_required
 def cart(request):
@@ -93,20 +130,26 @@ def place_order(request):
 
         logging.debug(f"🛒 Товары в корзине: {cart}")
 
-        # ✅ Создаем заказ (без использования формы)
-        order = Order.objects.create(
-            user=request.user,
-            delivery_address=delivery_address,
-            price=sum(float(item["price"]) * item["quantity"] for item in cart.values()),
-            status="pending"
-        )
+        # ✅ Фиксируем позиции: количество из корзины, цена — актуальная цена товара на момент покупки
+        products = Product.objects.in_bulk(map(int, cart.keys()))
+        items = [
+            OrderItem(product=product, quantity=cart[str(product_id)]["quantity"], unit_price=product.price)
+            for product_id, product in products.items()
+        ]
+
+        # ✅ Создаем заказ (без использования формы) вместе с позициями одной транзакцией
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=request.user,
+                delivery_address=delivery_address,
+                price=sum(item.line_total for item in items),
+                status="pending"
+            )
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)
         logging.debug(f"✅ Заказ создан: ID {order.id}")
-
-        # ✅ Добавляем товары в заказ
-        product_ids = map(int, cart.keys())
-        products = Product.objects.filter(id__in=product_ids)
-        order.products.set(products)
-        logging.debug(f"✅ Добавлены товары: {list(products.values_list('name', flat=True))}")
+        logging.debug(f"✅ Добавлены товары: {[item.product.name for item in items]}")
 
         # ✅ Очищаем корзину после заказа
         request.session["cart"] = {}
@@ -119,7 +162,7 @@ def place_order(request):
                 f"👤 Клиент: {request.user.username} (ID: {request.user.id})\n"
                 f"📍 Адрес: {order.delivery_address}\n"
                 f"💰 Сумма: {order.price} руб.\n"
-                f"🛒 Товары: " + ", ".join(order.products.values_list("name", flat=True))
+                f"🛒 Товары: " + ", ".join(f"{item.product.name} × {item.quantity}" for item in items)
         )
 
         # ✅ Асинхронное уведомление админу в телеграм
@@ -141,13 +184,14 @@ def repeat_order(request, order_id):
     cart = request.session.get("cart", {})
     cart.clear()  # Очищаем корзину перед повтором заказа
 
-    # Добавляем товары из старого заказа
-    for product in old_order.products.all():
+    # Добавляем товары из старого заказа с прежним количеством (цена — текущая)
+    for item in old_order.items.select_related("product"):
+        product = item.product
         cart[str(product.id)] = {
             "name": product.name,
             "price": float(product.price),
-            "image": product.image.url,
-            "quantity": 1,  # Количество оставляем 1 (можно изменить на прошлое)
+            "image": product.image_small_url,
+            "quantity": item.quantity,
         }
 
     request.session["cart"] = cart
@@ -162,7 +206,7 @@ def order_history(request):
     """История заказов с отображением товаров и адреса доставки"""
     orders = Order.objects.filter(user=request.user) \
         .select_related("user") \
-        .prefetch_related("products")  # Загружаем связанные товары
+        .prefetch_related("items__product")  # Загружаем позиции заказов вместе с товарами
     return render(request, 'order_history.html', {'orders': orders})
 
 
@@ -177,7 +221,7 @@ def add_to_cart(request, product_id):
         cart[str(product_id)] = {
             "name": product.name,
             "price": float(product.price),
-            "image": product.image.url,
+            "image": product.image_small_url,
             "quantity": 1,
         }
 
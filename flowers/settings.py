@@ -86,6 +86,13 @@ SESSION_COOKIE_SECURE = False
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Раздача media/ (core/media.py): файлы без хеша в имени кэшируются на MEDIA_MAX_AGE секунд.
+# MEDIA_SENDFILE = "x-accel-redirect" (nginx, internal location MEDIA_ACCEL_PREFIX → MEDIA_ROOT)
+# или "x-sendfile" (Apache/lighttpd) — файл отдает веб-сервер; None — сам Django через FileResponse
+MEDIA_MAX_AGE = 3600
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_PREFIX = "/protected-media/"
+
 LOGIN_URL = "/accounts/login/"
 LOGOUT_REDIRECT_URL = "/accounts/login/"
 LOGIN_REDIRECT_URL = '/'
@@ -99,6 +106,26 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Транзакция сразу берет блокировку записи: бот и сайт пишут по очереди,
+            # а не падают с "database is locked" посреди транзакции
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # Тестовая база — файл, а не память: в общей памяти SQLite блокирует таблицы без ожидания,
+        # и тесты с параллельными потоками падали бы вместо того, чтобы ждать очереди
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+# Кэш в памяти процесса: отчеты, версии данных (core/versions.py) и фрагменты страниц каталога.
+# Версии тоже живут здесь, поэтому при нескольких процессах веб-сервера нужен общий бэкенд (Redis, Memcached)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'flowers',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000},  # Записи старых версий вытесняются первыми
     }
 }
 
@@ -154,12 +181,19 @@ API_URL = "http://127.0.0.1:8000/api"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'core.authentication.CachedTokenAuthentication',  # TokenAuthentication с кэшем в памяти
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
 }
 
+# Кэш токен → пользователь для API (core/authentication.py): число записей и срок жизни в секундах
+TOKEN_AUTH_CACHE_SIZE = 1024
+TOKEN_AUTH_CACHE_TTL = 60
+
+# Представления API со списками, которые сериализуются напрямую из values() (core/fast_serializers.py)
+FAST_SERIALIZER_ENDPOINTS = {"product_list", "order_list", "api_orders"}
+
 # DRF-токен для аутентификации API
 TELEGRAM_API_TOKEN = "6234bb013c4c37780c3b09d6961e0f21949beafc"   # это токен сгенерирован в Django специально для Token-аутентификации замени на свой
@@ -15,10 +15,10 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from core import views  # Импортируем views из приложения core
+from core.media import serve_media
 from django.conf import settings
-from django.conf.urls.static import static
 from django.shortcuts import redirect
 from django.views.generic import RedirectView
 
@@ -34,4 +34,8 @@ urlpatterns = [
     path("catalog/", include("core.urls")),  # Подключаем маршруты из core
     path("api/", include("core.api_urls")),  # Подключаем API
     path("reports/", include("reports.urls")),  # Подключаем маршруты из reports
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+# Загруженные файлы отдает Django: при разработке — сам, на сервере — через X-Accel-Redirect/X-Sendfile
+if settings.DEBUG or settings.MEDIA_SENDFILE:
+    urlpatterns.append(re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.+)$", serve_media, name="media"))
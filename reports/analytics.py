@@ -1,87 +1,278 @@
 # Этот файл анализирует данные из базы и генерирует отчёты
 
 import csv
-from datetime import datetime, timedelta
-from core.models import Order, Report
-from django.utils.timezone import now
+import zlib
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from core.models import DailySales, Order, OrderItem, Report
+from core.versions import get_version
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import get_current_timezone, localdate, localtime, make_aware
 
+PRODUCT_SALES_CACHE_TIMEOUT = 60 * 60  # Кэш и так сбрасывается при изменении заказов
+REPORT_PERIOD_DAYS = 30  # Отчет за дату D покрывает D − 30 … D включительно
 
-def export_sales_report_csv():
+
+def report_period(report_date, days=REPORT_PERIOD_DAYS):
+    """(начало, конец) периода отчета за дату `report_date` — одно определение для всех путей расчета"""
+    return report_date - timedelta(days=days), report_date
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: write() просто возвращает строку, ничего не накапливая"""
+
+    def write(self, value):
+        return value
+
+
+def iter_sales_report_csv(start_date, end_date, chunk_size=2000):
     """
-    Экспортирует отчёт о продажах в CSV-файл.
+    Построчно выдает CSV-отчет о заказах за период, не создавая файлов.
+
+    Заказы читаются порциями по `chunk_size` вместе с пользователем (select_related),
+    поэтому память не зависит от размера выгрузки и нет запроса на каждую строку.
     """
-    today = now().date()
-    start_date = today - timedelta(days=30)  # Заказы за последние 30 дней
-    filename = f"sales_report_{today}.csv"
+    writer = csv.writer(_Echo())
+    yield writer.writerow(["Дата", "ID заказа", "Клиент", "Сумма", "Статус"])
 
-    with open(filename, "w", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file)
-        writer.writerow(["Дата", "ID заказа", "Клиент", "Сумма", "Статус"])
+    orders = (orders_in_period(start_date, end_date)
+              .select_related("user")
+              .only("id", "order_date", "price", "status", "user__username")
+              .order_by("order_date", "id"))
 
-        # Фильтруем заказы за последние 30 дней
-        orders = Order.objects.filter(order_date__date__gte=start_date, order_date__date__lte=today)
+    for order in orders.iterator(chunk_size=chunk_size):
+        yield writer.writerow([
+            localtime(order.order_date).strftime("%Y-%m-%d"),
+            order.id,
+            order.user.username if order.user else "Неизвестный клиент",
+            order.price,
+            order.get_status_display()
+        ])
 
-        for order in orders:
-            writer.writerow([
-                order.order_date.strftime("%Y-%m-%d"),
-                order.id,
-                order.user.username if order.user else "Неизвестный клиент",
-                order.price,
-                order.get_status_display()
-            ])
 
-    return filename
+def gzip_stream(chunks, buffer_size=64 * 1024):
+    """Сжимает поток строк в gzip на лету, отдавая блоки примерно по `buffer_size` байт"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)  # 16 + MAX_WBITS — формат gzip
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            yield compressor.compress(b"".join(buffer))
+            buffer, size = [], 0
+    yield compressor.compress(b"".join(buffer)) + compressor.flush()
 
 
-def generate_sales_report(start_date: datetime, end_date: datetime, report_date=None):
+def parse_period(params, default_days=30):
     """
-    Генерирует и сохраняет отчёт о продажах с разбивкой по статусам за указанный период времени.
+    Читает период из параметров запроса `start`/`end` (ГГГГ-ММ-ДД).
 
-    :param start_date: Начало периода (datetime)
-    :param end_date: Конец периода (datetime)
-    :param report_date: Дата отчёта (если не указана, используется end_date)
+    По умолчанию — последние `default_days` дней по сегодняшний день.
+    Бросает ValueError при неверном формате или если начало позже конца.
     """
+    end_date = date.fromisoformat(params["end"]) if params.get("end") else localdate()
+    start_date = (date.fromisoformat(params["start"]) if params.get("start")
+                  else end_date - timedelta(days=default_days))
+    if start_date > end_date:
+        raise ValueError("Начало периода позже его конца")
+    return start_date, end_date
 
-    # Фильтруем заказы за указанный период
-    orders = Order.objects.filter(order_date__date__gte=start_date, order_date__date__lte=end_date)
-    print(f"Заказы за период с {start_date} по {end_date}: {orders.count()} шт.")
 
-    if not orders.exists():
-        print("⚠️ Нет заказов для формирования отчета.")
-        return None  # Если заказов нет, возвращаем None
+def period_bounds(start_date, end_date):
+    """
+    Переводит период из дат в полуинтервал [начало, конец) по времени заказа.
+
+    Сравнение `order_date` с границами (а не `order_date__date`) не требует
+    приведения каждой строки к дате и позволяет использовать индекс.
+    """
+    if isinstance(start_date, datetime):
+        start_date = start_date.date()
+    if isinstance(end_date, datetime):
+        end_date = end_date.date()
+    tz = get_current_timezone()
+    start = make_aware(datetime.combine(start_date, time.min), tz)
+    end = make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def orders_in_period(start_date, end_date):
+    """Заказы, оформленные в указанный период (включительно по обеим датам)"""
+    start, end = period_bounds(start_date, end_date)
+    return Order.objects.filter(order_date__gte=start, order_date__lt=end)
+
+
+def aggregate_orders_by_status(orders):
+    """
+    Считает количество и выручку заказов по статусам одним запросом GROUP BY status.
+
+    Возвращает словарь {статус: {"count": ..., "revenue": ...}} со всеми статусами
+    из Order.STATUS_CHOICES (для отсутствующих статусов — нули).
+    """
+    status_counts = {status[0]: {"count": 0, "revenue": Decimal("0")} for status in Order.STATUS_CHOICES}
+
+    rows = (orders.order_by()
+            .values("status")
+            .annotate(count=Count("id"), revenue=Sum("price")))
+    for row in rows:
+        bucket = status_counts.setdefault(row["status"], {"count": 0, "revenue": Decimal("0")})
+        bucket["count"] = row["count"]
+        bucket["revenue"] = row["revenue"] or Decimal("0")
+
+    return status_counts
+
+
+def aggregate_daily_sales_by_status(start_date, end_date):
+    """
+    То же, что aggregate_orders_by_status, но по суточной сводке DailySales:
+    суммируется не больше (дней × статусов) строк, независимо от числа заказов.
+    """
+    if isinstance(start_date, datetime):
+        start_date = start_date.date()
+    if isinstance(end_date, datetime):
+        end_date = end_date.date()
+
+    status_counts = {status[0]: {"count": 0, "revenue": Decimal("0")} for status in Order.STATUS_CHOICES}
+    rows = (DailySales.objects.filter(date__gte=start_date, date__lte=end_date)
+            .values("status")
+            .annotate(count=Sum("orders"), revenue=Sum("revenue")))
+    for row in rows:
+        bucket = status_counts.setdefault(row["status"], {"count": 0, "revenue": Decimal("0")})
+        bucket["count"] = row["count"] or 0
+        bucket["revenue"] = row["revenue"] or Decimal("0")
 
-    # Группируем заказы по статусам
-    status_counts = {status[0]: {"count": 0, "revenue": 0} for status in Order.STATUS_CHOICES}
+    return status_counts
 
-    for order in orders:
-        status_counts[order.status]["count"] += 1
-        status_counts[order.status]["revenue"] += order.price  # Используем `order.price`
 
-    # Создаём отчет и сохраняем в базу данных
-    report = Report.objects.create(
-        date=report_date if report_date else end_date,  # Используем report_date, если он передан
-        total_orders=orders.count(),
-        total_revenue=sum(order.price for order in orders),
+def daily_sales_from_orders(orders=None):
+    """Считает суточную сводку напрямую по заказам: {(день, статус): (заказы, выручка)}"""
+    orders = Order.objects.all() if orders is None else orders
+    rows = (orders.order_by()
+            .annotate(day=TruncDate("order_date"))
+            .values("day", "status")
+            .annotate(count=Count("id"), revenue=Sum("price")))
+    return {(row["day"], row["status"]): (row["count"], row["revenue"] or Decimal("0")) for row in rows}
 
-        pending_orders=status_counts["pending"]["count"],
-        pending_revenue=status_counts["pending"]["revenue"],
 
-        processing_orders=status_counts["processing"]["count"],
-        processing_revenue=status_counts["processing"]["revenue"],
+def verify_daily_sales():
+    """
+    Сравнивает сводку DailySales с заказами.
+
+    Возвращает список расхождений [(день, статус, (заказы, выручка) в сводке, (заказы, выручка) по заказам)].
+    """
+    expected = daily_sales_from_orders()
+    actual = {(row.date, row.status): (row.orders, row.revenue) for row in DailySales.objects.all()}
+    empty = (0, Decimal("0"))
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        if actual.get(key, empty) != expected.get(key, empty):
+            mismatches.append((*key, actual.get(key, empty), expected.get(key, empty)))
+    return mismatches
+
+
+def rebuild_daily_sales():
+    """Полностью пересчитывает сводку DailySales по заказам; возвращает число строк сводки"""
+    rows = [
+        DailySales(date=day, status=status, orders=count, revenue=revenue)
+        for (day, status), (count, revenue) in daily_sales_from_orders().items()
+    ]
+    with transaction.atomic():
+        DailySales.objects.all().delete()
+        DailySales.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def product_sales(start_date, end_date, statuses=None):
+    """
+    Продажи по товарам за период: штуки, выручка, число заказов и доля в выручке.
+
+    Считается одним GROUP BY по позициям заказов (OrderItem) с количеством и ценой
+    на момент покупки. Результат кэшируется по (период, статусы) до следующего
+    изменения заказов.
+
+    :param statuses: статусы заказов, которые учитываются (по умолчанию — все)
+    """
+    statuses = sorted(set(statuses)) if statuses else []
+    key = (f"product_sales:{get_version('orders')}:{get_version('products')}:"
+           f"{start_date}:{end_date}:{','.join(statuses)}")
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Заказы периода выбираются подзапросом по индексу order_date, а позиции —
+    # по уникальному индексу (order_id, product_id); JOIN заставил бы SQLite сканировать все позиции
+    orders = orders_in_period(start_date, end_date)
+    if statuses:
+        orders = orders.filter(status__in=statuses)
+    items = OrderItem.objects.filter(order_id__in=orders.order_by().values("id"))
+
+    rows = list(items.order_by()
+                .values("product_id", "product__name")
+                .annotate(units=Sum("quantity"), orders=Count("order_id"),
+                          revenue=Sum(F("quantity") * F("unit_price"), output_field=DecimalField())))
+    total_revenue = sum((row["revenue"] or Decimal("0") for row in rows), Decimal("0"))
+
+    result = sorted((
+        {
+            "product_id": row["product_id"],
+            "name": row["product__name"],
+            "units": row["units"],
+            "orders": row["orders"],
+            "revenue": row["revenue"] or Decimal("0"),
+            "share": float((row["revenue"] or 0) / total_revenue * 100) if total_revenue else 0.0,
+        }
+        for row in rows
+    ), key=lambda row: (-row["revenue"], row["product_id"]))
+
+    cache.set(key, result, PRODUCT_SALES_CACHE_TIMEOUT)
+    return result
 
-        delivering_orders=status_counts["delivering"]["count"],
-        delivering_revenue=status_counts["delivering"]["revenue"],
 
-        completed_orders=status_counts["completed"]["count"],
-        completed_revenue=status_counts["completed"]["revenue"],
+def report_fields(status_counts):
+    """Переводит разбивку {статус: {"count", "revenue"}} в значения полей модели Report"""
+    fields = {
+        "total_orders": sum(bucket["count"] for bucket in status_counts.values()),
+        "total_revenue": sum((bucket["revenue"] for bucket in status_counts.values()), Decimal("0")),
+    }
+    for status, _ in Order.STATUS_CHOICES:
+        fields[f"{status}_orders"] = status_counts[status]["count"]
+        fields[f"{status}_revenue"] = status_counts[status]["revenue"]
+    return fields
 
-        canceled_orders=status_counts["canceled"]["count"],
-        canceled_revenue=status_counts["canceled"]["revenue"],
-    )
 
+def save_report(report_date, status_counts):
+    """Создает или перезаписывает отчет за дату `report_date` (по одному отчету на дату)"""
+    report, _ = Report.objects.update_or_create(date=report_date, defaults=report_fields(status_counts))
     return report
 
 
+def generate_sales_report(start_date: datetime, end_date: datetime, report_date=None):
+    """
+    Генерирует и сохраняет отчёт о продажах с разбивкой по статусам за указанный период времени.
+
+    :param start_date: Начало периода (datetime)
+    :param end_date: Конец периода (datetime)
+    :param report_date: Дата отчёта (если не указана, используется end_date)
+    """
+
+    # Суммируем суточную сводку по статусам — из базы приходит не больше пяти строк
+    status_counts = aggregate_daily_sales_by_status(start_date, end_date)
+    total_orders = sum(bucket["count"] for bucket in status_counts.values())
+    print(f"Заказы за период с {start_date} по {end_date}: {total_orders} шт.")
+
+    if not total_orders:
+        print("⚠️ Нет заказов для формирования отчета.")
+        return None  # Если заказов нет, возвращаем None
+
+    # Сохраняем отчет в базу данных; повторный расчет за ту же дату перезаписывает его
+    return save_report(report_date if report_date else end_date, status_counts)
+
+
 # Пример использования функции
 if __name__ == "__main__":
     # Отчёт за последний день
@@ -0,0 +1,268 @@
+# Колоночная аналитика по заказам на NumPy.
+# Факты заказов загружаются порциями через values_list в компактные массивы,
+# после чего группировки считаются векторно (bincount/unique), без циклов по объектам ORM.
+
+from datetime import datetime, timedelta
+from itertools import islice
+
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.utils.timezone import get_current_timezone
+
+from core.models import Order, OrderItem, User
+from .analytics import orders_in_period
+
+STATUS_CODES = {status: code for code, (status, _) in enumerate(Order.STATUS_CHOICES)}
+
+
+def _chunks(iterable, size):
+    """Режет итератор на списки длиной не больше `size`"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class OrderFacts:
+    """
+    Факты заказов в виде параллельных массивов NumPy.
+
+    order_id (int64), day (datetime64[D], локальная дата заказа), status (int8, индекс в
+    Order.STATUS_CHOICES), price (float64), user_id (int64). Позиции заказов хранятся тройками
+    item_order (индекс заказа в массивах выше, int64), item_product (id товара, int64)
+    и item_quantity (количество, int64).
+    """
+
+    def __init__(self, order_id, day, status, price, user_id, item_order=None, item_product=None,
+                 item_quantity=None):
+        self.order_id = order_id
+        self.day = day
+        self.status = status
+        self.price = price
+        self.user_id = user_id
+        self.item_order = np.empty(0, dtype=np.int64) if item_order is None else item_order
+        self.item_product = np.empty(0, dtype=np.int64) if item_product is None else item_product
+        self.item_quantity = np.ones(len(self.item_product), dtype=np.int64) if item_quantity is None else item_quantity
+
+    def __len__(self):
+        return len(self.order_id)
+
+    def filter(self, mask):
+        """Новый набор фактов только с заказами, где mask истинна"""
+        positions = np.flatnonzero(mask)
+        remap = np.full(len(self), -1, dtype=np.int64)
+        remap[positions] = np.arange(len(positions))
+        keep_items = remap[self.item_order] >= 0
+        return OrderFacts(self.order_id[positions], self.day[positions], self.status[positions],
+                          self.price[positions], self.user_id[positions],
+                          remap[self.item_order[keep_items]], self.item_product[keep_items],
+                          self.item_quantity[keep_items])
+
+    def between(self, start_date, end_date):
+        """Заказы с локальной датой в [start_date, end_date]"""
+        start, end = np.datetime64(start_date, "D"), np.datetime64(end_date, "D")
+        return self.filter((self.day >= start) & (self.day <= end))
+
+    def revenue_by_period(self, period="day", start_date=None, end_date=None):
+        """
+        Выручка и число заказов по дням/неделям/месяцам.
+
+        Если заданы границы, ряд непрерывный (пустые периоды — нули), иначе — только встреченные периоды.
+        Возвращает (начала периодов datetime64[D], выручка float64, заказы int64).
+        """
+        keys = period_start(self.day, period)
+        if start_date is not None and end_date is not None:
+            periods = period_range(start_date, end_date, period)
+            index = np.searchsorted(periods, keys)
+            inside = (index < len(periods)) & (periods[np.minimum(index, len(periods) - 1)] == keys)
+            index, price = index[inside], self.price[inside]
+        else:
+            periods, index = np.unique(keys, return_inverse=True)
+            price = self.price
+
+        revenue = np.bincount(index, weights=price, minlength=len(periods))
+        counts = np.bincount(index, minlength=len(periods))
+        return periods, revenue, counts
+
+    def by_status(self):
+        """{статус: (заказы, выручка)} для всех статусов Order.STATUS_CHOICES"""
+        size = len(STATUS_CODES)
+        counts = np.bincount(self.status, minlength=size)
+        revenue = np.bincount(self.status, weights=self.price, minlength=size)
+        return {status: (int(counts[code]), float(revenue[code])) for status, code in STATUS_CODES.items()}
+
+    def by_customer(self, top=None):
+        """
+        Выручка и число заказов по покупателям, по убыванию выручки.
+
+        Возвращает (user_id, выручка, заказы); `top` ограничивает число строк.
+        """
+        users, index = np.unique(self.user_id, return_inverse=True)
+        revenue = np.bincount(index, weights=self.price, minlength=len(users))
+        counts = np.bincount(index, minlength=len(users))
+        order = np.argsort(-revenue, kind="stable")[:top]
+        return users[order], revenue[order], counts[order]
+
+    def by_product(self):
+        """Продажи товаров: (product_id, число заказов, штук)"""
+        products, index, orders = np.unique(self.item_product, return_inverse=True, return_counts=True)
+        units = np.bincount(index, weights=self.item_quantity, minlength=len(products)).astype(np.int64)
+        return products, orders, units
+
+
+def local_days(timestamps):
+    """
+    Переводит Unix-время (секунды) в локальные даты datetime64[D] текущего часового пояса.
+
+    Смещение пояса вычисляется один раз на каждый встреченный час, а не на каждую строку.
+    """
+    seconds = np.floor(np.asarray(timestamps, dtype=np.float64)).astype(np.int64)
+    hours, index = np.unique(seconds // 3600, return_inverse=True)
+    tz = get_current_timezone()
+    offsets = np.fromiter(
+        (datetime.fromtimestamp(hour * 3600, tz).utcoffset().total_seconds() for hour in hours.tolist()),
+        dtype=np.int64, count=len(hours),
+    )
+    return ((seconds + offsets[index]) // 86400).astype("datetime64[D]")
+
+
+def period_start(days, period="day"):
+    """Начало дня/недели (с понедельника)/месяца для массива дат datetime64[D]"""
+    days = np.asarray(days, dtype="datetime64[D]")
+    if period == "day":
+        return days
+    if period == "week":
+        numbers = days.astype(np.int64)
+        # 1970-01-01 — четверг: (n + 3) % 7 дает номер дня недели, где понедельник = 0
+        return (numbers - (numbers + 3) % 7).astype("datetime64[D]")
+    if period == "month":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    raise ValueError(f"Неизвестный период: {period}")
+
+
+def period_range(start_date, end_date, period="day"):
+    """Непрерывный ряд начал периодов, покрывающий [start_date, end_date]"""
+    first, last = period_start([start_date, end_date], period)
+    if period == "month":
+        months = np.arange(first.astype("datetime64[M]"), last.astype("datetime64[M]") + 1)
+        return months.astype("datetime64[D]")
+    return np.arange(first, last + 1, 7 if period == "week" else 1, dtype="datetime64[D]")
+
+
+def moving_average(values, window):
+    """Скользящее среднее; первые window - 1 значений — NaN"""
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if window <= 0 or len(values) < window:
+        return result
+    cumsum = np.cumsum(np.insert(values, 0, 0.0))
+    result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
+
+
+def period_over_period(values, lag=1):
+    """
+    Изменение относительно значения `lag` периодов назад.
+
+    Возвращает (абсолютная разница, относительная разница в %); где сравнивать не с чем — NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    delta = np.full(values.shape, np.nan)
+    percent = np.full(values.shape, np.nan)
+    if lag < len(values):
+        previous = values[:-lag]
+        delta[lag:] = values[lag:] - previous
+        with np.errstate(divide="ignore", invalid="ignore"):
+            percent[lag:] = np.where(previous != 0, delta[lag:] / previous * 100, np.nan)
+    return delta, percent
+
+
+def load_order_facts(orders=None, chunk_size=20000, with_products=True):
+    """
+    Загружает факты заказов в OrderFacts порциями по `chunk_size` строк.
+
+    :param orders: QuerySet заказов (по умолчанию — все заказы)
+    :param with_products: загрузить ли позиции заказов (OrderItem)
+    """
+    orders = Order.objects.all() if orders is None else orders
+    # Цена приводится к float в SQL, а дата переводится в локальную уже в NumPy:
+    # так не вызываются построчные конвертеры Django (Decimal, TruncDate)
+    rows = (orders.order_by("id")
+            .annotate(price_value=Cast("price", FloatField()))
+            .values_list("id", "order_date", "status", "price_value", "user_id"))
+
+    parts = {name: [] for name in ("order_id", "day", "status", "price", "user_id")}
+    for chunk in _chunks(rows.iterator(chunk_size=chunk_size), chunk_size):
+        order_id, order_date, status, price, user_id = zip(*chunk)
+        parts["order_id"].append(np.fromiter(order_id, dtype=np.int64, count=len(chunk)))
+        parts["day"].append(local_days(np.fromiter((d.timestamp() for d in order_date),
+                                                   dtype=np.float64, count=len(chunk))))
+        parts["status"].append(np.fromiter((STATUS_CODES[s] for s in status), dtype=np.int8, count=len(chunk)))
+        parts["price"].append(np.fromiter(price, dtype=np.float64, count=len(chunk)))
+        parts["user_id"].append(np.fromiter(user_id, dtype=np.int64, count=len(chunk)))
+
+    if not parts["order_id"]:
+        empty = {"order_id": np.int64, "day": "datetime64[D]", "status": np.int8, "price": np.float64,
+                 "user_id": np.int64}
+        return OrderFacts(**{name: np.empty(0, dtype=dtype) for name, dtype in empty.items()})
+
+    facts = OrderFacts(**{name: np.concatenate(arrays) for name, arrays in parts.items()})
+
+    if with_products:
+        items = OrderItem.objects.filter(order__in=orders.order_by().values("id"))
+        item_order, item_product, item_quantity = [], [], []
+        rows = items.values_list("order_id", "product_id", "quantity").iterator(chunk_size=chunk_size)
+        for chunk in _chunks(rows, chunk_size):
+            order_ids, product_ids, quantities = zip(*chunk)
+            item_order.append(np.fromiter(order_ids, dtype=np.int64, count=len(chunk)))
+            item_product.append(np.fromiter(product_ids, dtype=np.int64, count=len(chunk)))
+            item_quantity.append(np.fromiter(quantities, dtype=np.int64, count=len(chunk)))
+        if item_order:
+            # order_id отсортированы (order_by("id")), поэтому индекс заказа находится бинарным поиском
+            facts.item_order = np.searchsorted(facts.order_id, np.concatenate(item_order))
+            facts.item_product = np.concatenate(item_product)
+            facts.item_quantity = np.concatenate(item_quantity)
+
+    return facts
+
+
+def sales_summary(start_date, end_date, top_customers=5, moving_window=7):
+    """
+    Сводка для админки и бота за период [start_date, end_date] и сравнение с предыдущим периодом той же длины.
+
+    Возвращает словарь: выручка и заказы по дням со скользящим средним, по статусам,
+    лучшие покупатели, изменение выручки и числа заказов к предыдущему периоду.
+    """
+    length = (end_date - start_date).days + 1
+    previous_start = start_date - timedelta(days=length)
+    facts = load_order_facts(orders_in_period(previous_start, end_date), with_products=False)
+    current = facts.between(start_date, end_date)
+    previous = facts.between(previous_start, start_date - timedelta(days=1))
+
+    days, revenue, counts = current.revenue_by_period("day", start_date, end_date)
+    average = moving_average(revenue, moving_window)
+    totals = np.array([[previous.price.sum(), len(previous)], [current.price.sum(), len(current)]])
+    delta, percent = period_over_period(totals)
+
+    users, user_revenue, user_counts = current.by_customer(top=top_customers)
+    names = dict(User.objects.filter(id__in=users.tolist()).values_list("id", "username"))
+
+    return {
+        "revenue": float(totals[1, 0]),
+        "orders": int(totals[1, 1]),
+        "previous_revenue": float(totals[0, 0]),
+        "previous_orders": int(totals[0, 1]),
+        "revenue_delta": float(delta[1, 0]),
+        "revenue_delta_percent": None if np.isnan(percent[1, 0]) else float(percent[1, 0]),
+        "orders_delta": int(delta[1, 1]),
+        "by_status": current.by_status(),
+        "daily": [
+            {"date": day.item(), "revenue": float(r), "orders": int(c),
+             "moving_average": None if np.isnan(a) else float(a)}
+            for day, r, c, a in zip(days, revenue, counts, average)
+        ],
+        "top_customers": [
+            {"user_id": int(u), "username": names.get(int(u), str(u)), "revenue": float(r), "orders": int(c)}
+            for u, r, c in zip(users, user_revenue, user_counts)
+        ],
+    }
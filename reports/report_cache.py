@@ -0,0 +1,93 @@
+# Кэш готовых отчетов о продажах с однократной генерацией (single-flight).
+# Ключ — (начало периода, конец периода, дата отчета) и версия данных периода.
+# Одновременные запросы одного отчета ждут одно вычисление, а не генерируют его каждый сам.
+
+import threading
+from concurrent.futures import Future
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from core.models import DailySales
+from .analytics import generate_sales_report
+
+REPORT_CACHE_TIMEOUT = 60 * 60 * 24  # Устаревшие версии просто перестают читаться
+GENERATION_TIMEOUT = 120  # Сколько секунд ждать отчет, который генерирует другой поток
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "waits": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def window_version(start_date, end_date):
+    """
+    Версия данных за период: время последнего изменения суточной сводки и число её строк.
+
+    Сводку обновляют сигналы заказов, поэтому любое изменение заказа из периода меняет
+    версию — в том числе сделанное другим процессом (ботом, другим воркером).
+    """
+    stats = (DailySales.objects.filter(date__gte=start_date, date__lte=end_date)
+             .aggregate(updated=Max("updated_at"), rows=Count("id")))
+    updated = stats["updated"].timestamp() if stats["updated"] else 0
+    return f"{updated}-{stats['rows']}"
+
+
+def get_sales_report(start_date, end_date, report_date=None):
+    """
+    Возвращает отчет за период из кэша или генерирует его ровно один раз.
+
+    Если отчет уже генерируется другим потоком, вызов ждет его результата.
+    Возвращает None, если за период нет заказов (как generate_sales_report).
+    """
+    key = f"sales_report:{start_date}:{end_date}:{report_date}:{window_version(start_date, end_date)}"
+
+    cached = cache.get(key)
+    if cached is not None:
+        _count("hits")
+        return cached[0]  # В кэше лежит кортеж, чтобы отличать «нет отчета» от промаха
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+
+    if not leader:
+        _count("waits")
+        return future.result(timeout=GENERATION_TIMEOUT)
+
+    try:
+        # Пока мы ждали блокировку, предыдущий лидер мог успеть положить отчет в кэш
+        cached = cache.get(key)
+        if cached is not None:
+            _count("hits")
+            future.set_result(cached[0])
+            return cached[0]
+
+        _count("misses")
+        report = generate_sales_report(start_date, end_date, report_date=report_date)
+        cache.set(key, (report,), REPORT_CACHE_TIMEOUT)
+        future.set_result(report)
+        return report
+    except Exception as error:
+        future.set_exception(error)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def report_cache_stats():
+    """Счетчики кэша отчетов в текущем процессе: попадания, промахи, ожидания и доля попаданий"""
+    with _stats_lock:
+        stats = dict(_stats)
+    requests = stats["hits"] + stats["misses"] + stats["waits"]
+    # Ожидание чужой генерации тоже обслуживается без повторного вычисления
+    stats["hit_ratio"] = (stats["hits"] + stats["waits"]) / requests if requests else 0.0
+    return stats
@@ -2,9 +2,11 @@
 
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import HttpResponse
-from .analytics import generate_sales_report, export_sales_report_csv
-from core.models import Report
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from .analytics import gzip_stream, iter_sales_report_csv, parse_period, product_sales, report_period
+from .columnar import sales_summary
+from .report_cache import get_sales_report, report_cache_stats
+from core.models import Order, Report
 from datetime import datetime, timedelta
 from django.utils import timezone
 
@@ -12,28 +14,49 @@ from django.utils import timezone
 def sales_report_view(request):
     """Страница отчётов о продажах для администратора."""
     today = datetime.now().date() - timedelta(days=1)  # Используем timezone для корректной работы с временем
-    yesterday = today - timedelta(days=30)
+    yesterday, today = report_period(today)
 
-    report = Report.objects.order_by("-date").first()
-
-    # Если отчёта нет за вчера, создаём новый
-    if not report or report.date < yesterday:
-        report = generate_sales_report(yesterday, today)
+    # Отчет берется из кэша; одновременные запросы ждут одну генерацию
+    report = get_sales_report(yesterday, today)
+    if report is None:  # Заказов за период нет — показываем пустой отчет
+        report = Report(date=today)
 
     # Добавляем информацию о периоде отчёта и времени формирования
     report.period = f"с {yesterday.strftime('%d.%m.%Y')} по {today.strftime('%d.%m.%Y')}"
     report.generated_at = timezone.now().strftime("%d.%m.%Y %H:%M:%S")
 
-    return render(request, "reports/sales_report.html", {"report": report})
+    # Динамика по дням, сравнение с предыдущим периодом и лучшие покупатели (NumPy)
+    summary = sales_summary(yesterday, today)
+
+    # Продажи по товарам (можно сузить по статусам: ?status=completed&status=delivering)
+    statuses = [s for s in request.GET.getlist("status") if s in dict(Order.STATUS_CHOICES)]
+    products = product_sales(yesterday, today, statuses)
+
+    return render(request, "reports/sales_report.html", {"report": report, "summary": summary,
+                                                         "products": products,
+                                                         "cache_stats": report_cache_stats()})
 
 
 @staff_member_required
 def download_sales_report(request):
     """
     Скачать отчёт в формате CSV.
+
+    Параметры запроса: `start` и `end` (ГГГГ-ММ-ДД, по умолчанию — последние 30 дней),
+    `gzip=1` — отдать файл, сжатый gzip. Файл формируется потоком и на диск не пишется.
     """
-    filename = export_sales_report_csv()
-    with open(filename, "r", encoding="utf-8") as file:
-        response = HttpResponse(file, content_type="text/csv")
-        response["Content-Disposition"] = f"attachment; filename={filename}"
-        return response
+    try:
+        start_date, end_date = parse_period(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest("Даты указываются в формате ГГГГ-ММ-ДД, начало — не позже конца")
+
+    filename = f"sales_report_{start_date}_{end_date}.csv"
+    rows = iter_sales_report_csv(start_date, end_date)
+
+    if request.GET.get("gzip") in ("1", "true", "yes"):
+        response = StreamingHttpResponse(gzip_stream(rows), content_type="application/gzip")
+        filename += ".gz"
+    else:
+        response = StreamingHttpResponse(rows, content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f"attachment; filename={filename}"
+    return response